@@ -6,7 +6,6 @@ import base64
 import datetime
 import html
 import json
-import numpy as np
 import os
 import pytz
 import random
@@ -21,7 +20,7 @@ from flask import Flask, Response, render_template, request
 from flask_socketio import SocketIO, join_room
 from azure.identity import DefaultAzureCredential
 from openai import AzureOpenAI
-from vad_iterator import VADIterator, int2float
+from vad_iterator import BatchedVAD, FrameAssembler
 
 # Create the Flask app
 app = Flask(__name__, template_folder='.')
@@ -59,11 +58,17 @@ sentence_level_punctuations = [ '.', '?', '!', ':', ';', '。', '？', '！', '
 enable_quick_reply = False # Enable quick reply for certain chat models which take longer time to respond
 quick_replies = [ 'Let me take a look.', 'Let me check.', 'One moment, please.' ] # Quick reply reponses
 oyd_doc_regex = re.compile(r'\[doc(\d+)\]') # Regex to match the OYD (on-your-data) document reference
+ice_token_ttl = 60 * 60 # Seconds an ICE token is used for
+ice_token_refresh_margin = 5 * 60 # Seconds before the ICE token expires at which it is refreshed in the background
 
 # Global variables
 client_contexts = {} # Client contexts
 speech_token = None # Speech token
 ice_token = None # ICE token
+ice_token_expiry = 0 # The time the ICE token expires, in time.monotonic() seconds
+ice_token_lock = threading.Lock() # Lock to fetch one ICE token at a time
+ice_token_hits = 0 # Requests served from the cached ICE token
+ice_token_misses = 0 # Requests which had to wait for a new ICE token
 if azure_openai_endpoint and azure_openai_api_key:
     azure_openai = AzureOpenAI(
         azure_endpoint=azure_openai_endpoint,
@@ -71,10 +76,10 @@ if azure_openai_endpoint and azure_openai_api_key:
         api_key=azure_openai_api_key)
 
 # VAD
-vad_iterator = None
+vad_model = None
+vad_worker = None # Batched VAD inference for all clients, started with the other background threads
 if enable_vad and enable_websockets:
     vad_model, _ = torch.hub.load(repo_or_dir='snakers4/silero-vad', model='silero_vad')
-    vad_iterator = VADIterator(model=vad_model, threshold=0.5, sampling_rate=16000, min_silence_duration_ms=150, speech_pad_ms=100)
 
 # The default route, which shows the default web page (basic.html)
 @app.route("/")
@@ -112,7 +117,7 @@ def getIceToken() -> Response:
             'Password': ice_server_password
         })
         return Response(custom_ice_token, status=200)
-    return Response(ice_token, status=200)
+    return Response(getCachedIceToken(), status=200)
 
 # The API route to connect the TTS avatar
 @app.route("/api/connectAvatar", methods=["POST"])
@@ -157,7 +162,7 @@ def connectAvatar() -> Response:
         client_context['speech_synthesizer'] = speechsdk.SpeechSynthesizer(speech_config=speech_config, audio_config=None)
         speech_synthesizer = client_context['speech_synthesizer']
         
-        ice_token_obj = json.loads(ice_token)
+        ice_token_obj = json.loads(getCachedIceToken())
         # Apply customized ICE server if provided
         if ice_server_url and ice_server_username and ice_server_password:
             ice_token_obj = {
@@ -308,7 +313,7 @@ def connectSTT() -> Response:
         speech_recognizer.recognized.connect(stt_recognized_cb)
 
         def stt_recognizing_cb(evt):
-            if not vad_iterator:
+            if not vad_worker:
                 stopSpeakingInternal(client_id)
         speech_recognizer.recognizing.connect(stt_recognizing_cb)
 
@@ -397,6 +402,8 @@ def releaseClient() -> Response:
         disconnectSttInternal(client_id)
         time.sleep(2) # Wait some time for the connection to close
         client_contexts.pop(client_id)
+        if vad_worker:
+            vad_worker.close(client_id)
         print(f"Client context released for client {client_id}.")
         return Response('Client context released.', status=200)
     except Exception as e:
@@ -418,21 +425,16 @@ def handleWsMessage(message):
     if path == 'api.audio':
         chat_initiated = client_context['chat_initiated']
         audio_chunk = message.get('audioChunk')
-        audio_chunk_binary = base64.b64decode(audio_chunk)
+        # PCM arrives as a binary attachment, or as base64 text from clients without binary support
+        audio_chunk_binary = audio_chunk if isinstance(audio_chunk, bytes) else base64.b64decode(audio_chunk)
         audio_input_stream = client_context['audio_input_stream']
         if audio_input_stream:
             audio_input_stream.write(audio_chunk_binary)
-        if vad_iterator:
-            audio_buffer = client_context['vad_audio_buffer']
-            audio_buffer.extend(audio_chunk_binary)
-            if len(audio_buffer) >= 1024:
-                audio_chunk_int = np.frombuffer(bytes(audio_buffer[:1024]), dtype=np.int16)
-                audio_buffer.clear()
-                audio_chunk_float = int2float(audio_chunk_int)
-                vad_detected = vad_iterator(torch.from_numpy(audio_chunk_float))
-                if vad_detected:
-                    print("Voice activity detected.")
-                    stopSpeakingInternal(client_id)
+        if vad_worker:
+            # Every complete 512 sample frame of the message goes to the VAD, the rest waits for the next message
+            # Inference runs on the VAD worker, batched with the frames of the other clients
+            for frame in client_context['vad_frame_assembler'].frames(audio_chunk_binary):
+                vad_worker.add_frame(client_id, frame)
     elif path == 'api.chat':
         chat_initiated = client_context['chat_initiated']
         if not chat_initiated:
@@ -449,7 +451,7 @@ def initializeClient() -> uuid.UUID:
     client_id = uuid.uuid4()
     client_contexts[client_id] = {
         'audio_input_stream': None, # Audio input stream for speech recognition
-        'vad_audio_buffer': [], # Audio input buffer for VAD
+        'vad_frame_assembler': FrameAssembler(512), # Assembles the audio input into 512 sample frames for VAD
         'speech_recognizer': None, # Speech recognizer for user speech
         'azure_openai_deployment_name': azure_openai_deployment_name, # Azure OpenAI deployment name
         'cognitive_search_index_name': cognitive_search_index_name, # Cognitive search index name
@@ -470,9 +472,38 @@ def initializeClient() -> uuid.UUID:
     }
     return client_id
 
+# Get the cached ICE token, fetching a new one if it expired. Concurrent requests share one fetch
+def getCachedIceToken() -> str:
+    global ice_token_hits
+    global ice_token_misses
+    if ice_token and time.monotonic() < ice_token_expiry:
+        ice_token_hits += 1
+        return ice_token
+    with ice_token_lock:
+        if ice_token and time.monotonic() < ice_token_expiry:
+            # Fetched by another request while this one waited
+            ice_token_hits += 1
+            return ice_token
+        ice_token_misses += 1
+        refreshIceToken()
+        return ice_token
+
+# Refresh the ICE token before it expires, so no request waits for it
+def refreshIceTokenPeriodically() -> None:
+    while True:
+        time.sleep(max(ice_token_expiry - ice_token_refresh_margin - time.monotonic(), 1))
+        try:
+            with ice_token_lock:
+                refreshIceToken()
+        except Exception as e:
+            print(f"ICE token refresh failed. Error message: {e}")
+            # Retry later, requests fetch the token themselves once it expired
+            time.sleep(10)
+
 # Refresh the ICE token which being called
 def refreshIceToken() -> None:
     global ice_token
+    global ice_token_expiry
     ice_token_response = None
     if speech_private_endpoint:
         if enable_token_auth_for_speech:
@@ -490,6 +521,8 @@ def refreshIceToken() -> None:
             ice_token_response = requests.get(f'https://{speech_region}.tts.speech.microsoft.com/cognitiveservices/avatar/relay/token/v1', headers={'Ocp-Apim-Subscription-Key': speech_key})
     if ice_token_response.status_code == 200:
         ice_token = ice_token_response.text
+        ice_token_expiry = time.monotonic() + ice_token_ttl
+        print(f"ICE token refreshed. Cache hits: {ice_token_hits}, misses: {ice_token_misses}")
     else:
         raise Exception(f"Failed to get ICE token. Status code: {ice_token_response.status_code}")
 
@@ -741,5 +774,20 @@ speechTokenRefereshThread = threading.Thread(target=refreshSpeechToken)
 speechTokenRefereshThread.daemon = True
 speechTokenRefereshThread.start()
 
+# Handle the voice activity detected by the VAD worker
+def handleVoiceActivity(client_id: uuid.UUID) -> None:
+    if client_id in client_contexts:
+        print("Voice activity detected.")
+        stopSpeakingInternal(client_id)
+
+# Start the VAD worker
+if vad_model is not None:
+    vad_worker = BatchedVAD(vad_model, on_speech=handleVoiceActivity, threshold=0.5, sampling_rate=16000, min_silence_duration_ms=150, speech_pad_ms=100)
+
 # Fetch ICE token at startup
 refreshIceToken()
+
+# Start the ICE token refresh thread
+iceTokenRefreshThread = threading.Thread(target=refreshIceTokenPeriodically)
+iceTokenRefreshThread.daemon = True
+iceTokenRefreshThread.start()
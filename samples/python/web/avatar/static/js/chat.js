@@ -19,6 +19,7 @@ var isFirstRecognizingEvent = true
 var sttLatencyRegex = new RegExp(/<STTL>(\d+)<\/STTL>/)
 var firstTokenLatencyRegex = new RegExp(/<FTL>(\d+)<\/FTL>/)
 var firstSentenceLatencyRegex = new RegExp(/<FSL>(\d+)<\/FSL>/)
+var enableBinaryAudio = true // Send microphone audio as a binary Socket.IO attachment instead of base64 text in JSON
 
 // Connect to avatar service
 function connectAvatar() {
@@ -630,9 +631,13 @@ window.microphone = () => {
                                 for (let i = 0; i < audioDataFloat32.length; i++) {
                                     audioDataInt16[i] = Math.max(-0x8000, Math.min(0x7FFF, audioDataFloat32[i] * 0x7FFF))
                                 }
-                                const audioDataBytes = new Uint8Array(audioDataInt16.buffer)
-                                const audioDataBase64 = btoa(String.fromCharCode(...audioDataBytes))
-                                socket.emit('message', { clientId: clientId, path: 'api.audio', audioChunk: audioDataBase64 })
+                                if (enableBinaryAudio) {
+                                    socket.emit('message', { clientId: clientId, path: 'api.audio', audioChunk: audioDataInt16.buffer })
+                                } else {
+                                    const audioDataBytes = new Uint8Array(audioDataInt16.buffer)
+                                    const audioDataBase64 = btoa(String.fromCharCode(...audioDataBytes))
+                                    socket.emit('message', { clientId: clientId, path: 'api.audio', audioChunk: audioDataBase64 })
+                                }
                             }
 
                             audioSource.connect(audioWorkletNode)
@@ -1,7 +1,144 @@
-import copy
+import collections
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
 import torch
 import numpy as np
 
+
+class UtteranceBuffer:
+    """
+    Float32 buffer collecting the samples of one utterance after another.
+
+    Utterances are written one after the other into a preallocated array, so appending a frame
+    and handing an utterance over do not allocate on the steady-state path. A new array is only
+    allocated when the current one is full, the earlier utterances keep referring to the old one.
+    """
+
+    def __init__(self, initial_samples: int):
+        self._data = np.empty(initial_samples, dtype=np.float32)
+        # the current utterance is self._data[self._start:self._start + self._size]
+        self._start = 0
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def append(self, frame: np.ndarray):
+        end = self._start + self._size + len(frame)
+        if end > len(self._data):
+            # only the current utterance moves, views of it and of earlier utterances stay valid
+            data = np.empty(max(len(self._data), 2 * (self._size + len(frame))), dtype=np.float32)
+            data[:self._size] = self._data[self._start:self._start + self._size]
+            self._data = data
+            self._start = 0
+            end = self._size + len(frame)
+        self._data[end - len(frame):end] = frame
+        self._size += len(frame)
+
+    def view(self) -> np.ndarray:
+        """
+        Contiguous view of the samples collected so far.
+        Later appends never modify the samples covered by an existing view.
+        """
+        return self._data[self._start:self._start + self._size]
+
+    def detach(self) -> np.ndarray:
+        """
+        Hand the collected samples over to the caller and start an empty utterance after them,
+        so the returned array is never overwritten by the next utterance.
+        """
+        utterance = self.view()
+        self.clear()
+        return utterance
+
+    def clear(self):
+        # the next utterance starts after this one, which may still be referenced by a view
+        self._start += self._size
+        self._size = 0
+
+
+class PreRollBuffer:
+    """
+    Fixed-size circular buffer keeping the most recent samples before speech is detected.
+    """
+
+    def __init__(self, capacity: int):
+        self._data = np.zeros(capacity, dtype=np.float32)
+        self._pos = 0
+        self._filled = 0
+
+    def __len__(self):
+        return self._filled
+
+    def append(self, frame: np.ndarray):
+        capacity = len(self._data)
+        n = len(frame)
+        if capacity == 0:
+            return
+        if n >= capacity:
+            self._data[:] = frame[n - capacity:]
+            self._pos = 0
+            self._filled = capacity
+            return
+        end = self._pos + n
+        if end <= capacity:
+            self._data[self._pos:end] = frame
+        else:
+            head = capacity - self._pos
+            self._data[self._pos:] = frame[:head]
+            self._data[:n - head] = frame[head:]
+        self._pos = end % capacity
+        self._filled = min(capacity, self._filled + n)
+
+    def reset_to(self, samples: np.ndarray):
+        """Keep only the most recent of ``samples``."""
+        self.clear()
+        self.append(samples)
+
+    def copy_to(self, buffer: UtteranceBuffer):
+        """Append the buffered samples, oldest first, to ``buffer``."""
+        if self._filled < len(self._data):
+            buffer.append(self._data[:self._filled])
+        else:
+            buffer.append(self._data[self._pos:])
+            buffer.append(self._data[:self._pos])
+
+    def clear(self):
+        self._pos = 0
+        self._filled = 0
+
+
+class FrameAssembler:
+    """
+    Cuts a stream of 16-bit PCM chunks of any size into float32 frames of ``frame_samples`` samples.
+    Every complete frame is returned, the remainder is kept for the next chunk.
+    """
+
+    def __init__(self, frame_samples: int = 512):
+        self.frame_samples = frame_samples
+        self._buffer = bytearray()
+
+    def __len__(self):
+        return len(self._buffer)
+
+    def frames(self, chunk: bytes) -> np.ndarray:
+        """Append ``chunk`` and return the complete frames, shape (frames, frame_samples)."""
+        self._buffer += chunk
+        count = len(self._buffer) // (2 * self.frame_samples)
+        if count == 0:
+            return np.empty((0, self.frame_samples), dtype=np.float32)
+        samples = count * self.frame_samples
+        # converted in one go, the result does not refer to the buffer, so it can shrink afterwards
+        frames = int2float(np.frombuffer(self._buffer, dtype=np.int16, count=samples)).reshape(count, self.frame_samples)
+        del self._buffer[:2 * samples]
+        return frames
+
+    def clear(self):
+        self._buffer.clear()
+
+
 class VADIterator:
     def __init__(
         self,
@@ -17,7 +154,8 @@ class VADIterator:
 
         Parameters
         ----------
-        model: preloaded .jit/.onnx silero VAD model
+        model: preloaded .jit/.onnx silero VAD model, or None when the speech probabilities are
+            computed elsewhere and passed to advance(), e.g. by BatchedVAD
 
         threshold: float (default - 0.5)
             Speech threshold. Silero VAD outputs speech probabilities for each audio chunk, probabilities ABOVE this value are considered as SPEECH.
@@ -37,9 +175,6 @@ class VADIterator:
         self.threshold = threshold
         self.sampling_rate = sampling_rate
         self.is_speaking = False
-        self.buffer = []
-        self.start_pad_buffer = []
-
 
         if sampling_rate not in [8000, 16000]:
             raise ValueError(
@@ -49,42 +184,60 @@ class VADIterator:
         self.min_silence_samples = sampling_rate * min_silence_duration_ms / 1000
         self.speech_pad_samples = sampling_rate * speech_pad_ms / 1000
 
+        # utterance samples are collected in one preallocated array (10 s to start with)
+        # and the pre-roll is a ring buffer, so no list of frames is kept per utterance
+        self.buffer = UtteranceBuffer(sampling_rate * 10)
+        self.start_pad_buffer = PreRollBuffer(int(self.speech_pad_samples))
+
         self.reset_states()
 
     def reset_states(self):
-        self.model.reset_states()
+        if self.model is not None:
+            self.model.reset_states()
         self.triggered = False
         self.temp_end = 0
         self.current_sample = 0
+        self.buffer.clear()
+        self.start_pad_buffer.clear()
 
     @torch.no_grad()
     def __call__(self, x):
         """
-        x: torch.Tensor
-            audio chunk (see examples in repo)
+        x: torch.Tensor or np.ndarray
+            float32 audio chunk (see examples in repo)
 
-        return_seconds: bool (default - False)
-            whether return timestamps in seconds (default - samples)
+        Returns the utterance as a contiguous float32 np.ndarray once the end of speech
+        is detected, otherwise None. The returned array belongs to the caller.
         """
 
-        if not torch.is_tensor(x):
+        if torch.is_tensor(x):
+            frame = x.numpy().reshape(-1)
+        else:
             try:
-                x = torch.Tensor(x)
+                frame = np.asarray(x, dtype=np.float32).reshape(-1)
+                x = torch.from_numpy(frame)
             except Exception:
                 raise TypeError("Audio cannot be casted to tensor. Cast it manually")
 
-        window_size_samples = len(x[0]) if x.dim() == 2 else len(x)
-        self.current_sample += window_size_samples
+        return self.advance(frame, self.model(x, self.sampling_rate).item())
 
-        speech_prob = self.model(x, self.sampling_rate).item()
+    def advance(self, frame: np.ndarray, speech_prob: float):
+        """
+        Update the state with a float32 frame and its speech probability.
+        Returns the utterance once the end of speech is detected, otherwise None, like __call__.
+        """
+
+        window_size_samples = len(frame)
+        self.current_sample += window_size_samples
 
         if (speech_prob >= self.threshold) and self.temp_end:
             self.temp_end = 0
 
         if (speech_prob >= self.threshold) and not self.triggered:
             self.triggered = True
-            self.buffer = copy.deepcopy(self.start_pad_buffer)
-            self.buffer.append(x)
+            self.buffer.clear()
+            self.start_pad_buffer.copy_to(self.buffer)
+            self.buffer.append(frame)
             return None
 
         if (speech_prob < self.threshold - 0.15) and self.triggered:
@@ -97,18 +250,114 @@ class VADIterator:
                 # end of speak
                 self.temp_end = 0
                 self.triggered = False
-                spoken_utterance = self.buffer
-                self.buffer = []
-                return spoken_utterance
+                utterance = self.buffer.detach()
+                # the pre-roll is not written during speech, its most recent samples are the end of the utterance
+                self.start_pad_buffer.reset_to(utterance)
+                return utterance
 
         if self.triggered:
-            self.buffer.append(x)
-
-        self.start_pad_buffer.append(x)
-        self.start_pad_buffer = self.start_pad_buffer[-int(self.speech_pad_samples//window_size_samples):]
+            self.buffer.append(frame)
+        else:
+            self.start_pad_buffer.append(frame)
 
         return None
 
+class BatchedVAD:
+    """
+    Voice activity detection for many clients with one silero VAD model.
+
+    Each client has its own VAD session: the recurrent state and context of the model and a VADIterator
+    for the speech segmentation, so the audio of different clients never mixes. A worker thread runs the
+    model every `tick_ms` on one batch with the pending frames of all clients, and calls
+    `on_speech(client_id)` when the speech of a client ends, on one of `callback_workers` threads so a slow
+    callback does not delay the detection of the other clients.
+    """
+
+    def __init__(self, model, on_speech, tick_ms: int = 20, threshold: float = 0.5, sampling_rate: int = 16000,
+                 min_silence_duration_ms: int = 100, speech_pad_ms: int = 30, callback_workers: int = 4):
+        if sampling_rate != 16000:
+            raise ValueError("BatchedVAD only supports 16000 sample rate")
+        # the inner model takes the state explicitly, the wrapper would keep one state for the whole batch
+        if not hasattr(model, "_model"):
+            raise ValueError("BatchedVAD needs the silero VAD JIT model loaded with torch.hub, "
+                             "whose inner model `_model` takes the state as an argument")
+        self.model = model._model
+        self.context_samples = self.model.context_size_samples
+        self.on_speech = on_speech
+        self.tick_s = tick_ms / 1000
+        self.iterator_args = dict(threshold=threshold, sampling_rate=sampling_rate,
+                                  min_silence_duration_ms=min_silence_duration_ms, speech_pad_ms=speech_pad_ms)
+        self.sessions = {}
+        self._lock = threading.Lock()
+        self._pending = threading.Event()
+        self._callbacks = ThreadPoolExecutor(max_workers=callback_workers, thread_name_prefix="vad-callback")
+        self._thread = threading.Thread(target=self._run, name="vad-worker", daemon=True)
+        self._thread.start()
+
+    def add_frame(self, client_id, frame: np.ndarray):
+        """Queue a float32 frame of 512 samples of a client, its session is opened on the first frame."""
+        with self._lock:
+            session = self.sessions.get(client_id)
+            if session is None:
+                session = self.sessions[client_id] = _VADSession(self.context_samples, self.iterator_args)
+            session.frames.append(frame)
+        self._pending.set()
+
+    def close(self, client_id):
+        with self._lock:
+            self.sessions.pop(client_id, None)
+
+    def _run(self):
+        while True:
+            self._pending.wait()
+            # frames arriving within the tick join the batch
+            time.sleep(self.tick_s)
+            self._pending.clear()
+            while True:
+                with self._lock:
+                    batch = [(client_id, session, session.frames.popleft())
+                             for client_id, session in self.sessions.items() if session.frames]
+                if not batch:
+                    break
+                try:
+                    speaking = self._infer(batch)
+                except Exception as e:
+                    print(f"VAD inference failed. Error message: {e}")
+                    continue
+                for client_id in speaking:
+                    self._callbacks.submit(self._notify, client_id)
+
+    def _notify(self, client_id):
+        try:
+            self.on_speech(client_id)
+        except Exception as e:
+            print(f"Handling voice activity failed. Error message: {e}")
+
+    @torch.no_grad()
+    def _infer(self, batch):
+        frames = torch.from_numpy(np.stack([frame for _, _, frame in batch]))
+        contexts = torch.cat([session.context for _, session, _ in batch])
+        states = torch.cat([session.state for _, session, _ in batch], dim=1)
+        x = torch.cat([contexts, frames], dim=1)
+        speech_probs, states = self.model(x, states)
+        speaking = []
+        for i, (client_id, session, frame) in enumerate(batch):
+            session.state = states[:, i:i + 1]
+            session.context = x[i:i + 1, -self.context_samples:]
+            utterance = session.iterator.advance(frame, speech_probs[i].item())
+            if utterance is not None and len(utterance) > 0:
+                speaking.append(client_id)
+        return speaking
+
+
+class _VADSession:
+    def __init__(self, context_samples: int, iterator_args: dict):
+        self.iterator = VADIterator(model=None, **iterator_args)
+        self.state = torch.zeros(2, 1, 128)
+        self.context = torch.zeros(1, context_samples)
+        self.frames = collections.deque()
+
+
 def int2float(sound):
     """
     Taken from https://github.com/snakers4/silero-vad
@@ -126,4 +375,4 @@ def float2int(sound):
     # sound = sound.squeeze()  # depends on the use case
     sound *= 32768
     sound = np.clip(sound, -32768, 32767)
-    return sound.astype("int16")
\ No newline at end of file
+    return sound.astype("int16")
@@ -2,19 +2,35 @@
 # Licensed under the MIT license. See LICENSE.md file in the project root for full license information.
 
 import logging
+import os
 from websocket_server import WebSocketServer
+from server_metrics import ServerMetrics
 from aiohttp import web
 import argparse
 
 parser = argparse.ArgumentParser(description="aiohttp server example")
 parser.add_argument('--path')
 parser.add_argument('--port', type=int, default=8080)
+parser.add_argument('--workers', type=int, default=int(os.environ.get("WORKERS", "1")),
+                    help="server processes sharing the port, defaults to $WORKERS or 1")
+
+
+def create_app(metrics: ServerMetrics = None) -> web.Application:
+    app = web.Application()
+    server = WebSocketServer()
+    app.router.add_get('/openai/realtime', server.websocket_handler)
+    app.on_shutdown.append(server.drain)
+    (metrics or ServerMetrics()).attach(app, server.session_count, server.queue_depth)
+    return app
 
-app = web.Application()
-server = WebSocketServer()
-app.router.add_get('/openai/realtime', server.websocket_handler)
 
 if __name__ == '__main__':
     logging.basicConfig(level=logging.INFO)
     args = parser.parse_args()
-    web.run_app(app, path=args.path, port=args.port, host='0.0.0.0')
\ No newline at end of file
+    if args.workers > 1:
+        if args.path:
+            parser.error("--path cannot be used with several workers")
+        import workers
+        workers.run(args.workers, host='0.0.0.0', port=args.port)
+    else:
+        web.run_app(create_app(), path=args.path, port=args.port, host='0.0.0.0', shutdown_timeout=5)
@@ -6,12 +6,12 @@ import json
 import logging
 import os
 import time
-from typing import Tuple
+from typing import Awaitable, Callable, Optional, Tuple
 
 import azure.cognitiveservices.speech as speechsdk
 from aiohttp import ClientSession
 from data_models import IceServer
-from azure_tts import AioOutputStream, InputTextStream, InputTextStreamFromQueue, token_provider
+from azure_tts import AioOutputStream, InputTextStream, InputTextStreamFromQueue, SegmentedSynthesis, token_provider
 
 logger = logging.getLogger(__name__)
 
@@ -26,6 +26,80 @@ if not SPEECH_REGION:
 if not (SPEECH_KEY or SPEECH_RESOURCE_ID):
     raise ValueError("SPEECH_KEY or SPEECH_RESOURCE_ID must be set")
 
+# seconds an ICE relay token is used for, it is refreshed in the background ICE_TOKEN_REFRESH_MARGIN_S before
+ICE_TOKEN_TTL_S = int(os.environ.get("ICE_TOKEN_TTL_S", "3600"))
+ICE_TOKEN_REFRESH_MARGIN_S = 300
+
+
+class IceServerCache:
+    """
+    ICE relay credentials shared by all sessions of the process. They are fetched once, used for `ttl_s` and
+    refreshed in the background `refresh_margin_s` before they expire. Concurrent requests for missing or expired
+    credentials wait for one fetch. `hits` and `misses` count the requests served from the cache and those which
+    had to wait.
+    """
+
+    def __init__(self, fetch: Callable[[], Awaitable[IceServer]], ttl_s: float = ICE_TOKEN_TTL_S,
+                 refresh_margin_s: float = ICE_TOKEN_REFRESH_MARGIN_S):
+        self.fetch = fetch
+        self.ttl_s = ttl_s
+        self.refresh_margin_s = min(refresh_margin_s, ttl_s / 2)
+        self.hits = 0
+        self.misses = 0
+        self.failures = 0
+        self._ice_server: Optional[IceServer] = None
+        self._expires_at = 0.0
+        self._fetching: Optional[asyncio.Task] = None
+        self._timer: Optional[asyncio.TimerHandle] = None
+
+    async def get(self) -> IceServer:
+        if self._ice_server is not None and time.monotonic() < self._expires_at:
+            self.hits += 1
+            return self._ice_server
+        self.misses += 1
+        # a cancelled session does not cancel the fetch the others wait for
+        return await asyncio.shield(self._refresh())
+
+    def _refresh(self) -> asyncio.Task:
+        if self._fetching is None:
+            self._fetching = asyncio.get_running_loop().create_task(self._fetch())
+            # retrieves the exception of a background refresh nobody waits for
+            self._fetching.add_done_callback(lambda task: task.cancelled() or task.exception())
+        return self._fetching
+
+    async def _fetch(self) -> IceServer:
+        try:
+            ice_server = await self.fetch()
+        except Exception as e:
+            self.failures += 1
+            logger.error(f"Failed to get ICE relay token: {e}")
+            raise
+        finally:
+            self._fetching = None
+        self._ice_server = ice_server
+        self._expires_at = time.monotonic() + self.ttl_s
+        if self._timer is not None:
+            self._timer.cancel()
+        self._timer = asyncio.get_running_loop().call_later(self.ttl_s - self.refresh_margin_s, self._refresh)
+        logger.info(f"ICE relay token refreshed, cache hits: {self.hits}, misses: {self.misses}, failures: {self.failures}")
+        return ice_server
+
+
+async def _fetch_ice_server() -> IceServer:
+    headers = {}
+    if SPEECH_KEY:
+        headers["Ocp-Apim-Subscription-Key"] = SPEECH_KEY
+    else:
+        headers["Authorization"] = f"Bearer aad#{SPEECH_RESOURCE_ID}#{token_provider()}"
+    async with ClientSession(headers=headers) as session:
+        async with session.get(f"https://{SPEECH_REGION}.tts.speech.microsoft.com/cognitiveservices/avatar/relay/token/v1") as response:
+            response.raise_for_status()
+            j = await response.text()
+            return IceServer.model_validate_json(j)
+
+
+ice_server_cache = IceServerCache(_fetch_ice_server)
+
 
 class Client:
     def __init__(self, synthesis_pool_size: int = 2):
@@ -35,6 +109,7 @@ class Client:
         self._counter = 0
         self.voice = None
         self.interruption_time = 0
+        self._pumps = set()
         self.tts_host = f"https://{SPEECH_REGION}.tts.speech.microsoft.com"
 
     def configure(self, voice: str):
@@ -73,66 +148,43 @@ class Client:
         if not SPEECH_KEY:
             self.speech_synthesizer.authorization_token = auth_token
 
-    def text_to_speech(
+    async def text_to_speech(
         self, voice: str, speed: str = "medium"
     ) -> Tuple[InputTextStream, AioOutputStream]:
         # input_stream = sp
         logger.info(f"Synthesizing text with voice: {voice}")
         # synthesis_request.rate = speed
         current_synthesizer = self.speech_synthesizer
-        start_time = time.time()
+        previous = list(self._pumps)
 
         aio_stream = AioOutputStream()
         input_stream = InputTextStreamFromQueue()
-
-        async def read_from_data_stream():
-            inputs = []
-            async for chunk in input_stream:
-                inputs.append(chunk)
-            contents = "".join(inputs)
-            if start_time < self.interruption_time:
-                logger.info("Synthesis interrupted, ignoring this turn")
-                return
-            result = current_synthesizer.start_speaking_text(contents)
-            stream = speechsdk.AudioDataStream(result)
-            loop = asyncio.get_running_loop()
-            while True:
-                chunk = bytes(2400 * 4)
-                read = await loop.run_in_executor(None, stream.read_data, chunk)
-                if read == 0:
-                    break
-                aio_stream.write_data(chunk[:read])
-            if stream.status == speechsdk.StreamStatus.Canceled:
-                logger.error(
-                    f"Speech synthesis failed: {stream.status}, details: {stream.cancellation_details.error_details}"
-                )
-            aio_stream.end_of_stream()
-
-        asyncio.create_task(read_from_data_stream())
+        # sentences are queued on the synthesizer as soon as they are complete, the avatar video is rendered from
+        # the complete audio, so no silence is trimmed
+        async def lease():
+            return current_synthesizer, None
+
+        synthesis = SegmentedSynthesis(input_stream, aio_stream, lease, trim_silence=False)
+        self._pumps.add(synthesis)
+        synthesis.done.add_done_callback(lambda _: self._pumps.discard(synthesis))
+
+        async def start_synthesis():
+            # the avatar has one synthesizer, wait until an interrupted turn is stopped rather than queue behind it
+            for pump in previous:
+                await pump.done
+            synthesis.start()
+
+        asyncio.create_task(start_synthesis())
         return input_stream, aio_stream
 
     async def interrupt(self):
         self.interruption_time = time.time()
-        # todo: uncomment this when the service supports it
-        # try:
-        #     connection = speechsdk.Connection.from_speech_synthesizer(self.speech_synthesizer)
-        #     sending = connection.send_message_async('synthesis.control', '{"action":"stop"}')
-        #     loop = asyncio.get_running_loop()
-        #     await loop.run_in_executor(None, sending.get)
-        # except Exception as e:
-        #     logger.error(f"Error interrupting synthesis: {e}")
-
-    async def get_ice_servers(self):
-        headers = {}
-        if SPEECH_KEY:
-            headers["Ocp-Apim-Subscription-Key"] = SPEECH_KEY
-        else:
-            headers["Authorization"] = f"Bearer aad#{SPEECH_RESOURCE_ID}#{token_provider()}"
-        async with ClientSession(headers=headers) as session:
-            async with session.get(f"{self.tts_host}/cognitiveservices/avatar/relay/token/v1") as response:
-                response.raise_for_status()
-                j = await response.text()
-                return IceServer.model_validate_json(j)
+        # stops the synthesis with stop_speaking_async and discards the rest of its audio
+        for pump in list(self._pumps):
+            pump.cancel()
+
+    async def get_ice_servers(self) -> IceServer:
+        return await ice_server_cache.get()
 
     async def connect(self, client_description: str, ice_server: IceServer) -> str:
         avatar_config = {
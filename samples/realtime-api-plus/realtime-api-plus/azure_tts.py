@@ -3,10 +3,15 @@
 
 from abc import ABC, abstractmethod
 import asyncio
+import collections
+from concurrent.futures import ThreadPoolExecutor
 import logging
 import os
+import queue
+import re
+import threading
 import time
-from typing import AsyncIterator, Tuple
+from typing import AsyncIterator, Awaitable, Callable, List, Optional, Tuple
 
 import azure.cognitiveservices.speech as speechsdk
 import numpy as np
@@ -28,25 +33,52 @@ if not (SPEECH_KEY or SPEECH_RESOURCE_ID):
 token_provider = get_bearer_token_provider(DefaultAzureCredential(), "https://cognitiveservices.azure.com/.default")
 
 
-def calculate_energy(frame_data):
-    # Convert the byte data to a numpy array for easier processing (assuming 16-bit PCM)
-    data = np.frombuffer(frame_data, dtype=np.int16)
-    # Calculate the energy as the sum of squares of the samples
-    energy = np.sum(data**2) / len(data)
-    return energy
+# leading silence is trimmed from the first 150 ms of synthesized audio (24 kHz 16 bit), in 10 ms windows
+SILENCE_LOOKAHEAD_BYTES = int(150 * 24000 * 2 / 1000)
+SILENCE_WINDOW_BYTES = int(10 * 24000 * 2 / 1000)
+# mean square of the samples in a window
+SILENCE_ENERGY_THRESHOLD = 500
+
+
+def leading_silence_bytes(data: bytes, size: int = None) -> int:
+    """Length in bytes of the leading silence in the first `size` bytes of 16-bit PCM `data`, in whole windows."""
+    size = len(data) if size is None else size
+    windows = size // SILENCE_WINDOW_BYTES
+    if windows == 0:
+        return 0
+    samples = np.frombuffer(data, dtype=np.int16, count=windows * SILENCE_WINDOW_BYTES // 2).astype(np.int32)
+    # squares of int16 samples fit int32, the sums are taken in int64
+    energy = np.square(samples).reshape(windows, -1).sum(axis=1, dtype=np.int64) / (SILENCE_WINDOW_BYTES // 2)
+    loud = np.flatnonzero(energy >= SILENCE_ENERGY_THRESHOLD)
+    return int(loud[0] if len(loud) else windows) * SILENCE_WINDOW_BYTES
+
+# threads reading synthesized audio, shared by all sessions. Each synthesis occupies one until its audio is read,
+# so the default executor is not blocked and no thread is handed over per chunk
+AUDIO_READER_THREADS = int(os.environ.get("AUDIO_READER_THREADS", "64"))
+_audio_readers = ThreadPoolExecutor(max_workers=AUDIO_READER_THREADS, thread_name_prefix="tts-audio-reader")
+
 
 class AioOutputStream:
+    """
+    Audio chunks of one synthesis. A chunk written with a `release` callback is a view of a reused buffer, it stays
+    valid until the next chunk is read.
+    """
+
     def __init__(self):
         self._queue = asyncio.Queue()
+        self._release = None
 
-    def write_data(self, data: bytes):
-        self._queue.put_nowait(data)
+    def write_data(self, data: bytes, release: Optional[Callable[[], None]] = None):
+        self._queue.put_nowait((data, release))
 
     def end_of_stream(self):
-        self._queue.put_nowait(None)
+        self._queue.put_nowait((None, None))
 
     async def read(self) -> bytes:
-        chunk = await self._queue.get()
+        if self._release is not None:
+            self._release()
+            self._release = None
+        chunk, self._release = await self._queue.get()
         if chunk is None:
             raise StopAsyncIteration
         return chunk
@@ -57,6 +89,93 @@ class AioOutputStream:
     async def __anext__(self):
         return await self.read()
 
+class AudioPump:
+    """
+    Reads one AudioDataStream on an audio reader thread into a few reused buffers and hands the filled views to an
+    AioOutputStream with call_soon_threadsafe. The reader waits for a free buffer when the consumer falls behind.
+    With `trim_silence` the leading silence is trimmed from the first read.
+
+    cancel() stops the synthesis of `synthesizer` and the read loop, the rest of the stream is drained and discarded.
+    `done` is resolved on the event loop once the stream is read, i.e. the synthesizer is idle again. Without
+    `end_stream` the AioOutputStream is left open, so the audio of the next synthesis can follow.
+    """
+
+    def __init__(self, stream: speechsdk.AudioDataStream, aio_stream: AioOutputStream,
+                 synthesizer: speechsdk.SpeechSynthesizer = None, trim_silence: bool = True,
+                 buffers: int = 8, chunk_bytes: int = 2400 * 4, end_stream: bool = True):
+        self.stream = stream
+        self.aio_stream = aio_stream
+        self.synthesizer = synthesizer
+        self.trim_silence = trim_silence
+        self.end_stream = end_stream
+        self.cancelled = threading.Event()
+        self._loop = asyncio.get_running_loop()
+        self.done = self._loop.create_future()
+        self._ended = False
+        self._free = queue.Queue()
+        for _ in range(buffers):
+            # the SDK fills the buffer in place
+            self._free.put(bytes(chunk_bytes))
+
+    def start(self):
+        _audio_readers.submit(self._run)
+
+    def cancel(self):
+        """Stop the synthesis and the reading, the stream ends after the chunk being read. Safe to call from any thread."""
+        if self.cancelled.is_set():
+            return
+        self.cancelled.set()
+        if self.synthesizer is not None:
+            # does not wait, the reader sees the end of the stream once the service stopped
+            self.synthesizer.stop_speaking_async()
+
+    def _run(self):
+        try:
+            if self.trim_silence and not self.cancelled.is_set():
+                # the leading silence is found in one lookahead read, which is then emitted from the first loud window
+                lookahead = bytes(SILENCE_LOOKAHEAD_BYTES)
+                read = self.stream.read_data(lookahead)
+                offset = leading_silence_bytes(lookahead, read)
+                if read > offset:
+                    self._loop.call_soon_threadsafe(self.aio_stream.write_data, memoryview(lookahead)[offset:read])
+                if read == 0:
+                    return
+            while not self.cancelled.is_set():
+                try:
+                    buffer = self._free.get(timeout=0.1)
+                except queue.Empty:
+                    continue
+                read = self.stream.read_data(buffer)
+                if read == 0 or self.cancelled.is_set():
+                    break
+                self._loop.call_soon_threadsafe(
+                    self.aio_stream.write_data, memoryview(buffer)[:read], lambda buffer=buffer: self._free.put(buffer))
+            if self.cancelled.is_set():
+                logger.warning("Interruption detected, stopping synthesis")
+                # the consumer stops now, the synthesizer is busy until its stream ends
+                if self.end_stream:
+                    self._loop.call_soon_threadsafe(self.aio_stream.end_of_stream)
+                self._ended = True
+                scratch = bytes(2400 * 4)
+                while self.stream.read_data(scratch):
+                    pass
+            elif self.stream.status == speechsdk.StreamStatus.Canceled:
+                logger.error(f"Speech synthesis failed: {self.stream.status}, details: {self.stream.cancellation_details.error_details}")
+        except Exception as e:
+            logger.error(f"Error reading synthesized audio: {e}")
+        finally:
+            try:
+                self._loop.call_soon_threadsafe(self._finish)
+            except RuntimeError:
+                # the event loop is closed
+                pass
+
+    def _finish(self):
+        if self.end_stream and not self._ended:
+            self.aio_stream.end_of_stream()
+        if not self.done.done():
+            self.done.set_result(None)
+
 class InputTextStream(ABC):
     @abstractmethod
     def write(self, data: str):
@@ -98,14 +217,359 @@ class InputTextStreamFromQueue(InputTextStream):
     async def __anext__(self):
         return await self.read()
 
+# sentence ends, ASCII punctuation only when followed by a space, so decimals and the like are not cut
+_SENTENCE_END = re.compile(r"[。！？；…\n]+[”’」』）)\]\"']*|[.!?;]+[”’」』）)\]\"']*(?=\s)")
+_CLAUSE_END = re.compile(r"[，、：]|[,:](?=\s)")
+
+
+class TextSegmenter:
+    """
+    Cuts streamed text into sentences. A sentence which grows beyond `clause_chars` is cut at the next clause
+    end instead, and the first one already beyond `first_clause_chars`, so the first audio is not held back.
+    """
+
+    def __init__(self, first_clause_chars: int = 30, clause_chars: int = 150):
+        self.first_clause_chars = first_clause_chars
+        self.clause_chars = clause_chars
+        self._buffer = ""
+        self._first = True
+
+    def feed(self, text: str) -> List[str]:
+        """The segments completed by `text`."""
+        self._buffer += text
+        segments = []
+        while True:
+            match = _SENTENCE_END.search(self._buffer)
+            limit = self.first_clause_chars if self._first else self.clause_chars
+            if match is None and len(self._buffer) > limit:
+                match = _CLAUSE_END.search(self._buffer, limit)
+            if match is None:
+                return segments
+            segment = self._buffer[:match.end()].strip()
+            self._buffer = self._buffer[match.end():]
+            if segment:
+                segments.append(segment)
+                self._first = False
+
+    def flush(self) -> str:
+        """The rest of the text, once the stream is closed."""
+        segment = self._buffer.strip()
+        self._buffer = ""
+        return segment
+
+
+class SegmentedSynthesis:
+    """
+    Synthesis of streamed text for voices which cannot synthesize a text stream, e.g. CNV voices and the avatar.
+    Each sentence is synthesized as soon as it is complete, up to `ahead` at once, and their audio is written in
+    order to one AioOutputStream, so the first audio comes after the first sentence instead of the whole answer.
+
+    `acquire` is awaited for the synthesizer of a sentence and a callback to release it once its audio is read.
+    cancel() and `done` are those of AudioPump for the whole text.
+    """
+
+    def __init__(self, input_stream: InputTextStreamFromQueue, aio_stream: AioOutputStream,
+                 acquire: Callable[[], Awaitable[Tuple[speechsdk.SpeechSynthesizer, Optional[Callable[[], None]]]]],
+                 trim_silence: bool = True, ahead: int = 2):
+        self.input_stream = input_stream
+        self.aio_stream = aio_stream
+        self.acquire = acquire
+        self.trim_silence = trim_silence
+        self.cancelled = False
+        self._loop = asyncio.get_running_loop()
+        self.done = self._loop.create_future()
+        self._slots = asyncio.Semaphore(ahead)
+        # started syntheses in text order, None ends the audio
+        self._started = asyncio.Queue()
+        self._pump = None
+        self._ended = False
+
+    def start(self):
+        self._loop.create_task(self._synthesize())
+        self._loop.create_task(self._play())
+
+    def cancel(self):
+        """Stop the syntheses and end the audio. Safe to call from any thread."""
+        self._loop.call_soon_threadsafe(self._cancel)
+
+    def _cancel(self):
+        if self.cancelled:
+            return
+        self.cancelled = True
+        if self._pump is not None:
+            self._pump.cancel()
+        # the syntheses started so far are still queued before the None and are drained, no more are started
+        self._started.put_nowait(None)
+        self._end()
+
+    def _end(self):
+        if not self._ended:
+            self._ended = True
+            self.aio_stream.end_of_stream()
+
+    async def _synthesize(self):
+        segmenter = TextSegmenter()
+        try:
+            async for chunk in self.input_stream:
+                for segment in segmenter.feed(chunk):
+                    await self._start(segment)
+            segment = segmenter.flush()
+            if segment:
+                await self._start(segment)
+        except Exception as e:
+            logger.error(f"Error starting synthesis: {e}")
+        finally:
+            self._started.put_nowait(None)
+
+    async def _start(self, segment: str):
+        await self._slots.acquire()
+        if self.cancelled:
+            self._slots.release()
+            return
+        try:
+            synthesizer, release = await self.acquire()
+        except Exception:
+            self._slots.release()
+            raise
+        if self.cancelled:
+            self._slots.release()
+            if release is not None:
+                release()
+            return
+        try:
+            future = synthesizer.start_speaking_text_async(segment)
+        except Exception:
+            self._slots.release()
+            if release is not None:
+                release()
+            raise
+        # the future resolves once the synthesis started, which may wait for the previous one on the same synthesizer
+        self._started.put_nowait((self._loop.run_in_executor(_audio_readers, future.get), synthesizer, release))
+
+    async def _play(self):
+        first = True
+        try:
+            while (started := await self._started.get()) is not None:
+                result, synthesizer, release = started
+                try:
+                    stream = speechsdk.AudioDataStream(await result)
+                    pump = AudioPump(stream, self.aio_stream, synthesizer, trim_silence=self.trim_silence and first,
+                                     end_stream=False)
+                    first = False
+                    if self.cancelled:
+                        # started before the cancellation, stop it and discard its audio
+                        pump.cancel()
+                    self._pump = pump
+                    pump.start()
+                    await pump.done
+                except Exception as e:
+                    logger.error(f"Error synthesizing text: {e}")
+                finally:
+                    self._pump = None
+                    self._slots.release()
+                    if release is not None:
+                        release()
+        finally:
+            self._end()
+            if not self.done.done():
+                self.done.set_result(None)
+
+# bounds of each synthesizer pool, the maximum is the number of concurrent syntheses of a voice per process, and
+# idle synthesizers above the minimum are closed after TTS_POOL_IDLE_TIMEOUT_S
+TTS_POOL_MIN_SIZE = int(os.environ.get("TTS_POOL_MIN_SIZE", "2"))
+TTS_POOL_MAX_SIZE = int(os.environ.get("TTS_POOL_MAX_SIZE", "32"))
+TTS_POOL_IDLE_TIMEOUT_S = 300
+# AAD tokens are valid for 10 minutes
+AUTH_TOKEN_REFRESH_S = 8 * 60
+
+
+class PooledSynthesizer:
+    """A synthesizer with a connection that is opened before the synthesizer is first used."""
+
+    def __init__(self, speech_config: speechsdk.SpeechConfig):
+        self.synthesizer = speechsdk.SpeechSynthesizer(speech_config=speech_config, audio_config=None)
+        self.synthesizer.synthesis_started.connect(lambda evt: logger.info(f"Synthesis started: {evt.result.reason}"))
+        self.synthesizer.synthesis_completed.connect(lambda evt: logger.info(f"Synthesis completed: {evt.result.reason}"))
+        self.synthesizer.synthesis_canceled.connect(lambda evt: logger.error(f"Synthesis canceled: {evt.result.reason}"))
+        self.connection = speechsdk.Connection.from_speech_synthesizer(self.synthesizer)
+        self.connection.connected.connect(self._on_connected)
+        self.connection.disconnected.connect(self._on_disconnected)
+        self.connected = False
+        self.idle_since = time.monotonic()
+        self._token_time = 0.0
+
+    def _on_connected(self, evt):
+        self.connected = True
+
+    def _on_disconnected(self, evt):
+        self.connected = False
+
+    def ensure_ready(self, connect: bool = True):
+        """Refresh the auth token before it expires, and reconnect if the service dropped the connection."""
+        if not SPEECH_KEY and time.monotonic() - self._token_time > AUTH_TOKEN_REFRESH_S:
+            self.synthesizer.authorization_token = f"aad#{SPEECH_RESOURCE_ID}#{token_provider()}"
+            self._token_time = time.monotonic()
+        if connect and not self.connected:
+            self.connection.open(True)
+            self.connected = True
+
+    def close(self):
+        self.connection.close()
+
+
+class SynthesizerPool:
+    """
+    Pre-connected synthesizers of one voice and endpoint, shared by all sessions of the process. Each synthesis
+    leases an idle synthesizer, so a turn never gets one which still speaks. When none is idle the pool grows, up
+    to `max_size` synthesizers, and leasing then waits for a release. Idle ones above `min_size` are closed after
+    a while.
+    """
+
+    def __init__(self, speech_config: speechsdk.SpeechConfig, min_size: int = TTS_POOL_MIN_SIZE,
+                 max_size: int = TTS_POOL_MAX_SIZE):
+        if min_size < 1 or max_size < min_size:
+            raise ValueError("pool size bounds must be 1 <= min_size <= max_size")
+        self.speech_config = speech_config
+        self.min_size = min_size
+        self.max_size = max_size
+        self.leased = 0
+        self._idle = collections.deque()
+        self._expired = []
+        self._lock = threading.Lock()
+        # acquire() waits on the condition, acquire_async() on a future of its event loop
+        self._available = threading.Condition(self._lock)
+        self._waiters = collections.deque()
+        for _ in range(min_size):
+            self._idle.append(self._create())
+
+    def _create(self) -> PooledSynthesizer:
+        synthesizer = PooledSynthesizer(self.speech_config)
+        synthesizer.ensure_ready()
+        return synthesizer
+
+    @property
+    def idle(self) -> int:
+        return len(self._idle)
+
+    def _take(self) -> Tuple[bool, Optional[PooledSynthesizer]]:
+        """
+        With the lock held: (True, an idle synthesizer), (True, None) when a new one is to be created, or
+        (False, None) when all `max_size` synthesizers are leased. Idle synthesizers above `min_size` which were
+        not used for TTS_POOL_IDLE_TIMEOUT_S are set aside to be closed.
+        """
+        now = time.monotonic()
+        while len(self._idle) > self.min_size and now - self._idle[0].idle_since > TTS_POOL_IDLE_TIMEOUT_S:
+            self._expired.append(self._idle.popleft())
+        if self._idle:
+            self.leased += 1
+            # the most recently used synthesizers are leased first, the others stay idle and can be closed
+            return True, self._idle.pop()
+        if self.leased < self.max_size:
+            self.leased += 1
+            return True, None
+        return False, None
+
+    def _wake(self):
+        """With the lock held: let one waiter retry after a release."""
+        self._available.notify()
+        if self._waiters:
+            loop, waiter = self._waiters.popleft()
+            loop.call_soon_threadsafe(lambda: waiter.done() or waiter.set_result(None))
+
+    def _prepare(self, synthesizer: Optional[PooledSynthesizer]) -> PooledSynthesizer:
+        with self._lock:
+            expired, self._expired = self._expired, []
+        for idle in expired:
+            idle.close()
+        created = synthesizer is None
+        try:
+            if created:
+                logger.info(f"All {self.leased - 1} synthesizers are busy, adding one")
+                synthesizer = PooledSynthesizer(self.speech_config)
+            # a new synthesizer connects with its first synthesis instead of blocking the caller
+            synthesizer.ensure_ready(connect=not created)
+        except Exception:
+            self.release(synthesizer)
+            raise
+        return synthesizer
+
+    def acquire(self, timeout: float = None) -> PooledSynthesizer:
+        """
+        Lease a synthesizer, blocking while the pool is exhausted. It may also refresh the token or reconnect the
+        synthesizer, so call it off the event loop, or use acquire_async.
+        """
+        with self._available:
+            while not (taken := self._take())[0]:
+                if not self._available.wait(timeout):
+                    raise TimeoutError("No synthesizer was released in time")
+        return self._prepare(taken[1])
+
+    async def acquire_async(self) -> PooledSynthesizer:
+        """Lease a synthesizer, waiting on the event loop rather than on an executor thread while the pool is exhausted."""
+        loop = asyncio.get_running_loop()
+        while True:
+            with self._lock:
+                leased, synthesizer = self._take()
+                if leased:
+                    break
+                waiter = loop.create_future()
+                self._waiters.append((loop, waiter))
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                with self._lock:
+                    if (loop, waiter) in self._waiters:
+                        self._waiters.remove((loop, waiter))
+                    else:
+                        # woken by a release, pass it on
+                        self._wake()
+                raise
+        future = loop.run_in_executor(None, self._prepare, synthesizer)
+        try:
+            return await asyncio.shield(future)
+        except asyncio.CancelledError:
+            future.add_done_callback(lambda f: f.cancelled() or f.exception() or self.release(f.result()))
+            raise
+
+    def release(self, synthesizer: Optional[PooledSynthesizer]):
+        """Return a leased synthesizer, or None when creating it failed."""
+        with self._lock:
+            self.leased -= 1
+            if synthesizer is not None:
+                synthesizer.idle_since = time.monotonic()
+                self._idle.append(synthesizer)
+            self._wake()
+
+
+_synthesizer_pools = {}
+_synthesizer_pools_lock = threading.Lock()
+
+
+def get_synthesizer_pool(voice: str, endpoint_id: str, endpoint: str, min_size: int = TTS_POOL_MIN_SIZE) -> SynthesizerPool:
+    """The process-wide pool of the voice and endpoint, created and connected on first use."""
+    key = (voice, endpoint_id, endpoint)
+    with _synthesizer_pools_lock:
+        pool = _synthesizer_pools.get(key)
+        if pool is None:
+            if SPEECH_KEY:
+                speech_config = speechsdk.SpeechConfig(subscription=SPEECH_KEY, endpoint=endpoint)
+            else:
+                speech_config = speechsdk.SpeechConfig(endpoint=endpoint)
+            speech_config.speech_synthesis_voice_name = voice
+            speech_config.endpoint_id = endpoint_id
+            speech_config.set_speech_synthesis_output_format(speechsdk.SpeechSynthesisOutputFormat.Raw24Khz16BitMonoPcm)
+            pool = _synthesizer_pools[key] = SynthesizerPool(speech_config, min_size, max(min_size, TTS_POOL_MAX_SIZE))
+        return pool
+
+
 class Client:
-    def __init__(self, synthesis_pool_size: int = 2):
+    def __init__(self, synthesis_pool_size: int = TTS_POOL_MIN_SIZE):
         if synthesis_pool_size < 1:
             raise ValueError("synthesis_pool_size must be at least 1")
         self.synthesis_pool_size = synthesis_pool_size
-        self._counter = 0
         self.voice = None
         self.interruption_time = 0
+        self._pumps = set()
 
     def configure(self, voice: str):
         logger.info(f"Configuring voice: {voice}")
@@ -120,29 +584,30 @@ class Client:
 
         self.voice = voice
 
-        endpoint = endpoint=f"wss://{SPEECH_REGION}.{endpoint_prefix}.speech.microsoft.com/cognitiveservices/websocket/{endpoint_version}?debug=3&trafficType=AzureSpeechRealtime"
-
-        if SPEECH_KEY:
-            self.speech_config = speechsdk.SpeechConfig(subscription=SPEECH_KEY, endpoint=endpoint)
-        else:
-            auth_token = f"aad#{SPEECH_RESOURCE_ID}#{token_provider()}"
-            self.speech_config = speechsdk.SpeechConfig(endpoint=endpoint)
-        self.speech_config.speech_synthesis_voice_name = voice
-        self.speech_config.endpoint_id = self.endpoint_id
-        self.speech_config.set_speech_synthesis_output_format(speechsdk.SpeechSynthesisOutputFormat.Raw24Khz16BitMonoPcm)
-        self.speech_synthesizers = [speechsdk.SpeechSynthesizer(speech_config=self.speech_config, audio_config=None) for _ in range(self.synthesis_pool_size)]
-        for s in self.speech_synthesizers:
-            s.synthesis_started.connect(lambda evt: logger.info(f"Synthesis started: {evt.result.reason}"))
-            s.synthesis_completed.connect(lambda evt: logger.info(f"Synthesis completed: {evt.result.reason}"))
-            s.synthesis_canceled.connect(lambda evt: logger.error(f"Synthesis canceled: {evt.result.reason}"))
-            if not SPEECH_KEY:
-                s.authorization_token = auth_token
+        endpoint = f"wss://{SPEECH_REGION}.{endpoint_prefix}.speech.microsoft.com/cognitiveservices/websocket/{endpoint_version}?debug=3&trafficType=AzureSpeechRealtime"
+        # sessions with the same voice share pre-connected synthesizers, the first one connects them, so
+        # configure() blocks and is called off the event loop
+        self.pool = get_synthesizer_pool(voice, self.endpoint_id, endpoint, min_size=self.synthesis_pool_size)
 
     def interrupt(self):
         self.interruption_time = time.time()
+        for pump in list(self._pumps):
+            pump.cancel()
+
+    def _read_audio(self, stream: speechsdk.AudioDataStream, aio_stream: AioOutputStream,
+                    synthesizer: "PooledSynthesizer"):
+        pump = AudioPump(stream, aio_stream, synthesizer.synthesizer)
+        self._pumps.add(pump)
+
+        def on_done(_):
+            self._pumps.discard(pump)
+            # the stream has ended, so the synthesizer is idle
+            self.pool.release(synthesizer)
+
+        pump.done.add_done_callback(on_done)
+        pump.start()
 
-    def text_to_speech(self, voice: str, speed: str = "medium") -> Tuple[InputTextStream, AioOutputStream]:
-        start_time = time.time()
+    async def text_to_speech(self, voice: str, speed: str = "medium") -> Tuple[InputTextStream, AioOutputStream]:
         if self.endpoint_id:
             # CNV does not support input streaming
             return self.text_to_speech_non_streaming(voice, speed)
@@ -150,107 +615,46 @@ class Client:
         synthesis_request = speechsdk.SpeechSynthesisRequest(
             input_type=speechsdk.SpeechSynthesisRequestInputType.TextStream)
         # synthesis_request.rate = speed
-        self._counter = (self._counter + 1) % len(self.speech_synthesizers)
-        current_synthesizer = self.speech_synthesizers[self._counter]
-
-        result = current_synthesizer.start_speaking(synthesis_request)
+        current_synthesizer = await self.pool.acquire_async()
+        result = await asyncio.get_running_loop().run_in_executor(
+            None, self._start_speaking, current_synthesizer, synthesis_request)
         stream = speechsdk.AudioDataStream(result)
         aio_stream = AioOutputStream()
-        async def read_from_data_stream():
-            leading_silence_skipped = False
-            silence_detection_frames_size = int(50 * 24000 * 2 / 1000)  # 50 ms
-            loop = asyncio.get_running_loop()
-            while True:
-                if not leading_silence_skipped:
-                    if stream.position >= 3 * silence_detection_frames_size:
-                        leading_silence_skipped = True
-                        continue
-                    frame_data = bytes(silence_detection_frames_size)
-                    lenx = await loop.run_in_executor(None, stream.read_data, frame_data)
-                    if lenx == 0:
-                        if stream.status != speechsdk.StreamStatus.AllData:
-                            logger.error(f"Speech synthesis failed: {stream.status}, details: {stream.cancellation_details.error_details}")
-                        break
-                    energy = await loop.run_in_executor(None, calculate_energy, frame_data)
-                    if energy < 500:
-                        logger.info("Silence detected, skipping")
-                        continue
-                    leading_silence_skipped = True
-                    stream.position = stream.position - silence_detection_frames_size
-                chunk = bytes(2400*4)
-                read = await loop.run_in_executor(None, stream.read_data, chunk)
-                if read == 0:
-                    break
-                if start_time < self.interruption_time:
-                    logger.warning("Interruption detected, stopping synthesis")
-                    break
-                aio_stream.write_data(chunk[:read])
-            if stream.status == speechsdk.StreamStatus.Canceled:
-                logger.error(f"Speech synthesis failed: {stream.status}, details: {stream.cancellation_details.error_details}")
-            aio_stream.end_of_stream()
-
-        asyncio.create_task(read_from_data_stream())
+        self._read_audio(stream, aio_stream, current_synthesizer)
         return InputTextStreamFromSDK(synthesis_request.input_stream), aio_stream
 
     def text_to_speech_non_streaming(self, voice: str, speed: str = "medium") -> Tuple[InputTextStream, AioOutputStream]:
         """
         This method is to support non-streaming TTS synthesis. e.g., CNV
         """
-        start_time = time.time()
         logger.warning("non-streaming TTS synthesis is being used")
         logger.info(f"Synthesizing text with voice: {voice}")
-        self._counter = (self._counter + 1) % len(self.speech_synthesizers)
-        current_synthesizer = self.speech_synthesizers[self._counter]
-
         input_stream = InputTextStreamFromQueue()
         aio_stream = AioOutputStream()
-        async def read_from_data_stream():
-            inputs = []
-            async for chunk in input_stream:
-                inputs.append(chunk)
-            result = current_synthesizer.start_speaking_text("".join(inputs))
-            stream = speechsdk.AudioDataStream(result)
-            leading_silence_skipped = False
-            silence_detection_frames_size = int(50 * 24000 * 2 / 1000)  # 50 ms
-            loop = asyncio.get_running_loop()
-            while True:
-                if not leading_silence_skipped:
-                    if stream.position >= 3 * silence_detection_frames_size:
-                        leading_silence_skipped = True
-                        continue
-                    frame_data = bytes(silence_detection_frames_size)
-                    lenx = await loop.run_in_executor(None, stream.read_data, frame_data)
-                    if lenx == 0:
-                        if stream.status != speechsdk.StreamStatus.AllData:
-                            logger.error(f"Speech synthesis failed: {stream.status}, details: {stream.cancellation_details.error_details}")
-                        break
-                    energy = await loop.run_in_executor(None, calculate_energy, frame_data)
-                    if energy < 500:
-                        logger.info("Silence detected, skipping")
-                        continue
-                    leading_silence_skipped = True
-                    stream.position = stream.position - silence_detection_frames_size
-                chunk = bytes(2400*4)
-                read = await loop.run_in_executor(None, stream.read_data, chunk)
-                if read == 0:
-                    break
-                if start_time < self.interruption_time:
-                    logger.warning("Interruption detected, stopping synthesis")
-                    break
-                aio_stream.write_data(chunk[:read])
-            if stream.status == speechsdk.StreamStatus.Canceled:
-                logger.error(f"Speech synthesis failed: {stream.status}, details: {stream.cancellation_details.error_details}")
-            aio_stream.end_of_stream()
-
-        asyncio.create_task(read_from_data_stream())
+        # sentences are synthesized on their own pooled synthesizers while the previous ones play
+        synthesis = SegmentedSynthesis(input_stream, aio_stream, self._lease_synthesizer)
+        self._pumps.add(synthesis)
+        synthesis.done.add_done_callback(lambda _: self._pumps.discard(synthesis))
+        synthesis.start()
         return input_stream, aio_stream
 
+    def _start_speaking(self, synthesizer: PooledSynthesizer, synthesis_request: speechsdk.SpeechSynthesisRequest):
+        try:
+            return synthesizer.synthesizer.start_speaking(synthesis_request)
+        except Exception:
+            self.pool.release(synthesizer)
+            raise
+
+    async def _lease_synthesizer(self) -> Tuple[speechsdk.SpeechSynthesizer, Callable[[], None]]:
+        synthesizer = await self.pool.acquire_async()
+        return synthesizer.synthesizer, lambda: self.pool.release(synthesizer)
+
 if __name__ == "__main__":
     async def main():
         logging.basicConfig(level=logging.INFO)
         client = Client()
         print("client", client)
-        input, output = client.text_to_speech("en-US-Andrew:DragonHDLatestNeural")
+        input, output = await client.text_to_speech("en-US-Andrew:DragonHDLatestNeural")
 
         async def read_output():
             audio = b''
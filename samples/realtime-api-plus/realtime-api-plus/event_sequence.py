@@ -0,0 +1,85 @@
+# Copyright (c) Microsoft. All rights reserved.
+# Licensed under the MIT license. See LICENSE.md file in the project root for full license information.
+
+"""
+Event IDs of the server events of a session, and optional timestamps and tracing of the events.
+
+IDs are a random prefix per session and a counter, e.g. `event_3f9a1c7e_42`: unique, ordered within the
+session and much cheaper than a uuid4 per audio delta. With EVENT_TIMESTAMPS each event gets the time it was
+queued, `server_timestamp_ms` in ms since the epoch. With EVENT_TRACING the time from queueing to sending each
+event is recorded per event type and logged when the session ends.
+"""
+
+import itertools
+import logging
+import os
+import secrets
+import time
+
+logger = logging.getLogger(__name__)
+
+EVENT_TIMESTAMPS = os.environ.get("EVENT_TIMESTAMPS", "").lower() in ("1", "true")
+EVENT_TRACING = os.environ.get("EVENT_TRACING", "").lower() in ("1", "true")
+
+_TYPE_KEY = '"type":"'
+
+
+class TracedEvent(str):
+    """A serialized event with the time it was queued, sent as is."""
+
+    def __new__(cls, message: str, queued_at: float):
+        event = super().__new__(cls, message)
+        event.queued_at = queued_at
+        return event
+
+
+class EventTrace:
+    """Count, total and max of the time from queueing to sending, per event type."""
+
+    def __init__(self):
+        # event type: [count, total seconds, max seconds]
+        self.latencies = {}
+
+    def sent(self, message: str):
+        if not isinstance(message, TracedEvent):
+            return
+        latency = time.perf_counter() - message.queued_at
+        # the type follows the event ID at the start of the serialized event
+        start = message.find(_TYPE_KEY) + len(_TYPE_KEY)
+        event_type = message[start:message.find('"', start)] if start >= len(_TYPE_KEY) else "unknown"
+        entry = self.latencies.get(event_type)
+        if entry is None:
+            entry = self.latencies[event_type] = [0, 0.0, 0.0]
+        entry[0] += 1
+        entry[1] += latency
+        entry[2] = max(entry[2], latency)
+
+    def log(self, session_id: str):
+        for event_type, (count, total, longest) in sorted(self.latencies.items()):
+            logger.info(f"Session {session_id} {event_type}: {count} events, queue to send "
+                        f"mean {total / count * 1000:.1f} ms, max {longest * 1000:.1f} ms")
+
+
+class EventSequence:
+    def __init__(self, timestamps: bool = EVENT_TIMESTAMPS, tracing: bool = EVENT_TRACING):
+        self.session_id = secrets.token_hex(4)
+        self._prefix = f"event_{self.session_id}_"
+        self._counter = itertools.count(1)
+        self.timestamps = timestamps
+        self.trace = EventTrace() if tracing else None
+
+    def next_id(self) -> str:
+        return self._prefix + str(next(self._counter))
+
+    @property
+    def stamps(self) -> bool:
+        """Whether queued events go through stamp()."""
+        return self.timestamps or self.trace is not None
+
+    def stamp(self, message: str) -> str:
+        """Add the server timestamp and the tracing time to a serialized event as it is queued."""
+        if self.timestamps:
+            message = f'{message[:-1]},"server_timestamp_ms":{time.time_ns() // 1_000_000}}}'
+        if self.trace is not None:
+            message = TracedEvent(message, time.perf_counter())
+        return message
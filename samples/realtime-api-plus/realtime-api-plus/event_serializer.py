@@ -0,0 +1,120 @@
+# Copyright (c) Microsoft. All rights reserved.
+# Licensed under the MIT license. See LICENSE.md file in the project root for full license information.
+
+"""
+Fast serialization of the high frequency events: audio and transcript deltas and input audio buffer events
+sent to the client, and input_audio_buffer.append sent upstream for binary input audio.
+
+Each event type is serialized by a precomputed JSON template instead of a pydantic model. The templates are
+derived from the rtclient models once at import time, so the output is byte identical to
+`model_dump_json(exclude_none=True)` of the model. Low frequency events keep using the models.
+"""
+
+import binascii
+import json
+import re
+from typing import Dict, List, Optional, Type
+
+from pydantic import BaseModel
+from rtclient import models as rt_models
+
+# int placeholders are recognized by value, they are far out of range of real indexes and offsets
+_INT_PLACEHOLDER_BASE = 987654000
+
+
+def _escape(value: str) -> str:
+    # same escaping as pydantic: quote, backslash and control characters, non ASCII text as is
+    if value.isascii() and value.isprintable() and '"' not in value and "\\" not in value:
+        return value
+    return json.dumps(value, ensure_ascii=False)[1:-1]
+
+
+class EventTemplate:
+    """
+    JSON of one event type with slots for the given fields, in their order in `fields`. Other fields of the
+    model must have defaults, e.g. `type`. String slots are inside the quotes, so render() takes the raw text.
+    """
+
+    def __init__(self, model: Type[BaseModel], fields: Dict[str, type]):
+        self.fields = list(fields)
+        sample = {}
+        for i, (name, kind) in enumerate(fields.items()):
+            sample[name] = f"@@{name}@@" if kind is str else _INT_PLACEHOLDER_BASE + i
+        dumped = model(**sample).model_dump_json(exclude_none=True)
+        pattern = "|".join(re.escape(str(value)) for value in sample.values())
+        slots: List[int] = []
+
+        def slot(match: re.Match) -> str:
+            name = next(name for name, value in sample.items() if str(value) == match.group(0))
+            slots.append(self.fields.index(name))
+            return "\0"
+
+        literal = re.sub(pattern, slot, dumped)
+        if sorted(slots) != list(range(len(self.fields))):
+            raise ValueError(f"Cannot build a template for {model.__name__} from {dumped}")
+        parts = literal.replace("{", "{{").replace("}", "}}").split("\0")
+        self.format = parts[0] + "".join(f"{{{index}}}{part}" for index, part in zip(slots, parts[1:]))
+
+    def render(self, *values) -> str:
+        return self.format.format(*values)
+
+
+_audio_delta = EventTemplate(rt_models.ResponseAudioDeltaMessage, {
+    "event_id": str, "response_id": str, "item_id": str, "output_index": int, "content_index": int, "delta": str})
+_transcript_delta = EventTemplate(rt_models.ResponseAudioTranscriptDeltaMessage, {
+    "event_id": str, "response_id": str, "item_id": str, "output_index": int, "content_index": int, "delta": str})
+_speech_started = EventTemplate(rt_models.InputAudioBufferSpeechStartedMessage, {
+    "event_id": str, "audio_start_ms": int, "item_id": str})
+_speech_stopped = EventTemplate(rt_models.InputAudioBufferSpeechStoppedMessage, {
+    "event_id": str, "audio_end_ms": int, "item_id": str})
+_audio_append = EventTemplate(rt_models.InputAudioBufferAppendMessage, {"audio": str})
+_committed = EventTemplate(rt_models.InputAudioBufferCommittedMessage, {
+    "event_id": str, "previous_item_id": str, "item_id": str})
+
+
+def audio_append(audio: bytes) -> str:
+    """The input_audio_buffer.append client event for raw PCM audio."""
+    return _audio_append.render(binascii.b2a_base64(audio, newline=False).decode("ascii"))
+
+
+async def send_audio_append(client, message: str):
+    """
+    Send a serialized input_audio_buffer.append event upstream as is, through an rtclient RTClient.
+    rtclient only sends models, so this is the one place which writes to the WebSocket of its low level client.
+    Without that WebSocket, the audio is decoded and sent with the public send_audio().
+    """
+    ws = getattr(getattr(client, "_client", None), "ws", None)
+    if ws is None:
+        await client.send_audio(binascii.a2b_base64(json.loads(message)["audio"]))
+        return
+    await ws.send_str(message)
+
+
+def audio_delta(event_id: str, response_id: str, item_id: str, output_index: int, content_index: int,
+                audio: bytes) -> str:
+    # base64 has no characters to escape
+    delta = binascii.b2a_base64(audio, newline=False).decode("ascii")
+    return _audio_delta.render(_escape(event_id), _escape(response_id), _escape(item_id), int(output_index),
+                               int(content_index), delta)
+
+
+def transcript_delta(event_id: str, response_id: str, item_id: str, output_index: int, content_index: int,
+                     delta: str) -> str:
+    return _transcript_delta.render(_escape(event_id), _escape(response_id), _escape(item_id), int(output_index),
+                                    int(content_index), _escape(delta))
+
+
+def speech_started(event_id: str, audio_start_ms: int, item_id: str) -> str:
+    return _speech_started.render(_escape(event_id), int(audio_start_ms), _escape(item_id))
+
+
+def speech_stopped(event_id: str, audio_end_ms: int, item_id: str) -> str:
+    return _speech_stopped.render(_escape(event_id), int(audio_end_ms), _escape(item_id))
+
+
+def committed(event_id: str, item_id: str, previous_item_id: Optional[str]) -> str:
+    if previous_item_id is None:
+        # excluded from the JSON, a different layout, and only once per utterance
+        return rt_models.InputAudioBufferCommittedMessage(
+            event_id=event_id, item_id=item_id, previous_item_id=previous_item_id).model_dump_json(exclude_none=True)
+    return _committed.render(_escape(event_id), _escape(previous_item_id), _escape(item_id))
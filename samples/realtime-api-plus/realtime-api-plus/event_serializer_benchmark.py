@@ -0,0 +1,98 @@
+# Copyright (c) Microsoft. All rights reserved.
+# Licensed under the MIT license. See LICENSE.md file in the project root for full license information.
+
+"""
+Events per second on one core of the rtclient models and of event_serializer, after checking that both
+produce the same JSON. Run from this folder:
+
+    python event_serializer_benchmark.py --seconds 2
+"""
+
+import argparse
+import base64
+import os
+import time
+
+from rtclient import models as rt_models
+
+import event_serializer
+
+EVENT_ID = "event_AIsUqs9MsJYCeO1U0rGEY"
+RESPONSE_ID = "resp_AIsUqs9MsJYCeO1U0rGEY"
+ITEM_ID = "item_AIsUqs9MsJYCeO1U0rGEY"
+# 200 ms of 24 kHz 16 bit audio, the chunk size of the TTS clients
+AUDIO = os.urandom(9600)
+TRANSCRIPT = 'He said "hello" \\ and left.\n'
+
+
+def model_audio_delta():
+    return rt_models.ResponseAudioDeltaMessage(
+        event_id=EVENT_ID, response_id=RESPONSE_ID, item_id=ITEM_ID, output_index=0, content_index=0,
+        delta=base64.b64encode(AUDIO)).model_dump_json(exclude_none=True)
+
+
+def fast_audio_delta():
+    return event_serializer.audio_delta(EVENT_ID, RESPONSE_ID, ITEM_ID, 0, 0, AUDIO)
+
+
+def model_transcript_delta():
+    return rt_models.ResponseAudioTranscriptDeltaMessage(
+        event_id=EVENT_ID, response_id=RESPONSE_ID, item_id=ITEM_ID, output_index=0, content_index=0,
+        delta=TRANSCRIPT).model_dump_json(exclude_none=True)
+
+
+def fast_transcript_delta():
+    return event_serializer.transcript_delta(EVENT_ID, RESPONSE_ID, ITEM_ID, 0, 0, TRANSCRIPT)
+
+
+def model_speech_started():
+    return rt_models.InputAudioBufferSpeechStartedMessage(
+        event_id=EVENT_ID, audio_start_ms=1234, item_id=ITEM_ID).model_dump_json(exclude_none=True)
+
+
+def fast_speech_started():
+    return event_serializer.speech_started(EVENT_ID, 1234, ITEM_ID)
+
+
+def model_committed():
+    return rt_models.InputAudioBufferCommittedMessage(
+        event_id=EVENT_ID, item_id=ITEM_ID, previous_item_id=RESPONSE_ID).model_dump_json(exclude_none=True)
+
+
+def fast_committed():
+    return event_serializer.committed(EVENT_ID, ITEM_ID, RESPONSE_ID)
+
+
+BENCHMARKS = {
+    "response.audio.delta": (model_audio_delta, fast_audio_delta),
+    "response.audio_transcript.delta": (model_transcript_delta, fast_transcript_delta),
+    "input_audio_buffer.speech_started": (model_speech_started, fast_speech_started),
+    "input_audio_buffer.committed": (model_committed, fast_committed),
+}
+
+
+def events_per_second(serialize, seconds: float) -> float:
+    count = 0
+    start = time.perf_counter()
+    deadline = start + seconds
+    while time.perf_counter() < deadline:
+        for _ in range(100):
+            serialize()
+        count += 100
+    return count / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark of the fast event serializer")
+    parser.add_argument("--seconds", type=float, default=2, help="duration of each measurement")
+    args = parser.parse_args()
+    for event_type, (model, fast) in BENCHMARKS.items():
+        if model() != fast():
+            raise AssertionError(f"{event_type} differs:\n{model()[:200]}\n{fast()[:200]}")
+        before = events_per_second(model, args.seconds)
+        after = events_per_second(fast, args.seconds)
+        print(f"{event_type:>34}: {before:>10,.0f} -> {after:>10,.0f} events/s per core ({after / before:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -10,6 +10,7 @@ from rtclient import models as rt_models
 from azure.identity.aio import DefaultAzureCredential
 from azure.core.credentials import AzureKeyCredential
 from realtime_audio_session_handler import RealtimeAudioSessionHandler
+import event_serializer
 import rtclient
 from azure_avatar import Client as AzureAvatarClient
 from data_models import Session
@@ -61,6 +62,10 @@ class GPT4oAzureAvatarClient:
     async def send_audio(self, audio_message: rt_models.InputAudioBufferAppendMessage):
         return await self._rt_client._client.send(audio_message)
 
+    async def send_audio_raw(self, message: str):
+        # an input_audio_buffer.append event in JSON, forwarded without validation
+        return await event_serializer.send_audio_append(self._rt_client, message)
+
     async def send_item(self, item: rt_models.Item, previous_item_id: str):
         return await self._rt_client.send_item(item, previous_item_id)
 
@@ -89,7 +94,7 @@ class GPT4oAzureAvatarClient:
                 audio_content_part = rt_models.ResponseItemAudioContentPart(
                     transcript=""
                 )
-                tts_input, tts_output = self._tts_client.text_to_speech(voice=self._voice)
+                tts_input, tts_output = await self._tts_client.text_to_speech(voice=self._voice)
                 await self._realtime_handler.on_response_content_part_added(response_id, item_id, m.content_index, audio_content_part)
                 async def receive_tts_output():
                     async for a in tts_output:
@@ -162,5 +167,6 @@ class GPT4oAzureAvatarClient:
         )
 
     async def close(self):
+        await self._tts_client.interrupt()
         self._tts_client.close()
         await self._rt_client.close()
@@ -10,6 +10,7 @@ from rtclient import models as rt_models
 from azure.identity.aio import DefaultAzureCredential
 from azure.core.credentials import AzureKeyCredential
 from realtime_audio_session_handler import RealtimeAudioSessionHandler
+import event_serializer
 import rtclient
 from azure_tts import Client as AzureTTSClient
 endpoint = os.getenv("AZURE_OPENAI_ENDPOINT")
@@ -36,7 +37,8 @@ class GPT4oAzureVoiceClient:
 
     async def configure(self, session_config: rt_models.SessionUpdateParams):
         self._voice = session_config.voice or "en-US-AvaNeural"
-        self._tts_client.configure(voice=self._voice)
+        # the first session of a voice connects its synthesizer pool
+        await asyncio.get_running_loop().run_in_executor(None, self._tts_client.configure, self._voice)
         return await self._client.configure(
             model=session_config.model,
             modalities=set(['text']),
@@ -54,6 +56,10 @@ class GPT4oAzureVoiceClient:
     async def send_audio(self, audio_message: rt_models.InputAudioBufferAppendMessage):
         return await self._client._client.send(audio_message)
 
+    async def send_audio_raw(self, message: str):
+        # an input_audio_buffer.append event in JSON, forwarded without validation
+        return await event_serializer.send_audio_append(self._client, message)
+
     async def send_item(self, item: rt_models.Item, previous_item_id: str):
         return await self._client.send_item(item, previous_item_id)
 
@@ -79,7 +85,7 @@ class GPT4oAzureVoiceClient:
                 audio_content_part = rt_models.ResponseItemAudioContentPart(
                     transcript=""
                 )
-                tts_input, tts_output = self._tts_client.text_to_speech(voice=self._voice)
+                tts_input, tts_output = await self._tts_client.text_to_speech(voice=self._voice)
                 await self._realtime_handler.on_response_content_part_added(response_id, item_id, m.content_index, audio_content_part)
                 async def receive_tts_output():
                     async for a in tts_output:
@@ -152,5 +158,7 @@ class GPT4oAzureVoiceClient:
         )
 
     async def close(self):
+        # stops the syntheses in progress, which returns their synthesizers to the pool
+        self._tts_client.interrupt()
         await self._client.close()
         # await self._realtime_handler.on_close()
\ No newline at end of file
@@ -11,8 +11,9 @@ import aiohttp
 import rtclient
 from azure.core.credentials import AzureKeyCredential
 from azure.identity.aio import DefaultAzureCredential
-from azure_avatar import Client as AzureAvatarClient
+from azure_avatar import ice_server_cache
 from data_models import Session
+import event_serializer
 from realtime_audio_session_handler import RealtimeAudioSessionHandler
 from rtclient import RTClient
 from rtclient import models as rt_models
@@ -29,8 +30,6 @@ if enable_avatar and not avatar_service_host:
 if not avatar_service_host.startswith("ws"):
     avatar_service_host = f"wss://{avatar_service_host}"
 
-ice_servers = [None]
-
 
 class GPT4OClient:
     def __init__(
@@ -91,16 +90,18 @@ class GPT4OClient:
             max_response_output_tokens=session_config.max_response_output_tokens,
         )
         if enable_avatar:
-            if not ice_servers[0]:
-                ice_servers[0] = await AzureAvatarClient().get_ice_servers()
             response = Session(**response.model_dump())
-            self.ice_server = ice_servers[0]
+            self.ice_server = await ice_server_cache.get()
             response.ice_servers = [self.ice_server]
         return response
 
     async def send_audio(self, audio_message: rt_models.InputAudioBufferAppendMessage):
         return await self._client._client.send(audio_message)
 
+    async def send_audio_raw(self, message: str):
+        # an input_audio_buffer.append event in JSON, forwarded without validation
+        return await event_serializer.send_audio_append(self._client, message)
+
     async def connect_avatar(self, client_description: str) -> str:
         await self.avatar_ws_client.send_json(
             {
@@ -2,9 +2,13 @@
 # Licensed under the MIT license. See LICENSE.md file in the project root for full license information.
 
 import asyncio
-import base64
+import collections
+from typing import Callable, Optional
 from rtclient import models as rt_models
 
+import event_serializer
+from event_sequence import EventSequence
+
 class RealtimeAudioSessionHandler:
     def __init__(self) -> None:
         pass
@@ -65,29 +69,88 @@ class RealtimeAudioSessionHandler:
         raise NotImplementedError
 
 class AsyncMsgQueue:
-    def __init__(self):
-        self.queue = asyncio.Queue()
-
-    async def put(self, frame):
-        await self.queue.put(frame)
+    """
+    Bounded outbound message queue. Messages put with priority=True (e.g. speech started) overtake everything
+    else, the rest keep their order, since realtime clients expect e.g. response.audio.done after the deltas.
+    Audio deltas are bounded separately: when full the oldest queued delta is dropped, so a slow client gets
+    fresh audio, other messages make the producer wait. flush() discards the queued audio of an interrupted turn.
+    `stamp`, if set, is applied to each message as it is queued.
+    """
+
+    def __init__(self, max_messages: int = 256, max_audio: int = 200, stamp: Optional[Callable[[str], str]] = None):
+        self.max_messages = max_messages
+        self.max_audio = max_audio
+        self.stamp = stamp
+        self.dropped_audio = 0
+        self._priority = collections.deque()
+        # (audio, turn_id, message)
+        self._messages = collections.deque()
+        self._audio_count = 0
+        self._not_empty = asyncio.Event()
+        self._not_full = asyncio.Event()
+
+    async def put(self, message, audio: bool = False, turn_id=None, priority: bool = False):
+        if self.stamp is not None:
+            message = self.stamp(message)
+        if priority:
+            self._priority.append(message)
+        elif audio:
+            if self._audio_count >= self.max_audio:
+                self._drop_oldest_audio()
+            self._messages.append((True, turn_id, message))
+            self._audio_count += 1
+        else:
+            while len(self._messages) - self._audio_count >= self.max_messages:
+                self._not_full.clear()
+                await self._not_full.wait()
+            self._messages.append((False, turn_id, message))
+        self._not_empty.set()
 
     async def get(self):
-        return await self.queue.get()
+        while not self._priority and not self._messages:
+            self._not_empty.clear()
+            await self._not_empty.wait()
+        if self._priority:
+            return self._priority.popleft()
+        audio, _, message = self._messages.popleft()
+        if audio:
+            self._audio_count -= 1
+        else:
+            self._not_full.set()
+        return message
+
+    def flush(self, turn_id=None) -> int:
+        """Discard the queued audio of `turn_id`, or all queued audio if None. Returns the number of messages dropped."""
+        kept = collections.deque(
+            entry for entry in self._messages if not entry[0] or (turn_id is not None and entry[1] != turn_id))
+        dropped = len(self._messages) - len(kept)
+        self._messages = kept
+        self._audio_count -= dropped
+        return dropped
 
     def size(self):
-        return self.queue.qsize()
+        return len(self._priority) + len(self._messages)
+
+    def _drop_oldest_audio(self):
+        for i, entry in enumerate(self._messages):
+            if entry[0]:
+                del self._messages[i]
+                self._audio_count -= 1
+                self.dropped_audio += 1
+                return
 
 
 class RealtimeAudioSessionHandlerImpl(RealtimeAudioSessionHandler):
     def __init__(self) -> None:
-        self._output_queue = AsyncMsgQueue()
+        self.events = EventSequence()
+        self._output_queue = AsyncMsgQueue(stamp=self.events.stamp if self.events.stamps else None)
 
     @property
     def output_queue(self):
         return self._output_queue
 
-    def generate_event_id(self):
-        return "event_AIsUqs9MsJYCeO1U0rGEY"
+    def generate_event_id(self) -> str:
+        return self.events.next_id()
 
     async def on_session_created(self, session: rt_models.Session):
         session_created = rt_models.SessionCreatedMessage(
@@ -159,15 +222,10 @@ class RealtimeAudioSessionHandlerImpl(RealtimeAudioSessionHandler):
         await self.output_queue.put(response_content_part_done.model_dump_json(exclude_none=True))
 
     async def on_audio_chunk(self, response_id: str, item_id: str, content_index: str, audio_chunk: bytes):
-        response_audio_delta = rt_models.ResponseAudioDeltaMessage(
-            event_id=self.generate_event_id(),
-            response_id=response_id,
-            item_id=item_id,
-            output_index=0,
-            content_index=content_index,
-            delta=base64.b64encode(audio_chunk)
-        )
-        await self.output_queue.put(response_audio_delta.model_dump_json(exclude_none=True))
+        # the high frequency events are serialized by templates, same JSON as the rtclient models
+        response_audio_delta = event_serializer.audio_delta(
+            self.generate_event_id(), response_id, item_id, 0, content_index, audio_chunk)
+        await self.output_queue.put(response_audio_delta, audio=True, turn_id=item_id)
 
     async def on_audio_done(self, response_id, item_id, content_index):
         response_audio_done = rt_models.ResponseAudioDoneMessage(
@@ -180,40 +238,27 @@ class RealtimeAudioSessionHandlerImpl(RealtimeAudioSessionHandler):
         await self.output_queue.put(response_audio_done.model_dump_json(exclude_none=True))
 
     async def on_transcript_chunk(self, response_id: str, item_id: str, content_index: str, transcript_chunk: str):
-        response_transcript_delta = rt_models.ResponseAudioTranscriptDeltaMessage(
-            event_id=self.generate_event_id(),
-            response_id=response_id,
-            item_id=item_id,
-            output_index=0,
-            content_index=content_index,
-            delta=transcript_chunk
-        )
-        await self.output_queue.put(response_transcript_delta.model_dump_json(exclude_none=True))
+        response_transcript_delta = event_serializer.transcript_delta(
+            self.generate_event_id(), response_id, item_id, 0, content_index, transcript_chunk)
+        await self.output_queue.put(response_transcript_delta)
 
     ## input audio
     async def on_input_audio_buffer_speech_started(self, item_id: str, audio_start_ms: int):
-        input_audio_buffer_speech_started = rt_models.InputAudioBufferSpeechStartedMessage(
-            event_id=self.generate_event_id(),
-            audio_start_ms=audio_start_ms,
-            item_id=item_id
-        )
-        await self.output_queue.put(input_audio_buffer_speech_started.model_dump_json(exclude_none=True))
+        input_audio_buffer_speech_started = event_serializer.speech_started(
+            self.generate_event_id(), audio_start_ms, item_id)
+        # the client stops playback on speech started, audio still queued for it would only be played over the user
+        self.output_queue.flush()
+        await self.output_queue.put(input_audio_buffer_speech_started, priority=True)
 
     async def on_input_audio_buffer_speech_stopped(self, item_id: str, audio_end_ms: int):
-        input_audio_buffer_speech_stopped = rt_models.InputAudioBufferSpeechStoppedMessage(
-            event_id=self.generate_event_id(),
-            audio_end_ms=audio_end_ms,
-            item_id=item_id
-        )
-        await self.output_queue.put(input_audio_buffer_speech_stopped.model_dump_json(exclude_none=True))
+        input_audio_buffer_speech_stopped = event_serializer.speech_stopped(
+            self.generate_event_id(), audio_end_ms, item_id)
+        await self.output_queue.put(input_audio_buffer_speech_stopped)
 
     async def on_input_audio_buffer_committed(self, item_id: str, previous_item_id: str):
-        input_audio_buffer_committed = rt_models.InputAudioBufferCommittedMessage(
-            event_id=self.generate_event_id(),
-            item_id=item_id,
-            previous_item_id=previous_item_id
-        )
-        await self.output_queue.put(input_audio_buffer_committed.model_dump_json(exclude_none=True))
+        input_audio_buffer_committed = event_serializer.committed(
+            self.generate_event_id(), item_id, previous_item_id)
+        await self.output_queue.put(input_audio_buffer_committed)
 
     async def on_conversation_item_input_audio_transcript_completed(self, item_id: str, transcript: str):
         conversation_item_input_audio_transcript_completed = rt_models.ItemInputAudioTranscriptionCompletedMessage(
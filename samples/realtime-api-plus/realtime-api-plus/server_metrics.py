@@ -0,0 +1,96 @@
+# Copyright (c) Microsoft. All rights reserved.
+# Licensed under the MIT license. See LICENSE.md file in the project root for full license information.
+
+"""
+Load metrics of the server processes: open sessions, event loop lag and queued outbound messages.
+
+Each worker writes its values to a slot of an array shared by all workers, so any worker can render the
+metrics of all of them in the Prometheus text format, per worker and aggregated.
+"""
+
+import asyncio
+import os
+import time
+from typing import Callable, Sequence
+
+from aiohttp import web
+
+# pid, sessions, event loop lag in seconds, queued outbound messages
+SLOT_FIELDS = 4
+PID, SESSIONS, EVENT_LOOP_LAG, QUEUE_DEPTH = range(SLOT_FIELDS)
+
+# seconds between two samples of the event loop lag and the queue depth
+SAMPLE_INTERVAL_S = 1.0
+
+
+class ServerMetrics:
+    """
+    Samples the load of this process into `slots[index]`, and renders all slots. `slots` is a flat sequence of
+    SLOT_FIELDS values per worker, a multiprocessing array when there are several workers.
+    """
+
+    def __init__(self, slots: Sequence[float] = None, index: int = 0):
+        self.slots = [0.0] * SLOT_FIELDS if slots is None else slots
+        self.index = index
+        self._offset = index * SLOT_FIELDS
+
+    def _set(self, field: int, value: float):
+        self.slots[self._offset + field] = value
+
+    def attach(self, app: web.Application, sessions: Callable[[], int], queue_depth: Callable[[], int]):
+        """Sample the process while `app` runs, and serve the metrics at /metrics."""
+
+        async def sample(app: web.Application):
+            task = asyncio.create_task(self._sample(sessions, queue_depth))
+            yield
+            task.cancel()
+            # the slot is free for the next worker
+            for field in range(SLOT_FIELDS):
+                self._set(field, 0)
+
+        app.cleanup_ctx.append(sample)
+        app.router.add_get("/metrics", self.handle)
+
+    async def _sample(self, sessions: Callable[[], int], queue_depth: Callable[[], int]):
+        self._set(PID, os.getpid())
+        while True:
+            start = time.monotonic()
+            await asyncio.sleep(SAMPLE_INTERVAL_S)
+            self._set(EVENT_LOOP_LAG, max(0.0, time.monotonic() - start - SAMPLE_INTERVAL_S))
+            self._set(SESSIONS, sessions())
+            self._set(QUEUE_DEPTH, queue_depth())
+
+    def workers(self) -> list:
+        """(index, values) of the running workers."""
+        workers = []
+        for index in range(len(self.slots) // SLOT_FIELDS):
+            values = self.slots[index * SLOT_FIELDS:(index + 1) * SLOT_FIELDS]
+            if values[PID]:
+                workers.append((index, values))
+        return workers
+
+    def render(self) -> str:
+        workers = self.workers()
+        lines = []
+
+        def metric(name: str, help: str, field: int, total: float, aggregate: str):
+            lines.append(f"# HELP realtime_worker_{name} {help}, per worker")
+            lines.append(f"# TYPE realtime_worker_{name} gauge")
+            for index, values in workers:
+                lines.append(f'realtime_worker_{name}{{worker="{index}",pid="{int(values[PID])}"}} {values[field]}')
+            lines.append(f"# HELP realtime_{name} {help}, {aggregate} of all workers")
+            lines.append(f"# TYPE realtime_{name} gauge")
+            lines.append(f"realtime_{name} {total}")
+
+        lines.append("# HELP realtime_workers Running server processes")
+        lines.append("# TYPE realtime_workers gauge")
+        lines.append(f"realtime_workers {len(workers)}")
+        metric("sessions", "Open WebSocket sessions", SESSIONS, sum(values[SESSIONS] for _, values in workers), "sum")
+        metric("event_loop_lag_seconds", "How late a periodic timer ran on the event loop", EVENT_LOOP_LAG,
+               max((values[EVENT_LOOP_LAG] for _, values in workers), default=0.0), "max")
+        metric("queue_depth", "Messages waiting in the outbound queues of the sessions", QUEUE_DEPTH,
+               sum(values[QUEUE_DEPTH] for _, values in workers), "sum")
+        return "\n".join(lines) + "\n"
+
+    async def handle(self, request: web.Request) -> web.Response:
+        return web.Response(text=self.render(), content_type="text/plain", charset="utf-8")
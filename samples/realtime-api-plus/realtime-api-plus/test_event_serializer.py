@@ -0,0 +1,88 @@
+# Copyright (c) Microsoft. All rights reserved.
+# Licensed under the MIT license. See LICENSE.md file in the project root for full license information.
+
+"""
+event_serializer must produce the same JSON as `model_dump_json(exclude_none=True)` of the rtclient models,
+whatever the text. Run from this folder:
+
+    python -m unittest test_event_serializer
+"""
+
+import base64
+import os
+import unittest
+
+from pydantic import BaseModel
+from rtclient import models as rt_models
+
+import event_serializer
+
+TEXTS = [
+    "",
+    "plain text",
+    'He said "hello"',
+    "back\\slash and \\n literally",
+    "tab\tnew line\ncarriage return\r",
+    "control \x00\x01\x08\x0b\x0c\x1f and delete \x7f",
+    "héllo wörld, ñ, ß",
+    "日本語のテキスト。",
+    "emoji 😀👍🏽",
+    "line separators \u2028 \u2029",
+    'mixed "q" \\ \n é 😀 \x1b[0m',
+]
+IDS = ["event_AIsUqs9MsJYCeO1U0rGEY", "item_3f9a1c7e_42", 'id "with" \\ quotes', "idé"]
+
+
+class EventSerializerTest(unittest.TestCase):
+    def assertSameJson(self, model: BaseModel, serialized: str):
+        self.assertEqual(model.model_dump_json(exclude_none=True), serialized)
+
+    def test_transcript_delta(self):
+        for text in TEXTS:
+            for event_id in IDS:
+                with self.subTest(text=text, event_id=event_id):
+                    self.assertSameJson(
+                        rt_models.ResponseAudioTranscriptDeltaMessage(
+                            event_id=event_id, response_id=text, item_id=event_id, output_index=3,
+                            content_index=12345, delta=text),
+                        event_serializer.transcript_delta(event_id, text, event_id, 3, 12345, text))
+
+    def test_audio_delta(self):
+        for audio in (b"", os.urandom(1), os.urandom(9600)):
+            for event_id in IDS:
+                with self.subTest(audio=len(audio), event_id=event_id):
+                    self.assertSameJson(
+                        rt_models.ResponseAudioDeltaMessage(
+                            event_id=event_id, response_id=event_id, item_id=event_id, output_index=0,
+                            content_index=0, delta=base64.b64encode(audio)),
+                        event_serializer.audio_delta(event_id, event_id, event_id, 0, 0, audio))
+
+    def test_audio_append(self):
+        for audio in (b"", os.urandom(3), os.urandom(4800)):
+            with self.subTest(audio=len(audio)):
+                self.assertSameJson(
+                    rt_models.InputAudioBufferAppendMessage(audio=base64.b64encode(audio).decode("ascii")),
+                    event_serializer.audio_append(audio))
+
+    def test_speech_started_and_stopped(self):
+        for item_id in IDS + TEXTS:
+            with self.subTest(item_id=item_id):
+                self.assertSameJson(
+                    rt_models.InputAudioBufferSpeechStartedMessage(event_id=item_id, audio_start_ms=0, item_id=item_id),
+                    event_serializer.speech_started(item_id, 0, item_id))
+                self.assertSameJson(
+                    rt_models.InputAudioBufferSpeechStoppedMessage(
+                        event_id=item_id, audio_end_ms=987654321, item_id=item_id),
+                    event_serializer.speech_stopped(item_id, 987654321, item_id))
+
+    def test_committed(self):
+        for previous_item_id in IDS + TEXTS + [None]:
+            with self.subTest(previous_item_id=previous_item_id):
+                self.assertSameJson(
+                    rt_models.InputAudioBufferCommittedMessage(
+                        event_id=IDS[0], item_id=IDS[2], previous_item_id=previous_item_id),
+                    event_serializer.committed(IDS[0], IDS[2], previous_item_id))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -3,12 +3,15 @@
 
 import asyncio
 import logging
+import os
+import time
 
 import data_models as custom_models
+import event_serializer
 import rtclient
 import rtclient.low_level_client
-from aiohttp import WSMsgType
-from aiohttp.web import Request, WebSocketResponse
+from aiohttp import WSCloseCode, WSMsgType
+from aiohttp.web import Application, Request, WebSocketResponse
 from azure.core.credentials import AzureKeyCredential
 from gpt4o_azure_voice_client import GPT4oAzureVoiceClient
 from gpt4o_azure_avatar_client import GPT4oAzureAvatarClient
@@ -18,6 +21,14 @@ from rtclient import models as rt_models
 
 logger = logging.getLogger(__name__)
 
+# input_audio_buffer.append is the most frequent client event and only forwarded, so it is recognized by its
+# prefix, as serialized by JSON.stringify or json.dumps, and sent upstream without parsing. A frame with another
+# "type" key after the prefix is parsed like any other event, the upstream parser could take the last one.
+AUDIO_APPEND_PREFIXES = ('{"type":"input_audio_buffer.append",', '{"type": "input_audio_buffer.append",')
+
+# seconds live sessions may continue on shutdown, after that they are closed and the clients reconnect elsewhere
+DRAIN_TIMEOUT_S = int(os.environ.get("DRAIN_TIMEOUT_S", "25"))
+
 
 class RealtimeAudioSession(RealtimeAudioSessionHandlerImpl):
     def __init__(self, deployment: str = "gpt4o-realtime", gpt4o_endpoint: str = None, aoai_api_key: str = None):
@@ -41,6 +52,9 @@ class RealtimeAudioSession(RealtimeAudioSessionHandlerImpl):
     async def send_audio(self, audio_message: rt_models.InputAudioBufferAppendMessage):
         return await self._client.send_audio(audio_message)
 
+    async def send_audio_raw(self, message: str):
+        return await self._client.send_audio_raw(message)
+
     async def send_item(self, item: rt_models.Item, previous_item_id: str):
         return await self._client.send_item(item, previous_item_id)
 
@@ -63,6 +77,23 @@ class RealtimeAudioSession(RealtimeAudioSessionHandlerImpl):
 class WebSocketServer:
     def __init__(self):
         self._websockets = set()
+        self._sessions = set()
+
+    def session_count(self) -> int:
+        return len(self._sessions)
+
+    def queue_depth(self) -> int:
+        return sum(session.output_queue.size() for session in self._sessions)
+
+    async def drain(self, app: Application):
+        """on_shutdown handler: new connections are refused already, wait for the live sessions to end."""
+        deadline = time.monotonic() + DRAIN_TIMEOUT_S
+        if self._websockets:
+            logger.info(f"Draining {len(self._websockets)} sessions")
+        while self._websockets and time.monotonic() < deadline:
+            await asyncio.sleep(0.5)
+        for ws in list(self._websockets):
+            await ws.close(code=WSCloseCode.GOING_AWAY, message=b"Server shutdown")
 
     async def websocket_handler(self, request: Request):
         # get query params from request
@@ -81,25 +112,35 @@ class WebSocketServer:
         ws = WebSocketResponse()
         await ws.prepare(request)
         self._websockets.add(ws)
+        self._sessions.add(session)
         config = await ws.receive_json()
         logger.info(f"Received config: {config}")
         session_config = custom_models.SessionUpdateParams.model_validate(config.get("session"))
         configure_response = await session.configure(session_config)
         configure_response_message = custom_models.SessionUpdatedMessage(
             session=configure_response,
-            event_id="event_AIsUqs9MsJYCeO1U0rGEY"
+            event_id=session.generate_event_id()
         )
         await ws.send_str(configure_response_message.model_dump_json(exclude_none=True))
         asyncio.gather(session.receive_messages())
 
         async def send_output_message():
+            trace = session.events.trace
             while True:
                 message = await session.output_queue.get()
                 await ws.send_str(message)
+                if trace is not None:
+                    trace.sent(message)
         asyncio.create_task(send_output_message())
 
         async for msg in ws:
-            if msg.type == WSMsgType.TEXT:
+            if (msg.type == WSMsgType.TEXT and msg.data.startswith(AUDIO_APPEND_PREFIXES)
+                    and msg.data.count('"type"') == 1):
+                await session.send_audio_raw(msg.data)
+            elif msg.type == WSMsgType.BINARY:
+                # raw PCM input audio, in the input audio format of the session
+                await session.send_audio_raw(event_serializer.audio_append(msg.data))
+            elif msg.type == WSMsgType.TEXT:
                 payload = msg.json()
                 match payload.get("type"):
                     case "input_audio_buffer.append":
@@ -119,7 +160,7 @@ class WebSocketServer:
                             remote_sdp = await session.connect_avatar(client_description)
                             await ws.send_str(custom_models.AvatarConnectingMessage(
                                 server_description=remote_sdp,
-                                event_id="event_AIsUqs9MsJYCeO1U0rGEY"
+                                event_id=session.generate_event_id()
                             ).model_dump_json(exclude_none=True))
                         asyncio.create_task(connect_avatar())
                     case _:
@@ -127,7 +168,10 @@ class WebSocketServer:
             elif msg.type == WSMsgType.ERROR:
                 break
         await session.close()
+        if session.events.trace is not None:
+            session.events.trace.log(session.events.session_id)
         self._websockets.remove(ws)
+        self._sessions.discard(session)
         return ws
 
 
@@ -0,0 +1,122 @@
+# Copyright (c) Microsoft. All rights reserved.
+# Licensed under the MIT license. See LICENSE.md file in the project root for full license information.
+
+"""
+Runs the server in several processes, so the sessions of one host are spread over its cores.
+
+Each worker binds the port with SO_REUSEPORT and the kernel balances new connections between them. The
+supervisor restarts workers which exit unexpectedly. SIGTERM and SIGINT drain and stop all workers, SIGHUP
+starts new workers and then drains the old ones, e.g. to reload the code or the configuration.
+"""
+
+import logging
+import multiprocessing
+import signal
+import time
+
+from aiohttp import web
+
+from server_metrics import SLOT_FIELDS, ServerMetrics
+
+logger = logging.getLogger(__name__)
+
+# seconds the supervisor waits for a draining worker before it is killed, beyond its own drain timeout
+STOP_GRACE_S = 10
+# a worker which exits this soon after its start is not restarted, e.g. on a configuration error
+STARTUP_S = 5
+
+
+def _graceful_exit(*_):
+    raise web.GracefulExit()
+
+
+def _serve(index: int, slots, host: str, port: int):
+    logging.basicConfig(level=logging.INFO)
+    # the worker ignores SIGHUP, the supervisor reloads by replacing it, and SIGINT of the terminal, it is drained
+    # by the supervisor with SIGTERM instead. run_app would install its own SIGINT handler, so the worker handles
+    # SIGTERM itself
+    signal.signal(signal.SIGHUP, signal.SIG_IGN)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, _graceful_exit)
+    from app import create_app
+    app = create_app(ServerMetrics(slots, index))
+    web.run_app(app, host=host, port=port, reuse_port=True, shutdown_timeout=5, print=None, handle_signals=False)
+
+
+class Supervisor:
+    def __init__(self, workers: int, host: str, port: int):
+        self.workers = workers
+        self.host = host
+        self.port = port
+        self._context = multiprocessing.get_context("spawn")
+        # two slots per worker, the old and the new worker overlap on reload
+        self.slots = self._context.Array("d", 2 * workers * SLOT_FIELDS, lock=False)
+        self._processes = {}
+        self._draining = {}
+        self._reload = False
+        self._stop = False
+
+    def _start(self, index: int):
+        process = self._context.Process(target=_serve, args=(index, self.slots, self.host, self.port),
+                                        name=f"realtime-worker-{index}")
+        process.start()
+        self._processes[index] = (process, time.monotonic())
+        logger.info(f"Started worker {index}, pid {process.pid}")
+
+    def _free_slot(self) -> int:
+        busy = set(self._processes) | set(self._draining)
+        return next(index for index in range(2 * self.workers) if index not in busy)
+
+    def _drain(self, index: int):
+        process, _ = self._processes.pop(index)
+        process.terminate()
+        self._draining[index] = (process, time.monotonic())
+
+    def _clear_slot(self, index: int):
+        # the worker clears its slot on shutdown, unless it was killed
+        for field in range(SLOT_FIELDS):
+            self.slots[index * SLOT_FIELDS + field] = 0
+
+    def run(self):
+        from websocket_server import DRAIN_TIMEOUT_S
+        signal.signal(signal.SIGTERM, lambda *_: setattr(self, "_stop", True))
+        signal.signal(signal.SIGINT, lambda *_: setattr(self, "_stop", True))
+        signal.signal(signal.SIGHUP, lambda *_: setattr(self, "_reload", True))
+        for _ in range(self.workers):
+            self._start(self._free_slot())
+        while self._processes or self._draining:
+            if self._stop:
+                for index in list(self._processes):
+                    self._drain(index)
+            if self._reload:
+                self._reload = False
+                old = list(self._processes)
+                logger.info(f"Reloading {len(old)} workers")
+                for _ in old:
+                    self._start(self._free_slot())
+                for index in old:
+                    self._drain(index)
+            for index, (process, started) in list(self._processes.items()):
+                if process.is_alive():
+                    continue
+                del self._processes[index]
+                self._clear_slot(index)
+                if time.monotonic() - started < STARTUP_S:
+                    logger.error(f"Worker {index} failed to start, exit code {process.exitcode}, stopping")
+                    self._stop = True
+                else:
+                    logger.error(f"Worker {index} exited with {process.exitcode}, restarting it")
+                    self._start(index)
+            for index, (process, since) in list(self._draining.items()):
+                if not process.is_alive():
+                    logger.info(f"Worker {index} stopped")
+                    del self._draining[index]
+                    self._clear_slot(index)
+                elif time.monotonic() - since > DRAIN_TIMEOUT_S + STOP_GRACE_S:
+                    logger.warning(f"Worker {index} did not stop in time, killing it")
+                    process.kill()
+            time.sleep(0.2)
+
+
+def run(workers: int, host: str, port: int):
+    Supervisor(workers, host, port).run()
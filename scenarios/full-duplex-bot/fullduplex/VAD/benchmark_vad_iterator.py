@@ -0,0 +1,118 @@
+"""
+Microbenchmark of the VADIterator buffering path against the previous list-based iterator.
+
+The silero model is replaced by a scripted model so only the buffering and utterance assembly
+cost is measured. Run from the fullduplex folder:
+
+    python VAD/benchmark_vad_iterator.py
+"""
+import argparse
+import copy
+import time
+
+import numpy as np
+import torch
+
+from vad_iterator import VADIterator
+
+
+class ScriptedModel:
+    """Returns a repeating speech/silence pattern instead of running inference."""
+
+    class _Prob(float):
+        def item(self):
+            return float(self)
+
+    def __init__(self, speech_frames: int, silence_frames: int):
+        self.pattern = [self._Prob(0.9)] * speech_frames + [self._Prob(0.05)] * silence_frames
+        self.index = 0
+
+    def reset_states(self):
+        self.index = 0
+
+    def __call__(self, x, sampling_rate):
+        prob = self.pattern[self.index % len(self.pattern)]
+        self.index += 1
+        return prob
+
+
+class LegacyVADIterator:
+    """The list-of-tensors iterator this module replaced, kept here for comparison only."""
+
+    def __init__(self, model, threshold=0.5, sampling_rate=16000, min_silence_duration_ms=100, speech_pad_ms=30):
+        self.model = model
+        self.threshold = threshold
+        self.sampling_rate = sampling_rate
+        self.buffer = []
+        self.start_pad_buffer = []
+        self.min_silence_samples = sampling_rate * min_silence_duration_ms / 1000
+        self.speech_pad_samples = sampling_rate * speech_pad_ms / 1000
+        self.model.reset_states()
+        self.triggered = False
+        self.temp_end = 0
+        self.current_sample = 0
+
+    @torch.no_grad()
+    def __call__(self, x):
+        window_size_samples = len(x)
+        self.current_sample += window_size_samples
+        speech_prob = self.model(x, self.sampling_rate).item()
+        if (speech_prob >= self.threshold) and self.temp_end:
+            self.temp_end = 0
+        if (speech_prob >= self.threshold) and not self.triggered:
+            self.triggered = True
+            self.buffer = copy.deepcopy(self.start_pad_buffer)
+            self.buffer.append(x)
+            return None
+        if (speech_prob < self.threshold - 0.15) and self.triggered:
+            if not self.temp_end:
+                self.temp_end = self.current_sample
+            if self.current_sample - self.temp_end >= self.min_silence_samples:
+                self.temp_end = 0
+                self.triggered = False
+                spoken_utterance = self.buffer
+                self.buffer = []
+                return spoken_utterance
+        if self.triggered:
+            self.buffer.append(x)
+        self.start_pad_buffer.append(x)
+        self.start_pad_buffer = self.start_pad_buffer[-int(self.speech_pad_samples // window_size_samples):]
+        return None
+
+
+def run(iterator_cls, frames, sampling_rate, speech_frames, silence_frames, concatenate):
+    model = ScriptedModel(speech_frames, silence_frames)
+    vad = iterator_cls(model, sampling_rate=sampling_rate, min_silence_duration_ms=150, speech_pad_ms=100)
+    utterances = 0
+    samples = 0
+    start = time.perf_counter()
+    for frame in frames:
+        output = vad(frame)
+        if output is not None and len(output) != 0:
+            # the legacy iterator returns a list of tensors that callers had to concatenate
+            array = np.concatenate(output) if concatenate else output
+            utterances += 1
+            samples += len(array)
+    return time.perf_counter() - start, utterances, samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description="VADIterator buffering microbenchmark")
+    parser.add_argument("--seconds", type=int, default=600, help="seconds of audio to push through the iterator")
+    parser.add_argument("--speech-frames", type=int, default=150, help="speech frames per utterance")
+    parser.add_argument("--silence-frames", type=int, default=30, help="silence frames between utterances")
+    args = parser.parse_args()
+
+    for sampling_rate in (8000, 16000):
+        window = 256 if sampling_rate == 8000 else 512
+        count = args.seconds * sampling_rate // window
+        rng = np.random.default_rng(0)
+        frames = [torch.from_numpy(rng.uniform(-0.5, 0.5, window).astype(np.float32)) for _ in range(count)]
+        for name, cls, concatenate in (("legacy", LegacyVADIterator, True), ("current", VADIterator, False)):
+            elapsed, utterances, samples = run(cls, frames, sampling_rate, args.speech_frames, args.silence_frames, concatenate)
+            print(f"{sampling_rate:>5} Hz {name:>8}: {count / elapsed:>10.0f} frames/s, "
+                  f"{elapsed * 1e6 / count:6.2f} us/frame, {utterances} utterances, {samples} samples")
+
+
+if __name__ == "__main__":
+    main()
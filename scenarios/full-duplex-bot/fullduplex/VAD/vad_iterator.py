@@ -1,8 +1,110 @@
-import copy
 import torch
 import numpy as np
 
 
+class UtteranceBuffer:
+    """
+    Float32 buffer collecting the samples of one utterance after another.
+
+    Utterances are written one after the other into a preallocated array, so appending a frame
+    and handing an utterance over do not allocate on the steady-state path. A new array is only
+    allocated when the current one is full, the earlier utterances keep referring to the old one.
+    """
+
+    def __init__(self, initial_samples: int):
+        self._data = np.empty(initial_samples, dtype=np.float32)
+        # the current utterance is self._data[self._start:self._start + self._size]
+        self._start = 0
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def append(self, frame: np.ndarray):
+        end = self._start + self._size + len(frame)
+        if end > len(self._data):
+            # only the current utterance moves, views of it and of earlier utterances stay valid
+            data = np.empty(max(len(self._data), 2 * (self._size + len(frame))), dtype=np.float32)
+            data[:self._size] = self._data[self._start:self._start + self._size]
+            self._data = data
+            self._start = 0
+            end = self._size + len(frame)
+        self._data[end - len(frame):end] = frame
+        self._size += len(frame)
+
+    def view(self) -> np.ndarray:
+        """
+        Contiguous view of the samples collected so far.
+        Later appends never modify the samples covered by an existing view.
+        """
+        return self._data[self._start:self._start + self._size]
+
+    def detach(self) -> np.ndarray:
+        """
+        Hand the collected samples over to the caller and start an empty utterance after them,
+        so the returned array is never overwritten by the next utterance.
+        """
+        utterance = self.view()
+        self.clear()
+        return utterance
+
+    def clear(self):
+        # the next utterance starts after this one, which may still be referenced by a view
+        self._start += self._size
+        self._size = 0
+
+
+class PreRollBuffer:
+    """
+    Fixed-size circular buffer keeping the most recent samples before speech is detected.
+    """
+
+    def __init__(self, capacity: int):
+        self._data = np.zeros(capacity, dtype=np.float32)
+        self._pos = 0
+        self._filled = 0
+
+    def __len__(self):
+        return self._filled
+
+    def append(self, frame: np.ndarray):
+        capacity = len(self._data)
+        n = len(frame)
+        if capacity == 0:
+            return
+        if n >= capacity:
+            self._data[:] = frame[n - capacity:]
+            self._pos = 0
+            self._filled = capacity
+            return
+        end = self._pos + n
+        if end <= capacity:
+            self._data[self._pos:end] = frame
+        else:
+            head = capacity - self._pos
+            self._data[self._pos:] = frame[:head]
+            self._data[:n - head] = frame[head:]
+        self._pos = end % capacity
+        self._filled = min(capacity, self._filled + n)
+
+    def reset_to(self, samples: np.ndarray):
+        """Keep only the most recent of ``samples``."""
+        self.clear()
+        self.append(samples)
+
+    def copy_to(self, buffer: UtteranceBuffer):
+        """Append the buffered samples, oldest first, to ``buffer``."""
+        if self._filled < len(self._data):
+            buffer.append(self._data[:self._filled])
+        else:
+            buffer.append(self._data[self._pos:])
+            buffer.append(self._data[:self._pos])
+
+    def clear(self):
+        self._pos = 0
+        self._filled = 0
+
+
 class VADIterator:
     def __init__(
         self,
@@ -38,9 +140,6 @@ class VADIterator:
         self.threshold = threshold
         self.sampling_rate = sampling_rate
         self.is_speaking = False
-        self.buffer = []
-        self.start_pad_buffer = []
-
 
         if sampling_rate not in [8000, 16000]:
             raise ValueError(
@@ -50,6 +149,11 @@ class VADIterator:
         self.min_silence_samples = sampling_rate * min_silence_duration_ms / 1000
         self.speech_pad_samples = sampling_rate * speech_pad_ms / 1000
 
+        # utterance samples are collected in one preallocated array (10 s to start with)
+        # and the pre-roll is a ring buffer, so no list of frames is kept per utterance
+        self.buffer = UtteranceBuffer(sampling_rate * 10)
+        self.start_pad_buffer = PreRollBuffer(int(self.speech_pad_samples))
+
         self.reset_states()
 
     def reset_states(self):
@@ -57,24 +161,31 @@ class VADIterator:
         self.triggered = False
         self.temp_end = 0
         self.current_sample = 0
+        # length of the current (or last) utterance up to its last speech frame
+        self.speech_samples = 0
+        self.buffer.clear()
+        self.start_pad_buffer.clear()
 
     @torch.no_grad()
     def __call__(self, x):
         """
-        x: torch.Tensor
-            audio chunk (see examples in repo)
+        x: torch.Tensor or np.ndarray
+            float32 audio chunk (see examples in repo)
 
-        return_seconds: bool (default - False)
-            whether return timestamps in seconds (default - samples)
+        Returns the utterance as a contiguous float32 np.ndarray once the end of speech
+        is detected, otherwise None. The returned array belongs to the caller.
         """
 
-        if not torch.is_tensor(x):
+        if torch.is_tensor(x):
+            frame = x.numpy().reshape(-1)
+        else:
             try:
-                x = torch.Tensor(x)
+                frame = np.asarray(x, dtype=np.float32).reshape(-1)
+                x = torch.from_numpy(frame)
             except Exception:
                 raise TypeError("Audio cannot be casted to tensor. Cast it manually")
 
-        window_size_samples = len(x[0]) if x.dim() == 2 else len(x)
+        window_size_samples = len(frame)
         self.current_sample += window_size_samples
 
         speech_prob = self.model(x, self.sampling_rate).item()
@@ -84,8 +195,10 @@ class VADIterator:
 
         if (speech_prob >= self.threshold) and not self.triggered:
             self.triggered = True
-            self.buffer = copy.deepcopy(self.start_pad_buffer)
-            self.buffer.append(x)
+            self.buffer.clear()
+            self.start_pad_buffer.copy_to(self.buffer)
+            self.buffer.append(frame)
+            self.speech_samples = len(self.buffer)
             return None
 
         if (speech_prob < self.threshold - 0.15) and self.triggered:
@@ -98,18 +211,32 @@ class VADIterator:
                 # end of speak
                 self.temp_end = 0
                 self.triggered = False
-                spoken_utterance = self.buffer
-                self.buffer = []
-                return spoken_utterance
+                utterance = self.buffer.detach()
+                # the pre-roll is not written during speech, its most recent samples are the end of the utterance
+                self.start_pad_buffer.reset_to(utterance)
+                return utterance
 
         if self.triggered:
-            self.buffer.append(x)
-
-        self.start_pad_buffer.append(x)
-        self.start_pad_buffer = self.start_pad_buffer[-int(self.speech_pad_samples//window_size_samples):]
+            self.buffer.append(frame)
+            if speech_prob >= self.threshold:
+                self.speech_samples = len(self.buffer)
+        else:
+            self.start_pad_buffer.append(frame)
 
         return None
 
+    @property
+    def paused(self) -> bool:
+        """Whether speech was detected and is currently in a (possibly final) pause."""
+        return self.triggered and self.temp_end != 0
+
+    def in_progress(self) -> np.ndarray:
+        """
+        View of the utterance collected so far. The view stays valid after further frames
+        are processed, so it can be handed to another thread without copying.
+        """
+        return self.buffer.view()
+
 def int2float(sound):
     """
     Taken from https://github.com/snakers4/silero-vad
@@ -125,6 +252,7 @@ def float2int(sound):
     """
 
     # sound = sound.squeeze()  # depends on the use case
-    sound *= 32768
+    # not in place, the input may be a view shared with the VAD utterance buffer
+    sound = sound * 32768
     sound = np.clip(sound, -32768, 32767)
-    return sound.astype("int16")
\ No newline at end of file
+    return sound.astype("int16")
@@ -0,0 +1,83 @@
+import asyncio
+import time
+
+
+class AudioPacer:
+    """
+    Sends PCM audio to an outbound queue at real-time pace.
+
+    Frames are scheduled against an absolute monotonic clock anchored at the first frame, so
+    sleep overshoot does not accumulate, and are sent up to `lead_ms` ahead of real time so the
+    client buffer absorbs scheduling jitter. `cancel` stops a running `send` immediately.
+    """
+
+    def __init__(self, out_queue, sample_rate: int = 24000, sample_width: int = 2, frame_bytes: int = 1200,
+                 lead_ms: int = 200, turn_id=None, on_first_sent=None):
+        self.out_queue = out_queue
+        # called once the first frame is sent to the client
+        self.on_first_sent = on_first_sent
+        # tags the queued frames, so the queue can flush them on barge-in
+        self.turn_id = turn_id
+        self.frame_bytes = frame_bytes
+        self.bytes_per_s = sample_rate * sample_width
+        self.frame_s = frame_bytes / self.bytes_per_s
+        self.lead_s = lead_ms / 1000
+        # times the client ran out of audio, e.g. because TTS or the event loop stalled
+        self.underruns = 0
+        # frames that were due while the outbound queue still held more than the lead, i.e. the client reads too slowly
+        self.overruns = 0
+        self.cancelled = False
+        self._loop = asyncio.get_running_loop()
+        self._waiter = None
+        self._start = None
+        self._sent_s = 0.0
+
+    @property
+    def sent_ms(self) -> float:
+        return self._sent_s * 1000
+
+    def stats(self) -> dict:
+        return {"sent_ms": int(self.sent_ms), "underruns": self.underruns, "overruns": self.overruns}
+
+    async def send(self, chunk: bytes) -> bool:
+        """Send `chunk` frame by frame, returns False once the pacer is cancelled."""
+        for i in range(0, len(chunk), self.frame_bytes):
+            if self.cancelled:
+                return False
+            now = time.monotonic()
+            if self._start is None:
+                self._start = now
+            elif now > self._start + self._sent_s:
+                # everything sent so far has been played, restart the clock instead of bursting to catch up
+                self.underruns += 1
+                self._start = now - self._sent_s
+            due = self._start + self._sent_s - self.lead_s
+            if now < due:
+                await self._sleep(due - now)
+                if self.cancelled:
+                    return False
+            if self.out_queue.size() * self.frame_s > self.lead_s:
+                self.overruns += 1
+            frame = chunk[i:i + self.frame_bytes]
+            on_sent = self.on_first_sent if self._sent_s == 0 else None
+            await self.out_queue.put(frame, turn_id=self.turn_id, on_sent=on_sent)
+            self._sent_s += len(frame) / self.bytes_per_s
+        return True
+
+    async def _sleep(self, delay: float):
+        self._waiter = self._loop.create_future()
+        handle = self._loop.call_later(delay, self._wake)
+        try:
+            await self._waiter
+        finally:
+            handle.cancel()
+            self._waiter = None
+
+    def _wake(self):
+        if self._waiter is not None and not self._waiter.done():
+            self._waiter.set_result(None)
+
+    def cancel(self):
+        """Stop sending, e.g. on barge-in. Safe to call from any thread."""
+        self.cancelled = True
+        self._loop.call_soon_threadsafe(self._wake)
@@ -1,23 +1,46 @@
+import collections
 import json
 import logging
+import os
 import queue
 import threading
-from typing import Callable
-from requests import Session
-import wave
+import time
+from concurrent.futures import Future
+from typing import Callable, NamedTuple, Optional
 import torch
 import numpy as np
-from io import BytesIO
 
-from VAD.vad_iterator import VADIterator, int2float, float2int
+from fast_transcription_dispatcher import TranscriptionDispatcher, get_dispatcher
+from VAD.vad_iterator import VADIterator, int2float
 
 logger = logging.getLogger(__name__)
 
 
 AzureADTokenProvider = Callable[[], str]
 
+
+def _copy_result(source: Future, target: Future):
+    if source.cancelled():
+        target.cancel()
+    elif source.exception() is not None:
+        target.set_exception(source.exception())
+    else:
+        target.set_result(source.result())
+
+
+class Utterance(NamedTuple):
+    audio: np.ndarray
+    # utterance length up to the last speech frame, identifies how much speech was submitted
+    speech_samples: int
+    # False for speculative submissions of an utterance which is still in progress
+    final: bool = True
+    # time.monotonic() of the end of speech, for final utterances
+    speech_end: Optional[float] = None
+
+
 class VADHandler(threading.Thread):
-    def __init__(self, model, threshold, sampling_rate, min_silence_duration_ms, speech_pad_ms, stop_event, input_queue, output_queue):
+    def __init__(self, model, threshold, sampling_rate, min_silence_duration_ms, speech_pad_ms, stop_event, input_queue, output_queue,
+                 speculative_interval_ms: int = 0):
         super().__init__()
         self.stop_event = stop_event
         self.input_queue = input_queue
@@ -29,6 +52,9 @@ class VADHandler(threading.Thread):
             min_silence_duration_ms=min_silence_duration_ms,
             speech_pad_ms=speech_pad_ms
         )
+        # 0 disables speculative submissions
+        self.speculative_samples = sampling_rate * speculative_interval_ms // 1000
+        self._speculated_samples = 0
 
 
     def run(self) -> None:
@@ -40,69 +66,136 @@ class VADHandler(threading.Thread):
             chunk = np.frombuffer(chunk, dtype=np.int16)
             vad_output = self.vad_iterator(torch.from_numpy(int2float(chunk)))
             if vad_output is not None and len(vad_output) != 0:
-                logger.info(f"VAD output: {len(vad_output)}")
-                array = np.concatenate(vad_output)
-                self.output_queue.put(array)
+                logger.info(f"VAD output: {len(vad_output)} samples")
+                # audio arrives in real time, so speech ended the trailing silence and this chunk ago
+                silence_samples = len(vad_output) - self.vad_iterator.speech_samples + len(chunk)
+                speech_end = time.monotonic() - silence_samples / self.vad_iterator.sampling_rate
+                self.output_queue.put(Utterance(vad_output, self.vad_iterator.speech_samples, speech_end=speech_end))
+                self._speculated_samples = 0
+            elif self.speculative_samples and self.vad_iterator.triggered:
+                self._speculate()
         self.output_queue.put(None)
 
+    def _speculate(self):
+        # submit the utterance so far when a pause starts or every interval of new speech,
+        # but never twice for the same amount of speech
+        speech_samples = self.vad_iterator.speech_samples
+        if speech_samples == self._speculated_samples:
+            return
+        if self.vad_iterator.paused or speech_samples - self._speculated_samples >= self.speculative_samples:
+            self._speculated_samples = speech_samples
+            self.output_queue.put(Utterance(self.vad_iterator.in_progress(), speech_samples, final=False))
+
 
 class AzureFastTranscriptionClient(threading.Thread):
-    def __init__(self, endpoint: str, locale: str, key: str, token_provider: AzureADTokenProvider, stop_event, input_queue, callback):
+    def __init__(self, dispatcher: TranscriptionDispatcher, locale: str, stop_event, input_queue, callback):
         super().__init__()
-        self.endpoint = f"{endpoint}/speechtotext/transcriptions:transcribe?api-version=2024-11-15"
-        self.token_provider = token_provider
-        self.key = key
+        self.dispatcher = dispatcher
         self.stop_event = stop_event
         self.input_queue = input_queue
         self.callback = callback
-        self.session = Session()
-        self.session.get(self.endpoint)
-        self.data = {
-                'definition': json.dumps({
-                    'locales': [locale],
-                    'profanityFilterMode': 'Masked',
-                    'channels': [0]
-                })
-            }
+        self.definition = json.dumps({
+            'locales': [locale],
+            'profanityFilterMode': 'Masked',
+            'channels': [0]
+        })
+        # final transcriptions of this session and the end of their speech, in utterance order; callbacks are
+        # delivered in this order even though the dispatcher may complete them out of order
+        self._pending: collections.deque[tuple[Future, Optional[float]]] = collections.deque()
+        self._pending_lock = threading.Lock()
+        # one thread at a time delivers, the callbacks run without the lock
+        self._delivering = False
+        # only the newest speculative request is kept
+        self._speculation: Optional[tuple[int, Future]] = None
 
     def run(self) -> None:
-        # warm up connection
-        self.session.get(self.endpoint)
         while not self.stop_event.is_set():
-            array = self.input_queue.get()
-            if array is None:
+            utterance = self.input_queue.get()
+            if utterance is None:
                 break
-            if self.token_provider is None:
-                headers = {
-                    'Ocp-Apim-Subscription-Key': self.key
-                }
-            else:
-                headers = {
-                    'Authorization': f'Bearer {self.token_provider()}'
-                }
-            array = float2int(array)
-            # open a memory buffer
-            tmp = BytesIO()
-            with wave.open(tmp, "wb") as wf:
-                wf.setnchannels(1)
-                wf.setsampwidth(2)
-                wf.setframerate(16000)
-                wf.writeframes(array.tobytes())
-
-            files = {
-                'audio': tmp.getbuffer()
-            }
-            response = self.session.post(self.endpoint, headers=headers, files=files, data=self.data)
-            if response.status_code >= 400:
-                print(response.text)
-            if self.callback is not None:
-                self.callback(response.json())
+            if not utterance.final:
+                self._speculate(utterance)
+                continue
+            future = self._speculative_result(utterance) or self.dispatcher.submit(utterance.audio, self.definition)
+            with self._pending_lock:
+                self._pending.append((future, utterance.speech_end))
+            future.add_done_callback(self._deliver)
+
+    def _deliver(self, _: Future):
+        # called on dispatcher threads; a completion during the delivery of another is picked up by that delivery,
+        # so the callbacks keep the utterance order without holding the lock
+        with self._pending_lock:
+            if self._delivering:
+                return
+            self._delivering = True
+        while True:
+            with self._pending_lock:
+                ready = []
+                while self._pending and self._pending[0][0].done():
+                    ready.append(self._pending.popleft())
+                if not ready:
+                    self._delivering = False
+                    return
+            for future, speech_end in ready:
+                if future.cancelled():
+                    continue
+                if future.exception() is not None:
+                    logger.error(f"Fast transcription failed: {future.exception()}")
+                    continue
+                if self.callback is not None:
+                    try:
+                        self.callback(future.result(), speech_end)
+                    except Exception as e:
+                        logger.error(f"Handling the fast transcription failed: {e}")
+
+    def _speculate(self, utterance: Utterance):
+        if self._speculation is not None:
+            # more speech arrived, the older request is stale
+            self._speculation[1].cancel()
+            self._speculation = None
+        # None when the dispatcher keeps its free slots for final requests
+        future = self.dispatcher.submit(utterance.audio, self.definition, speculative=True)
+        if future is not None:
+            self._speculation = (utterance.speech_samples, future)
+
+    def _speculative_result(self, utterance: Utterance) -> Optional[Future]:
+        """
+        Reuse the speculative transcription if no speech was added after it was submitted.
+        The final utterance is only transcribed again if the speculative request fails.
+        """
+        if self._speculation is None:
+            return None
+        speech_samples, speculative = self._speculation
+        self._speculation = None
+        if speech_samples != utterance.speech_samples:
+            speculative.cancel()
+            logger.info("Speculative transcription is stale, submitting the final utterance")
+            return None
+        logger.info("Reusing speculative transcription")
+        result = Future()
+
+        def on_done(f: Future):
+            if not f.cancelled() and f.exception() is None:
+                result.set_result(f.result())
+                return
+            logger.warning("Speculative transcription failed, submitting the final utterance")
+            retry = self.dispatcher.submit(utterance.audio, self.definition)
+            retry.add_done_callback(lambda r: _copy_result(r, result))
+
+        speculative.add_done_callback(on_done)
+        return result
 
 class AzureFastTranscriptionRecognizer:
-    def __init__(self, endpoint: str, token_provider: AzureADTokenProvider = None, key: str = None):
+    def __init__(self, endpoint: str, token_provider: AzureADTokenProvider = None, key: str = None, speculative_interval_ms: int = 0):
+        """
+        speculative_interval_ms: when non-zero, the utterance in progress is transcribed at short pauses
+            and after every speculative_interval_ms of new speech, and the final transcription reuses
+            the speculative result if no speech was added since. Trades extra requests for turn latency.
+        """
         self.endpoint = endpoint
         self.token_provider = token_provider
         self.key = key
+        self.speculative_interval_ms = speculative_interval_ms
         self.audio_queue = queue.Queue()
         self.vad_queue = queue.Queue()
         self.stop_event = threading.Event()
@@ -117,7 +210,8 @@ class AzureFastTranscriptionRecognizer:
             speech_pad_ms=100,
             stop_event=self.stop_event,
             input_queue=self.audio_queue,
-            output_queue=self.vad_queue
+            output_queue=self.vad_queue,
+            speculative_interval_ms=speculative_interval_ms
         )
         self._locale = "en-US"
 
@@ -135,10 +229,10 @@ class AzureFastTranscriptionRecognizer:
 
     def start(self):
         self.recognizer_client = AzureFastTranscriptionClient(
-            endpoint=self.endpoint,
+            dispatcher=get_dispatcher(
+                self.endpoint, key=self.key, token_provider=self.token_provider,
+                max_in_flight=int(os.getenv("FAST_TRANSCRIPTION_MAX_IN_FLIGHT", "8"))),
             locale=self.locale,
-            key=self.key,
-            token_provider=self.token_provider,
             stop_event=self.stop_event,
             input_queue=self.vad_queue,
             callback=self.on_recognized
@@ -168,7 +262,8 @@ class AzureFastTranscriptionRecognizer:
         return self._on_recognized
 
     @on_recognized.setter
-    def on_recognized(self, callback: Callable[[str], None]):
+    def on_recognized(self, callback: Callable[[dict, Optional[float]], None]):
+        """`callback(response, speech_end)`, with the time.monotonic() of the end of speech if known."""
         self._on_recognized = callback
 
 if __name__ == '__main__':
@@ -178,7 +273,7 @@ if __name__ == '__main__':
     recognizer = AzureFastTranscriptionRecognizer(
         endpoint=os.getenv("SPEECH_ENDPOINT"),
         key=os.getenv("SPEECH_KEY"))
-    recognizer.on_recognized = lambda x: print(x)
+    recognizer.on_recognized = lambda response, speech_end: print(response)
     recognizer.start()
     with open("tests/4.wav", "rb") as f:
         f.read(44)
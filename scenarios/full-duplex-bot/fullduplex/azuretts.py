@@ -1,5 +1,9 @@
+import asyncio
+import collections
 import logging
 import os
+import threading
+import time
 import typing
 
 import azure.cognitiveservices.speech as speechsdk
@@ -18,61 +22,306 @@ if not (SPEECH_KEY or SPEECH_RESOURCE_ID):
 
 token_provider = get_bearer_token_provider(DefaultAzureCredential(), "https://cognitiveservices.azure.com/.default")
 
-def calculate_energy(frame_data):
-    # Convert the byte data to a numpy array for easier processing (assuming 16-bit PCM)
-    data = np.frombuffer(frame_data, dtype=np.int16)
-    # Calculate the energy as the sum of squares of the samples
-    energy = np.sum(data**2) / len(data)
-    return energy
+# leading silence is trimmed from the first 150 ms of synthesized audio (24 kHz 16 bit), in 10 ms windows
+SILENCE_LOOKAHEAD_BYTES = int(150 * 24000 * 2 / 1000)
+SILENCE_WINDOW_BYTES = int(10 * 24000 * 2 / 1000)
+# mean square of the samples in a window
+SILENCE_ENERGY_THRESHOLD = 500
 
 
-class Client:
-    def __init__(self, synthesis_pool_size: int = 2):
-        if synthesis_pool_size < 1:
-            raise ValueError("synthesis_pool_size must be at least 1")
+def leading_silence_bytes(data: bytes, size: int = None) -> int:
+    """Length in bytes of the leading silence in the first `size` bytes of 16-bit PCM `data`, in whole windows."""
+    size = len(data) if size is None else size
+    windows = size // SILENCE_WINDOW_BYTES
+    if windows == 0:
+        return 0
+    samples = np.frombuffer(data, dtype=np.int16, count=windows * SILENCE_WINDOW_BYTES // 2).astype(np.int32)
+    # squares of int16 samples fit int32, the sums are taken in int64
+    energy = np.square(samples).reshape(windows, -1).sum(axis=1, dtype=np.int64) / (SILENCE_WINDOW_BYTES // 2)
+    loud = np.flatnonzero(energy >= SILENCE_ENERGY_THRESHOLD)
+    return int(loud[0] if len(loud) else windows) * SILENCE_WINDOW_BYTES
+
+
+class AsyncAudioIterator:
+    """
+    Iterates a blocking audio iterator on a dedicated thread and hands the chunks over to the event loop
+    with call_soon_threadsafe, so reading the SDK audio stream never blocks the loop.
+    """
+
+    def __init__(self, iterator: typing.Iterator[bytes]):
+        self._loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue()
+        self._closed = threading.Event()
+        threading.Thread(target=self._read, args=(iterator,), daemon=True).start()
+
+    def _read(self, iterator: typing.Iterator[bytes]):
+        item = None
+        try:
+            for chunk in iterator:
+                if self._closed.is_set():
+                    break
+                self._loop.call_soon_threadsafe(self._queue.put_nowait, chunk)
+        except Exception as e:
+            item = e
+        finally:
+            # runs the cleanup of a generator which was not exhausted
+            close = getattr(iterator, "close", None)
+            if close is not None:
+                try:
+                    close()
+                except Exception as e:
+                    logging.error(f"Closing the audio stream failed: {e}")
+            try:
+                self._loop.call_soon_threadsafe(self._queue.put_nowait, item)
+            except RuntimeError:
+                # the event loop is already closed
+                pass
+
+    def close(self):
+        """Stop reading after the current chunk."""
+        self._closed.set()
+
+    def __aiter__(self) -> typing.AsyncIterator[bytes]:
+        return self
+
+    async def __anext__(self) -> bytes:
+        item = await self._queue.get()
+        if item is None:
+            raise StopAsyncIteration
+        if isinstance(item, Exception):
+            raise item
+        return item
+
+
+# synthesizers connected at start per process, the pool grows on demand up to TTS_POOL_MAX_SIZE, which is also the
+# number of concurrent syntheses
+TTS_POOL_SIZE = int(os.getenv("TTS_POOL_SIZE", "4"))
+TTS_POOL_MAX_SIZE = int(os.getenv("TTS_POOL_MAX_SIZE", "32"))
+# AAD tokens are valid for 10 minutes
+AUTH_TOKEN_REFRESH_S = 8 * 60
+
+
+class PooledSynthesizer:
+    """A synthesizer with a connection that is opened before the synthesizer is first used."""
+
+    def __init__(self, speech_config: speechsdk.SpeechConfig):
+        self.synthesizer = speechsdk.SpeechSynthesizer(speech_config=speech_config, audio_config=None)
+        self.connection = speechsdk.Connection.from_speech_synthesizer(self.synthesizer)
+        self.connection.disconnected.connect(self._on_disconnected)
+        self.connected = False
+        self._token_time = 0.0
+
+    def _on_disconnected(self, evt):
+        self.connected = False
+
+    def ensure_ready(self):
+        """Refresh the auth token before it expires, and reconnect if the service dropped the connection."""
+        if not SPEECH_KEY and time.monotonic() - self._token_time > AUTH_TOKEN_REFRESH_S:
+            self.synthesizer.authorization_token = f"aad#{SPEECH_RESOURCE_ID}#{token_provider()}"
+            self._token_time = time.monotonic()
+        if not self.connected:
+            self.connection.open(True)
+            self.connected = True
+
+
+class SynthesizerPool:
+    """
+    Pre-connected synthesizers shared by all sessions of the process. A synthesizer is leased for one synthesis.
+    When all of them are busy the pool grows, up to `max_size` synthesizers, and leasing then waits for a release.
+    """
+
+    def __init__(self, size: int = TTS_POOL_SIZE, max_size: int = TTS_POOL_MAX_SIZE):
+        if size < 1:
+            raise ValueError("size must be at least 1")
+        # the v2 endpoint supports both SSML and text stream input
+        endpoint = f"wss://{SPEECH_REGION}.tts.speech.microsoft.com/cognitiveservices/websocket/v2"
         if SPEECH_KEY:
-            self.speech_config = speechsdk.SpeechConfig(subscription=SPEECH_KEY, region=SPEECH_REGION)
+            self.speech_config = speechsdk.SpeechConfig(subscription=SPEECH_KEY, endpoint=endpoint)
         else:
-            auth_token = f"aad#{SPEECH_RESOURCE_ID}#{token_provider()}"
-            self.speech_config = speechsdk.SpeechConfig(endpoint=f"wss://{SPEECH_REGION}.tts.speech.microsoft.com/cognitiveservices/websocket/v1")
+            self.speech_config = speechsdk.SpeechConfig(endpoint=endpoint)
         self.speech_config.set_speech_synthesis_output_format(speechsdk.SpeechSynthesisOutputFormat.Raw24Khz16BitMonoPcm)
-        self.speech_synthesizers = [speechsdk.SpeechSynthesizer(speech_config=self.speech_config, audio_config=None) for _ in range(synthesis_pool_size)]
-        if not SPEECH_KEY:
-            for synthesizer in self.speech_synthesizers:
-                synthesizer.authorization_token = auth_token
-        self._counter = 0
+        self.size = size
+        self.max_size = max(size, max_size)
+        self.leased = 0
+        self._idle = collections.deque()
+        self._lock = threading.Lock()
+        # acquire() waits on the condition, acquire_async() on a future of its event loop
+        self._available = threading.Condition(self._lock)
+        self._waiters = collections.deque()
+        for _ in range(size):
+            synthesizer = PooledSynthesizer(self.speech_config)
+            synthesizer.ensure_ready()
+            self._idle.append(synthesizer)
 
-    def text_to_speech(self, text: str, voice: str, speed: str = "medium") -> typing.Iterator[bytes]:
-        self._counter = (self._counter + 1) % len(self.speech_synthesizers)
-        current_synthesizer = self.speech_synthesizers[self._counter]
-        current_synthesizer.properties.set_property(speechsdk.PropertyId.SpeechServiceConnection_SynthVoice, voice)
-        ssml = f"<speak version='1.0' xmlns='http://www.w3.org/2001/10/synthesis' xml:lang='en-US'><voice name='{voice}'><prosody rate='{speed}'>{text}</prosody></voice></speak>"
-        result = current_synthesizer.start_speaking_ssml(ssml)
-        stream = speechsdk.AudioDataStream(result)
-        first = True
-        leading_silence_skipped = False
-        silence_detection_frames_size = int(50 * 24000 * 2 / 1000)  # 50 ms
+    @property
+    def idle(self) -> int:
+        return len(self._idle)
+
+    def _take(self) -> typing.Tuple[bool, typing.Optional[PooledSynthesizer]]:
+        """
+        With the lock held: (True, an idle synthesizer), (True, None) when a new one is to be created, or
+        (False, None) when all `max_size` synthesizers are leased.
+        """
+        if self._idle:
+            self.leased += 1
+            return True, self._idle.pop()
+        if self.leased < self.max_size:
+            self.leased += 1
+            return True, None
+        return False, None
+
+    def _wake(self):
+        """With the lock held: let one waiter retry after a release."""
+        self._available.notify()
+        if self._waiters:
+            loop, waiter = self._waiters.popleft()
+            loop.call_soon_threadsafe(lambda: waiter.done() or waiter.set_result(None))
+
+    def _prepare(self, synthesizer: typing.Optional[PooledSynthesizer], voice: str) -> PooledSynthesizer:
+        try:
+            if synthesizer is None:
+                logging.info(f"All {self.leased - 1} synthesizers are busy, adding one")
+                synthesizer = PooledSynthesizer(self.speech_config)
+            synthesizer.ensure_ready()
+            synthesizer.synthesizer.properties.set_property(speechsdk.PropertyId.SpeechServiceConnection_SynthVoice, voice)
+        except Exception:
+            self.release(synthesizer)
+            raise
+        return synthesizer
+
+    def acquire(self, voice: str, timeout: float = None) -> PooledSynthesizer:
+        """Lease a synthesizer, blocking while the pool is exhausted. For threads, see acquire_async."""
+        with self._available:
+            while not (taken := self._take())[0]:
+                if not self._available.wait(timeout):
+                    raise TimeoutError("No synthesizer was released in time")
+        return self._prepare(taken[1], voice)
+
+    async def acquire_async(self, voice: str) -> PooledSynthesizer:
+        """Lease a synthesizer, waiting on the event loop rather than on an executor thread while the pool is exhausted."""
+        loop = asyncio.get_running_loop()
         while True:
-            if not leading_silence_skipped:
-                if stream.position >= 3 * silence_detection_frames_size:
-                    leading_silence_skipped = True
-                    continue
-                frame_data = bytes(silence_detection_frames_size)
-                read_len = stream.read_data(frame_data)
-                if read_len == 0:
+            with self._lock:
+                leased, synthesizer = self._take()
+                if leased:
                     break
+                waiter = loop.create_future()
+                self._waiters.append((loop, waiter))
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                with self._lock:
+                    if (loop, waiter) in self._waiters:
+                        self._waiters.remove((loop, waiter))
+                    else:
+                        # woken by a release, pass it on
+                        self._wake()
+                raise
+        # refreshing the token and connecting block, but only briefly
+        future = loop.run_in_executor(None, self._prepare, synthesizer, voice)
+        try:
+            return await asyncio.shield(future)
+        except asyncio.CancelledError:
+            future.add_done_callback(lambda f: f.cancelled() or f.exception() or self.release(f.result()))
+            raise
+
+    def release(self, synthesizer: typing.Optional[PooledSynthesizer]):
+        with self._lock:
+            self.leased -= 1
+            if synthesizer is not None:
+                self._idle.append(synthesizer)
+            self._wake()
+
+
+_synthesizer_pool: typing.Optional[SynthesizerPool] = None
+_synthesizer_pool_lock = threading.Lock()
+
+
+def get_synthesizer_pool() -> SynthesizerPool:
+    """The process-wide synthesizer pool, created and connected on first use."""
+    global _synthesizer_pool
+    with _synthesizer_pool_lock:
+        if _synthesizer_pool is None:
+            _synthesizer_pool = SynthesizerPool()
+        return _synthesizer_pool
+
+
+def set_synthesizer_pool(pool):
+    """Replace the process-wide pool, e.g. with stubs for load tests."""
+    global _synthesizer_pool
+    with _synthesizer_pool_lock:
+        _synthesizer_pool = pool
+
+
+class Client:
+    def __init__(self, pool: SynthesizerPool = None):
+        self.pool = pool or get_synthesizer_pool()
+
+    def text_to_speech(self, text: str, voice: str, speed: str = "medium") -> typing.Iterator[bytes]:
+        synthesizer = self.pool.acquire(voice)
+        ssml = f"<speak version='1.0' xmlns='http://www.w3.org/2001/10/synthesis' xml:lang='en-US'><voice name='{voice}'><prosody rate='{speed}'>{text}</prosody></voice></speak>"
+        try:
+            result = synthesizer.synthesizer.start_speaking_ssml(ssml)
+        except Exception:
+            self.pool.release(synthesizer)
+            raise
+        yield from self._leased_audio(synthesizer, result)
+
+    def text_to_speech_async(self, text: str, voice: str, speed: str = "medium") -> "AsyncAudioIterator":
+        """text_to_speech read on a dedicated thread, for use on the event loop."""
+        return AsyncAudioIterator(self.text_to_speech(text, voice, speed))
+
+    async def text_stream_to_speech(self, text_segments: typing.AsyncIterable[str], voice: str) -> "AsyncAudioIterator":
+        """
+        Synthesize text while it is still being generated, e.g. sentences of a streaming LLM completion.
+        The segments are written to a text stream request from a task on the event loop,
+        and the audio is read on a dedicated thread.
+        """
+        synthesizer = await self.pool.acquire_async(voice)
+        synthesis_request = speechsdk.SpeechSynthesisRequest(
+            input_type=speechsdk.SpeechSynthesisRequestInputType.TextStream)
+        try:
+            result = await asyncio.to_thread(synthesizer.synthesizer.start_speaking, synthesis_request)
+        except Exception:
+            self.pool.release(synthesizer)
+            raise
+
+        async def write_text():
+            try:
+                async for segment in text_segments:
+                    synthesis_request.input_stream.write(segment)
+            except Exception as e:
+                logging.error(f"Text stream failed: {e}")
+            finally:
+                synthesis_request.input_stream.close()
+
+        asyncio.create_task(write_text())
+        return AsyncAudioIterator(self._leased_audio(synthesizer, result))
+
+    def _leased_audio(self, synthesizer: PooledSynthesizer, result) -> typing.Iterator[bytes]:
+        """Read the audio of `result` and return the synthesizer to the pool once done."""
+        completed = False
+        try:
+            yield from self._read_audio(speechsdk.AudioDataStream(result))
+            completed = True
+        finally:
+            if not completed:
+                # the reader stopped early, don't lease a synthesizer which is still speaking
+                synthesizer.synthesizer.stop_speaking()
+            self.pool.release(synthesizer)
 
-                energy = calculate_energy(frame_data)
-                if energy < 500:
-                    print("Silence detected, skipping")
-                    continue
-                leading_silence_skipped = True
-                stream.position = stream.position - silence_detection_frames_size
-            chunk = bytes(2400*4)  # 200 ms duration
-            read = stream.read_data(chunk)
-            if read == 0:
-                break
-            yield chunk[:read]
+    def _read_audio(self, stream: speechsdk.AudioDataStream) -> typing.Iterator[bytes]:
+        # the leading silence is found in one lookahead read, which is then emitted from the first loud window
+        lookahead = bytes(SILENCE_LOOKAHEAD_BYTES)
+        read = stream.read_data(lookahead)
+        chunk = lookahead[leading_silence_bytes(lookahead, read):read]
+        # the SDK fills the buffer in place, so it is reused and each chunk is copied out of it
+        buffer = bytes(2400*4)  # 200 ms duration
+        while read:
+            if chunk:
+                yield chunk
+            read = stream.read_data(buffer)
+            chunk = bytes(memoryview(buffer)[:read])
         if stream.status != speechsdk.StreamStatus.AllData:
             logging.error(f"Speech synthesis failed: {stream.status}, details: {stream.cancellation_details.error_details}")
 
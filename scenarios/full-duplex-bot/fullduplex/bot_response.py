@@ -1,13 +1,21 @@
 import asyncio
 import logging
+import os
 import time
+from typing import AsyncIterator, Optional
 
 from oai import ChatClient
 from azuretts import Client as AzureTTSClient
+from metrics import TurnSpan
+from text_segmenter import segment_stream
 
-chat_client = ChatClient()
+# stream LLM tokens into TTS sentence by sentence instead of waiting for the whole completion
+LLM_STREAMING = os.getenv("LLM_STREAMING", "true").lower() == "true"
 
 class BotResponse:
+    # replaceable, e.g. with a stub for load tests
+    tts_client_factory = AzureTTSClient
+
     def __init__(
         self, human_turn, context, inf_url, inf_key, eleven_key, interrupted=False
     ):
@@ -22,12 +30,22 @@ class BotResponse:
         self.ts = int(time.time())
         self.ts_of_voice_start = 0
         self.interrupted = interrupted
+        # both only hold per-session state, connections come from the process-wide pools
         self.chat_client = ChatClient()
-        self.azure_tts_client = AzureTTSClient()
+        self.azure_tts_client = self.tts_client_factory()
         self._turn_id = None
         self.voice = "en-US-AvaNeural"
+        # resolves to the complete AI turn once the LLM is done, audio may already be streaming by then
+        self.ai_turn_done = None
+        self._cancelled = asyncio.Event()
+        # timeline of the current turn, set by the server before start()
+        self.span: Optional[TurnSpan] = None
 
     async def start(self):
+        """
+        Start the response. Returns once out_audio_stream can be read, which is after the whole
+        completion without LLM streaming, or right after the LLM and TTS requests are started with it.
+        """
         # Add human turn to context
         self.context.append(
             {
@@ -36,29 +54,71 @@ class BotResponse:
                 "ts": self.ts,
             }
         )
+        self.ai_turn_done = asyncio.get_running_loop().create_future()
+        self._cancelled = asyncio.Event()
+        span = self.span or TurnSpan()
+
+        if LLM_STREAMING:
+            logging.info(f"Starting streaming inference and stream {self.human_turn}")
+            self.ai_turn = None
+            # the LLM request is started before the TTS request, so both connect concurrently
+            segments = asyncio.Queue()
+            asyncio.create_task(self._stream_inference(self.human_turn, segments, self.ai_turn_done, self._cancelled, span))
+            self.out_audio_stream = await self.azure_tts_client.text_stream_to_speech(
+                text_segments=_drain(segments),
+                voice=self.voice,
+            )
+            self.streaming = True
+            return
+
         logging.info(f"Starting inference {time.time()}")
-        self.ai_turn = await self._call_inference()
+        ai_turn = await self._call_inference()
         logging.info(f"inference complete {time.time()}")
+        span.mark("llm_first_token")
+        self._complete_ai_turn(self.ai_turn_done, ai_turn, span)
 
+        logging.info(f"Starting stream {self.human_turn}")
+
+        self.out_audio_stream = self.azure_tts_client.text_to_speech_async(
+            text=self.ai_turn,
+            voice=self.voice,
+        )
+        self.streaming = True
+
+    def _complete_ai_turn(self, ai_turn_done: asyncio.Future, ai_turn: str, span: TurnSpan):
+        span.mark("llm_done")
+        self.ai_turn = ai_turn
         # Add ai turn to context
         self.context.append(
             {
-                "text": self.ai_turn,
+                "text": ai_turn,
                 "type": "AI",
                 "ts": int(time.time()),
             }
         )
+        if not ai_turn_done.done():
+            ai_turn_done.set_result(ai_turn)
 
-        logging.info(f"Starting stream {self.human_turn}")
-
-        self.out_audio_stream = await asyncio.to_thread(
-            self.azure_tts_client.text_to_speech,
-            text=self.ai_turn,
-            voice=self.voice,
-        )
-        self.streaming = True
-
-        return self.ai_turn
+    async def _stream_inference(self, human_turn: str, segments: asyncio.Queue, ai_turn_done: asyncio.Future,
+                                cancelled: asyncio.Event, span: TurnSpan):
+        """Puts the completion into `segments` sentence by sentence, followed by None."""
+        text = []
+        tokens = self.chat_client.achat_stream(human_turn)
+        try:
+            async for segment in segment_stream(_first_token_marked(tokens, span)):
+                if cancelled.is_set():
+                    logging.info("Turn stopped, no longer streaming inference")
+                    break
+                text.append(segment)
+                segments.put_nowait(segment)
+        except Exception as e:
+            logging.error(f"Streaming inference failed: {e}")
+        finally:
+            await tokens.aclose()
+            segments.put_nowait(None)
+            ai_turn = "".join(text).strip()
+            logging.info(f"Pi's response {ai_turn}")
+            self._complete_ai_turn(ai_turn_done, ai_turn, span)
 
     @property
     def turn_id(self):
@@ -76,11 +136,23 @@ class BotResponse:
             logging.info(f"Stopping turn. Human: '{human_turn}' ai: '{bot_response}'")
             self.streaming = False
             self.out_audio_stream = None
+            self._cancelled.set()
 
     async def _call_inference(self):
-        text_response = self.chat_client.chat(self.human_turn)
+        text_response = await self.chat_client.achat(self.human_turn)
         if self.interrupted:
             text_response = f" {text_response}"
 
         logging.info(f"Pi's response {text_response}")
         return text_response
+
+
+async def _drain(segments: asyncio.Queue) -> AsyncIterator[str]:
+    while (segment := await segments.get()) is not None:
+        yield segment
+
+
+async def _first_token_marked(tokens: AsyncIterator[str], span: TurnSpan) -> AsyncIterator[str]:
+    async for token in tokens:
+        span.mark("llm_first_token")
+        yield token
@@ -0,0 +1,110 @@
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List
+
+logger = logging.getLogger(__name__)
+
+# prompt tokens available for the conversation history, the system prompt and the summary come on top
+CHAT_CONTEXT_TOKENS = int(os.getenv("CHAT_CONTEXT_TOKENS", "2000"))
+# upper bound of the rolling summary of the turns evicted from the context
+CHAT_SUMMARY_TOKENS = int(os.getenv("CHAT_SUMMARY_TOKENS", "200"))
+
+# summaries are generated off the critical path, a few threads serve all sessions of the process
+_summary_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="chat-summary")
+
+SUMMARY_PROMPT = ("You maintain a short summary of a spoken conversation between a user and an AI assistant. "
+                  "Update the summary with the new part of the conversation. Keep facts about the user, their "
+                  "requests and open questions, drop small talk. Answer with the summary only, in plain text, "
+                  "in at most {words} words.")
+
+
+def _field(message, name: str):
+    # history entries are dicts or ChatCompletionMessage objects
+    return message.get(name) if isinstance(message, dict) else getattr(message, name, None)
+
+
+def estimate_tokens(message) -> int:
+    """Cheap estimate of the prompt tokens of a chat message: about 4 characters per token plus the message framing."""
+    return len(_field(message, "content") or "") // 4 + 4
+
+
+class ChatContext:
+    """
+    Conversation history of one session within a prompt token budget.
+
+    When the history exceeds the budget the oldest messages are evicted and folded into a rolling summary by
+    `summarize`, on a background thread, so no turn waits for it. Until it is done the evicted messages are
+    simply missing from the prompt. The prompt starts with the system prompt unchanged, followed by the
+    summary, so the prefix stays the same across turns and server side prompt caching can hit.
+    """
+
+    def __init__(self, summarize: Callable[[str, list], str], budget: int = CHAT_CONTEXT_TOKENS):
+        self.summarize = summarize
+        self.budget = budget
+        self.summary = ""
+        self._history: List = []
+        self._tokens = 0
+        # evicted messages not yet in the summary
+        self._evicted: List = []
+        self._summarizing = False
+        self._lock = threading.Lock()
+
+    def append(self, message):
+        with self._lock:
+            self._history.append(message)
+            self._tokens += estimate_tokens(message)
+
+    def messages(self, system_prompt: str) -> list:
+        """The prompt for the next completion, evicting the oldest messages beyond the budget."""
+        with self._lock:
+            # the latest message is always kept
+            while self._tokens > self.budget and len(self._history) > 1:
+                message = self._history.pop(0)
+                self._tokens -= estimate_tokens(message)
+                self._evicted.append(message)
+            # a reply must not start the history
+            while len(self._history) > 1 and _field(self._history[0], "role") == "assistant":
+                message = self._history.pop(0)
+                self._tokens -= estimate_tokens(message)
+                self._evicted.append(message)
+            history = list(self._history)
+            summary = self.summary
+            if self._evicted and not self._summarizing:
+                self._summarizing = True
+                _summary_executor.submit(self._refresh_summary)
+        prompt = [{"role": "system", "content": system_prompt}]
+        if summary:
+            prompt.append({"role": "system", "content": f"Summary of the earlier conversation: {summary}"})
+        return prompt + history
+
+    def _refresh_summary(self):
+        try:
+            while True:
+                with self._lock:
+                    evicted = self._evicted
+                    summary = self.summary
+                    if not evicted:
+                        return
+                    self._evicted = []
+                try:
+                    summary = self.summarize(summary, evicted)
+                except Exception as e:
+                    logger.warning(f"Failed to summarize {len(evicted)} evicted messages: {e}")
+                    return
+                with self._lock:
+                    self.summary = summary
+                logger.info(f"Folded {len(evicted)} messages into the conversation summary")
+        finally:
+            with self._lock:
+                self._summarizing = False
+
+
+def summary_request(summary: str, evicted: list, max_tokens: int = CHAT_SUMMARY_TOKENS) -> list:
+    """The messages of a chat completion which folds `evicted` into `summary`."""
+    transcript = "\n".join(f"{_field(m, 'role')}: {_field(m, 'content') or ''}" for m in evicted)
+    return [
+        {"role": "system", "content": SUMMARY_PROMPT.format(words=max_tokens * 3 // 4)},
+        {"role": "user", "content": f"Summary so far: {summary or '(empty)'}\n\nNew part of the conversation:\n{transcript}"},
+    ]
@@ -6,12 +6,14 @@ import time
 import traceback
 import uuid
 from datetime import datetime
+from typing import Optional
 
 import azure.cognitiveservices.speech as speechsdk
 from azure.identity import DefaultAzureCredential, get_bearer_token_provider
+from audio_pacer import AudioPacer
 from azure_fast_transcription_recognizer import AzureFastTranscriptionRecognizer
-from oai import ChatClient
 from bot_response import BotResponse
+from metrics import AUDIO_OVERRUNS, AUDIO_UNDERRUNS, TurnSpan
 
 logging.basicConfig(
     level=logging.INFO,
@@ -30,30 +32,35 @@ SPEECH_RESOURCE_ID = os.getenv("SPEECH_RESOURCE_ID")
 if not SPEECH_REGION and not SPEECH_RESOURCE_ID:
     raise EnvironmentError("SPEECH_REGION or SPEECH_RESOURCE_ID environment variables must be set")
 
-loop = asyncio.new_event_loop()
+# how far outbound audio may run ahead of real time, buffered by the client to absorb jitter
+AUDIO_LEAD_MS = int(os.getenv("AUDIO_LEAD_MS", "200"))
+
 
 class AzureChatServer:
     def __init__(self, in_queue, out_queue, language: str = "en-US", provider=None):
         self.in_queue = in_queue
         self.out_queue = out_queue
-        self.chat_client = ChatClient()
         self.audio_input_stream = None
 
         if provider == "azure-fast-transcription":
             self.speech_recognizer = AzureFastTranscriptionRecognizer(
                 endpoint=f"https://{SPEECH_REGION}.api.cognitive.microsoft.com",
                 key=os.getenv("SPEECH_KEY"),
+                speculative_interval_ms=int(os.getenv("FAST_TRANSCRIPTION_SPECULATIVE_INTERVAL_MS", "0")),
             )
             self.speech_recognizer.locale = language
             self.speech_recognizer.on_recognized = self.on_fast_transcription_recognized
         else:
             self.init_speech_recognizer(language)
 
-        self.recognized_text = ""
+        # recognized utterances, handed over from the SDK / transcription threads with call_soon_threadsafe
+        self._recognized = asyncio.Queue()
+        self._loop = None
         self.voice = "en-US-AvaNeural"
         self.pis_response = None
         self.interrupted = False
         self.last_latency = -1
+        self.pacer = None
 
     def init_speech_recognizer(self, language: str):
         auth_token = f"aad#{SPEECH_RESOURCE_ID}#{token_provider()}"
@@ -79,7 +86,6 @@ class AzureChatServer:
 
         # https://aka.ms/csspeech/timeouts.
         self.speech_recognizer = speechsdk.SpeechRecognizer(speech_config=speech_config, audio_config=audio_config)
-        self.recognized_text = ""
         self.speech_recognizer.session_started.connect(lambda evt: logger.info(f"Session started: {evt}"))
         self.speech_recognizer.session_stopped.connect(lambda evt: logger.info(f"Session stopped: {evt}"))
         # uncomment the following line to interrupt the TTS when intermediate text is detected, this is too sensitive in the testing.
@@ -91,8 +97,10 @@ class AzureChatServer:
         self.speech_recognizer.recognizing.connect(lambda evt: logger.info(f"Recognizing: {evt}"))
 
     async def worker(self):
+        self._loop = asyncio.get_running_loop()
         self.speech_recognizer.start_continuous_recognition()
         self._total_audio_bytes = 0
+        turn_task = asyncio.create_task(self._turn_worker())
 
         try:
             while True:
@@ -110,32 +118,44 @@ class AzureChatServer:
                             self.speech_recognizer(chunk)
                         self._total_audio_bytes += len(chunk)
                     await asyncio.sleep(0)
-                if self.recognized_text:
-                    await self.out_queue.put(json.dumps(
-                        {"type": "recognized", "text": self.recognized_text,
-                        "time": datetime.utcnow().strftime('%F %T.%f')[:-3],
-                        "latency": int(self.last_latency)
-                          }))
-                    logger.info(f"Recognized text x: {self.recognized_text}")
-                    asyncio.ensure_future(self.recognized_handler(self.recognized_text, self.out_queue))
-                    self.recognized_text = ""
 
         except Exception as e:
             print(f"An eleven error occurred: {e}")
         finally:
+            turn_task.cancel()
             self.speech_recognizer.stop_continuous_recognition()
 
+    async def _turn_worker(self):
+        """Starts a turn as soon as an utterance is recognized, independent of inbound audio."""
+        while True:
+            text, latency, recognized_at = await self._recognized.get()
+            # both recognizers report how long after the end of speech the result came, -1 if unknown
+            span = TurnSpan(speech_end=recognized_at - latency / 1000 if latency >= 0 else None, asr_final=recognized_at)
+            await self.out_queue.put(json.dumps(
+                {"type": "recognized", "text": text,
+                "time": datetime.utcnow().strftime('%F %T.%f')[:-3],
+                "latency": int(latency)
+                  }))
+            logger.info(f"Recognized text x: {text}")
+            asyncio.ensure_future(self.recognized_handler(text, self.out_queue, span))
+
+    def _put_recognized(self, text: str, latency: float):
+        # called from the recognizer threads, never touch the queue directly
+        if text and self._loop is not None:
+            self._loop.call_soon_threadsafe(self._recognized.put_nowait, (text, latency, time.monotonic()))
+
     def on_recognized(self, args: speechsdk.SpeechRecognitionEventArgs):
         logger.info(f"Recognized: {args.result.text}")
         self.interrupted = False
         self.last_latency = self._total_audio_bytes / 2 / 16 - (args.result.offset + args.result.duration)/1000/10
-        self.recognized_text = args.result.text
+        self._put_recognized(args.result.text, self.last_latency)
 
-    def on_fast_transcription_recognized(self, response):
+    def on_fast_transcription_recognized(self, response, speech_end: Optional[float]):
         texts = [phrase['text'] for phrase in response['phrases']]
         self.interrupted = False
         print(f"Recognized: '{response}'")
-        self.recognized_text = ' '.join(texts)
+        latency = (time.monotonic() - speech_end) * 1000 if speech_end is not None else -1
+        self._put_recognized(' '.join(texts), latency)
 
     def on_cancelled(self, args: speechsdk.SpeechRecognitionCanceledEventArgs):
         logger.info(f"Cancelled: {args}")
@@ -146,9 +166,32 @@ class AzureChatServer:
         logger.info(f"Recognizing: {args.result.text}")
         if not self.interrupted:
             self.interrupted = True
-            self.out_queue.queue.put_nowait(json.dumps({"type": "interrupted", "reason": "intermediate text detected", "time": datetime.utcnow().strftime('%F %T.%f')[:-3]}))
-
-    async def recognized_handler(self, text: str, out_queue):
+            if self.pacer:
+                self.pacer.cancel()
+            if self.pis_response and self.pis_response.span:
+                self.pis_response.span.mark("barge_in")
+            turn_id = self.pis_response.turn_id if self.pis_response else None
+            # called on the SDK thread, the queue belongs to the event loop
+            if self._loop is not None:
+                self._loop.call_soon_threadsafe(self._send_interrupted, turn_id)
+
+    def _send_interrupted(self, turn_id):
+        # the bot audio still queued for the client would play over the user
+        dropped = self.out_queue.flush(turn_id)
+        logger.info(f"Barge-in, dropped {dropped} queued audio frames")
+        self.out_queue.put_nowait(json.dumps({"type": "interrupted", "reason": "intermediate text detected", "time": datetime.utcnow().strftime('%F %T.%f')[:-3]}))
+
+    async def send_ai_response(self, ai_turn_done: asyncio.Future, llm_start_time: datetime, out_queue):
+        ai_turn = await ai_turn_done
+        # time format, e.g. 2021-09-01T12:00:00.010Z
+        llm_finish_time = datetime.utcnow()
+        msg = {
+            "type": "ai response", "text": ai_turn,
+            "time": llm_finish_time.strftime('%F %T.%f')[:-3],
+            "latency": int((llm_finish_time - llm_start_time).total_seconds() * 1000)}
+        await out_queue.put(json.dumps(msg))
+
+    async def recognized_handler(self, text: str, out_queue, span: TurnSpan = None):
         sentence = text
         if len(sentence) == 0:
             return
@@ -166,6 +209,11 @@ class AzureChatServer:
 
                 interrupting = True
                 self.pis_response.stop()
+                if self.pacer:
+                    self.pacer.cancel()
+                out_queue.flush(self.pis_response.turn_id)
+                if self.pis_response.span:
+                    self.pis_response.span.mark("barge_in")
                 await asyncio.sleep(0.01)
 
                 if sentence.strip().lower() == "stop.":  # replace with model
@@ -200,15 +248,12 @@ class AzureChatServer:
             msg = {"type": "thinking", "time": llm_start_time.strftime('%F %T.%f')[:-3]}
             await out_queue.put(json.dumps(msg))
             self.pis_response.voice = self.voice
-            ai_turn = await self.pis_response.start()
-
-            # time format, e.g. 2021-09-01T12:00:00.010Z
-            llm_finish_time = datetime.utcnow()
-            msg = {
-                "type": "ai response", "text": ai_turn,
-                "time": llm_finish_time.strftime('%F %T.%f')[:-3],
-                "latency": int((llm_finish_time - llm_start_time).total_seconds() * 1000)}
-            await out_queue.put(json.dumps(msg))
+            span = span or TurnSpan()
+            self.pis_response.span = span
+            await self.pis_response.start()
+            # with LLM streaming the completion is still in progress here
+            tts_start_time = datetime.utcnow()
+            asyncio.ensure_future(self.send_ai_response(self.pis_response.ai_turn_done, llm_start_time, out_queue))
 
 
             logger.info(f"Sending audio chunks for {self.pis_response.human_turn}")
@@ -219,45 +264,43 @@ class AzureChatServer:
             interrupted = False
 
             first = True
+            # audio is read on the TTS reader thread, the loop only awaits the next chunk
+            audio_stream = self.pis_response.out_audio_stream
+            pacer = AudioPacer(out_queue, lead_ms=AUDIO_LEAD_MS, turn_id=turn_id,
+                               on_first_sent=lambda: span.mark("first_audio_sent"))
+            self.pacer = pacer
 
             try:
                 self.pis_response.ts_of_voice_start = int(time.time())
                 logger.info(f"Voice start time: {self.pis_response.ts_of_voice_start}")
-                for chunk in self.pis_response.out_audio_stream:
+                async for chunk in audio_stream:
+                    if not (self.pis_response.streaming and self.pis_response.turn_id == turn_id and not self.interrupted):
+                        # Ensure we're still streaming this response
+                        interrupted = True
+                        logger.info("Stream has stopped. No longer writing to outqueue")
+                        return
                     if first:
+                        span.mark("tts_first_byte")
                         tts_first_chunk_time = datetime.utcnow()
                         await out_queue.put(json.dumps({
                             "type": "stream_start", "reason": "TTS started",
-                            "time": tts_first_chunk_time.strftime('%F %T.%f')[:-3], "latency": int((tts_first_chunk_time - llm_finish_time).total_seconds() * 1000)}))
-                        await out_queue.put(chunk)
+                            "time": tts_first_chunk_time.strftime('%F %T.%f')[:-3], "latency": int((tts_first_chunk_time - tts_start_time).total_seconds() * 1000)}))
                         first = False
-                        last_update = time.time()
-                    else:
-                        # logger.info(f"Sending chunk of audio")
-                        for i in range(0, len(chunk), 1200):
-                            if self.pis_response.streaming and self.pis_response.turn_id == turn_id and not self.interrupted:
-                                # Ensure we're still streaming this response
-                                await out_queue.put(chunk[i : i + 1200])
-                                current_time = time.time()
-                                if current_time - last_update < 0.024:
-                                    await asyncio.sleep(last_update + 0.024 - current_time)
-                                else:
-                                    logging.warning(f"We got unexpected delay: {current_time - last_update - 0.024}")
-                                    # await out_queue.put(json.dumps({"type": "service underrun", "time": current_time - last_update - 0.024}))
-                                last_update = time.time()
-                            else:
-                                interrupted = True
-                                logger.info(
-                                    "Stream has stopped. No longer writing to outqueue"
-                                )
-                                return
-                    await asyncio.sleep(0)
+                    if not await pacer.send(chunk):
+                        interrupted = True
+                        logger.info("Stream has been cancelled. No longer writing to outqueue")
+                        return
             except TypeError as e:
                 interrupted = True
                 logger.info(
                     "Stream has stopped and response gone. No longer writing to outqueue"
                 )
             finally:
+                if audio_stream is not None:
+                    audio_stream.close()
+                logger.info(f"Audio pacer: {pacer.stats()}")
+                AUDIO_UNDERRUNS.inc(pacer.underruns)
+                AUDIO_OVERRUNS.inc(pacer.overruns)
                 # Indicate response is complete
                 self.pis_response.stop(turn_id)
                 msg = {
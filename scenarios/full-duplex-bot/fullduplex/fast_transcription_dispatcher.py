@@ -0,0 +1,207 @@
+import base64
+import collections
+import json
+import logging
+import threading
+import time
+import wave
+from concurrent.futures import Future, ThreadPoolExecutor
+from io import BytesIO
+from typing import Callable, Optional
+
+import numpy as np
+from requests import Session
+from requests.adapters import HTTPAdapter
+
+from VAD.vad_iterator import float2int
+
+logger = logging.getLogger(__name__)
+
+
+AzureADTokenProvider = Callable[[], str]
+
+
+def _token_expiry(token: str) -> Optional[float]:
+    """Read the `exp` claim of a JWT bearer token, None if the token is not a JWT."""
+    try:
+        payload = token.split(".")[1]
+        payload += "=" * (-len(payload) % 4)
+        return float(json.loads(base64.urlsafe_b64decode(payload))["exp"])
+    except Exception:
+        return None
+
+
+class CachedTokenProvider:
+    """
+    Caches the bearer token of a token provider until shortly before it expires,
+    instead of evaluating the provider for every request.
+    """
+
+    def __init__(self, token_provider: AzureADTokenProvider, refresh_margin_s: float = 300, default_ttl_s: float = 600):
+        self.token_provider = token_provider
+        self.refresh_margin_s = refresh_margin_s
+        self.default_ttl_s = default_ttl_s
+        self._token = None
+        self._expires_at = 0.0
+        self._lock = threading.Lock()
+
+    def __call__(self) -> str:
+        with self._lock:
+            if self._token is None or time.time() >= self._expires_at - self.refresh_margin_s:
+                self._token = self.token_provider()
+                self._expires_at = _token_expiry(self._token) or time.time() + self.default_ttl_s
+            return self._token
+
+
+class TranscriptionDispatcher:
+    """
+    Sends fast transcription requests for all sessions of the process, with up to
+    `max_in_flight` requests in flight over one pooled keep-alive HTTP session.
+
+    Speculative requests are only sent while more than `reserved_final` slots are free, so final
+    requests never wait behind them: a cancelled speculative request keeps its slot until it completes.
+    """
+
+    def __init__(self, endpoint: str, key: str = None, token_provider: AzureADTokenProvider = None, max_in_flight: int = 8,
+                 sampling_rate: int = 16000, reserved_final: int = None):
+        self.endpoint = f"{endpoint}/speechtotext/transcriptions:transcribe?api-version=2024-11-15"
+        self.key = key
+        self.token_provider = CachedTokenProvider(token_provider) if token_provider else None
+        self.max_in_flight = max_in_flight
+        self.reserved_final = max(1, max_in_flight // 4) if reserved_final is None else reserved_final
+        self.sampling_rate = sampling_rate
+        self.session = Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_in_flight)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self._executor = ThreadPoolExecutor(max_workers=max_in_flight, thread_name_prefix="fast-transcription")
+        self._lock = threading.Lock()
+        self._queued = 0
+        self._in_flight = 0
+        self.skipped_speculative = 0
+        self._latencies_ms = collections.deque(maxlen=1000)
+        # warm up a connection off the caller's thread, without taking a request slot
+        threading.Thread(target=self._warm_up, args=(endpoint,), name="fast-transcription-warm-up", daemon=True).start()
+
+    def _warm_up(self, endpoint: str):
+        """Open a pooled connection to the host with a HEAD request, the status does not matter."""
+        try:
+            self.session.head(f"{endpoint.rstrip('/')}/", timeout=10)
+        except Exception as e:
+            logger.warning(f"Fast transcription warm-up of {endpoint} failed: {e}")
+
+    @property
+    def queue_depth(self) -> int:
+        """Requests submitted but not yet sent."""
+        return self._queued
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    def latency_ms(self, percentile: float = 50) -> float:
+        """Request latency percentile over the most recent requests, 0 if there were none."""
+        latencies = list(self._latencies_ms)
+        if not latencies:
+            return 0
+        return float(np.percentile(latencies, percentile))
+
+    def stats(self) -> dict:
+        return {
+            "queue_depth": self.queue_depth,
+            "in_flight": self.in_flight,
+            "latency_p50_ms": self.latency_ms(50),
+            "latency_p95_ms": self.latency_ms(95),
+            "skipped_speculative": self.skipped_speculative,
+        }
+
+    def submit(self, audio: np.ndarray, definition: str, speculative: bool = False) -> Optional[Future]:
+        """
+        Transcribe float32 `audio`, the future resolves to the parsed service response.
+        A speculative request is not submitted, None is returned, when the reserved slots would be used.
+        """
+        with self._lock:
+            if speculative and self._queued + self._in_flight >= self.max_in_flight - self.reserved_final:
+                self.skipped_speculative += 1
+                return None
+            self._queued += 1
+        future = self._executor.submit(self._transcribe, audio, definition)
+        # a request cancelled before it was sent never reaches _transcribe
+        future.add_done_callback(self._on_cancelled)
+        return future
+
+    def _on_cancelled(self, future: Future):
+        if future.cancelled():
+            with self._lock:
+                self._queued -= 1
+
+    def _headers(self) -> dict:
+        if self.token_provider is None:
+            return {'Ocp-Apim-Subscription-Key': self.key}
+        return {'Authorization': f'Bearer {self.token_provider()}'}
+
+    def _transcribe(self, audio: np.ndarray, definition: str) -> dict:
+        with self._lock:
+            self._queued -= 1
+            self._in_flight += 1
+        start_time = time.perf_counter()
+        try:
+            tmp = BytesIO()
+            with wave.open(tmp, "wb") as wf:
+                wf.setnchannels(1)
+                wf.setsampwidth(2)
+                wf.setframerate(self.sampling_rate)
+                wf.writeframes(float2int(audio).tobytes())
+            response = self.session.post(
+                self.endpoint, headers=self._headers(), files={'audio': tmp.getbuffer()}, data={'definition': definition})
+            if response.status_code >= 400:
+                logger.error(f"Fast transcription failed: {response.status_code} {response.text}")
+            response.raise_for_status()
+            return response.json()
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+            self._latencies_ms.append((time.perf_counter() - start_time) * 1000)
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        self.session.close()
+
+
+# (endpoint, key or token provider) -> dispatcher, the requests of a dispatcher carry its credential
+_dispatchers: dict[tuple, TranscriptionDispatcher] = {}
+# endpoint -> dispatcher used for any credential
+_replacements: dict[str, TranscriptionDispatcher] = {}
+_dispatchers_lock = threading.Lock()
+
+
+def get_dispatcher(endpoint: str, key: str = None, token_provider: AzureADTokenProvider = None, max_in_flight: int = 8) -> TranscriptionDispatcher:
+    """Return the process-wide dispatcher for `endpoint` and the credential, creating it on first use."""
+    credential = key if token_provider is None else token_provider
+    with _dispatchers_lock:
+        if endpoint in _replacements:
+            return _replacements[endpoint]
+        if (endpoint, credential) not in _dispatchers:
+            _dispatchers[(endpoint, credential)] = TranscriptionDispatcher(endpoint, key, token_provider, max_in_flight)
+        return _dispatchers[(endpoint, credential)]
+
+
+def set_dispatcher(endpoint: str, dispatcher):
+    """Replace the dispatchers for `endpoint`, whatever the credential, e.g. with a stub for load tests."""
+    with _dispatchers_lock:
+        _replacements[endpoint] = dispatcher
+
+
+def dispatchers() -> dict[str, TranscriptionDispatcher]:
+    """The dispatchers by endpoint, numbered from the second credential of an endpoint on, e.g. for metric labels."""
+    with _dispatchers_lock:
+        entries = [(endpoint, dispatcher) for (endpoint, _), dispatcher in _dispatchers.items()]
+        entries += list(_replacements.items())
+    labelled = {}
+    for endpoint, dispatcher in entries:
+        label, n = endpoint, 1
+        while label in labelled:
+            n += 1
+            label = f"{endpoint}#{n}"
+        labelled[label] = dispatcher
+    return labelled
@@ -0,0 +1,258 @@
+"""
+Opens N WebSocket sessions against the full duplex server, streams WAV files at real-time pace like the
+web page does, and reports turn latency percentiles, late and missing audio, event loop lag and CPU.
+
+The WAV files must be 16 kHz, 16 bit mono, ideally one utterance each. Run from the fullduplex folder,
+e.g. against the stub server:
+
+    python -m loadtest.load_generator --url ws://localhost:5000 --sessions 20 --duration 120 utterance1.wav utterance2.wav
+"""
+import argparse
+import asyncio
+import json
+import re
+import time
+import urllib.request
+import wave
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+import numpy as np
+import websockets
+
+# what the web page sends: 1024 samples of 16 kHz 16 bit audio per message
+FRAME_BYTES = 2048
+FRAME_S = 1024 / 16000
+# bot audio is 24 kHz 16 bit
+BOT_AUDIO_BYTES_PER_S = 48000
+
+
+def read_wav(path: str) -> bytes:
+    with wave.open(path, "rb") as wf:
+        if wf.getframerate() != 16000 or wf.getsampwidth() != 2 or wf.getnchannels() != 1:
+            raise ValueError(f"{path} must be 16 kHz, 16 bit mono")
+        return wf.readframes(wf.getnframes())
+
+
+def speech_end_frame(utterance: bytes) -> int:
+    """Index of the frame after the last one with speech, i.e. the first of the trailing silence of the file."""
+    samples = np.frombuffer(utterance[:len(utterance) // 640 * 640], dtype=np.int16).astype(np.float32)
+    # RMS of 20 ms windows, speech is anything above a tenth of the loudest window
+    rms = np.sqrt((samples.reshape(-1, 320) ** 2).mean(axis=1))
+    loud = np.flatnonzero(rms > rms.max() / 10)
+    end_bytes = (loud[-1] + 1) * 640 if len(loud) else len(utterance)
+    return -(-end_bytes // FRAME_BYTES)
+
+
+@dataclass
+class SessionStats:
+    # end of utterance sent -> first bot audio of the turn received, seconds
+    turn_latencies: List[float] = field(default_factory=list)
+    # utterances for which no response stream started before the next one
+    turns_without_audio: int = 0
+    # frames sent more than one frame late, i.e. the generator could not keep real-time pace
+    late_frames: int = 0
+    # gaps in bot audio within a response, as a client playing it back would hear them
+    playback_gaps: int = 0
+    bot_audio_s: float = 0.0
+    error: Optional[str] = None
+
+
+class Session:
+    def __init__(self, url: str, utterances: List[bytes], pause_s: float, deadline: float):
+        self.url = url
+        self.utterances = utterances
+        self.pause_s = pause_s
+        self.deadline = deadline
+        self.stats = SessionStats()
+        self._utterance_end = None
+        # the server started a turn after the end of the utterance, and then its audio stream
+        self._turn_started = False
+        self._stream_started = False
+        self._playout_end = None
+
+    async def run(self, offset: int):
+        try:
+            async with websockets.connect(self.url, max_size=None) as ws:
+                reader = asyncio.create_task(self._read(ws))
+                try:
+                    await self._send(ws, offset)
+                finally:
+                    reader.cancel()
+        except Exception as e:
+            self.stats.error = repr(e)
+
+    async def _send(self, ws, offset: int):
+        silence = bytes(FRAME_BYTES)
+        start = time.monotonic()
+        sent = 0
+        index = offset
+        while time.monotonic() < self.deadline:
+            if self._utterance_end is not None and not self._stream_started:
+                # the previous utterance got no answer during the pause
+                self.stats.turns_without_audio += 1
+            utterance = self.utterances[index % len(self.utterances)]
+            index += 1
+            frames = [utterance[i:i + FRAME_BYTES] for i in range(0, len(utterance), FRAME_BYTES)]
+            frames += [silence] * int(self.pause_s / FRAME_S)
+            # the server may answer during the trailing silence of the file, the latency counts from the end of speech
+            speech_end = speech_end_frame(utterance)
+            for i, frame in enumerate(frames):
+                if i == speech_end:
+                    self._utterance_end = time.monotonic()
+                    self._turn_started = self._stream_started = False
+                due = start + sent * FRAME_S
+                now = time.monotonic()
+                if now < due:
+                    await asyncio.sleep(due - now)
+                elif now - due > FRAME_S:
+                    self.stats.late_frames += 1
+                await ws.send(frame)
+                sent += 1
+
+    async def _read(self, ws):
+        async for message in ws:
+            now = time.monotonic()
+            if isinstance(message, str):
+                message_type = json.loads(message).get("type")
+                # control messages overtake queued audio, so the end of a response is only certain at the next turn
+                if message_type == "thinking":
+                    self._playout_end = None
+                    self._turn_started = self._utterance_end is not None
+                elif message_type == "stream_start" and self._turn_started:
+                    self._stream_started = True
+                continue
+            # audio still queued for the previous turn does not count for the latency of this one
+            if self._stream_started and self._utterance_end is not None:
+                self.stats.turn_latencies.append(now - self._utterance_end)
+                self._utterance_end = None
+            duration = len(message) / BOT_AUDIO_BYTES_PER_S
+            self.stats.bot_audio_s += duration
+            if self._playout_end is not None and now > self._playout_end:
+                self.stats.playback_gaps += 1
+            self._playout_end = max(now, self._playout_end or now) + duration
+
+
+async def _monitor_loop_lag(lags: List[float], interval: float = 0.1):
+    while True:
+        start = time.monotonic()
+        await asyncio.sleep(interval)
+        lags.append(max(0.0, time.monotonic() - start - interval))
+
+
+SAMPLE_RE = re.compile(r'^(\w+)(?:\{(.*)\})? (\S+)$')
+
+
+def scrape(metrics_url: str) -> Dict[tuple, float]:
+    """Samples of the server's /metrics, keyed by (name, labels)."""
+    text = urllib.request.urlopen(metrics_url, timeout=5).read().decode()
+    samples = {}
+    for line in text.splitlines():
+        match = SAMPLE_RE.match(line)
+        if match:
+            samples[(match.group(1), match.group(2) or "")] = float(match.group(3))
+    return samples
+
+
+def histogram_percentile(before: Dict[tuple, float], after: Dict[tuple, float], name: str, labels: str,
+                         percentile: float) -> Optional[float]:
+    """Percentile of the observations between two scrapes, interpolated within the bucket."""
+    prefix = f"{labels}," if labels else ""
+    buckets = []
+    for (sample, sample_labels), value in after.items():
+        if sample != f"{name}_bucket" or not sample_labels.startswith(prefix):
+            continue
+        le = sample_labels[len(prefix):]
+        if not le.startswith("le="):
+            continue
+        bound = float(le[4:-1].replace("+Inf", "inf"))
+        buckets.append((bound, value - before.get((sample, sample_labels), 0)))
+    buckets.sort()
+    if not buckets or buckets[-1][1] == 0:
+        return None
+    rank = buckets[-1][1] * percentile / 100
+    lower, lower_count = 0.0, 0.0
+    for bound, count in buckets:
+        if count >= rank:
+            if bound == float("inf"):
+                return lower
+            return lower + (bound - lower) * (rank - lower_count) / max(count - lower_count, 1e-9)
+        lower, lower_count = bound, count
+    return None
+
+
+def _ms(value: Optional[float]) -> str:
+    return "-" if value is None else f"{value * 1000:.0f} ms"
+
+
+def report(sessions: List[Session], elapsed: float, generator_lags: List[float], before: dict, after: dict):
+    latencies = np.array([latency for s in sessions for latency in s.stats.turn_latencies])
+    errors = [s.stats.error for s in sessions if s.stats.error]
+    print(f"sessions: {len(sessions)}, errors: {len(errors)}, duration: {elapsed:.0f} s")
+    for error in sorted(set(errors)):
+        print(f"  {errors.count(error)} x {error}")
+    print(f"turns with audio: {len(latencies)}, without audio: {sum(s.stats.turns_without_audio for s in sessions)}")
+    if len(latencies):
+        p50, p90, p99 = np.percentile(latencies, [50, 90, 99])
+        print(f"turn latency (end of utterance -> first bot audio): p50 {_ms(p50)}, p90 {_ms(p90)}, p99 {_ms(p99)}, max {_ms(latencies.max())}")
+    print(f"late input frames: {sum(s.stats.late_frames for s in sessions)}, "
+          f"bot audio playback gaps: {sum(s.stats.playback_gaps for s in sessions)}, "
+          f"bot audio received: {sum(s.stats.bot_audio_s for s in sessions):.0f} s")
+    if generator_lags:
+        print(f"load generator loop lag: p99 {_ms(float(np.percentile(generator_lags, 99)))}")
+    if not after:
+        return
+    for stage in ("asr_final", "llm_first_token", "tts_first_byte", "first_audio_sent", "llm_done"):
+        labels = f'stage="{stage}"'
+        values = [histogram_percentile(before, after, "fullduplex_turn_stage_seconds", labels, p) for p in (50, 90, 99)]
+        print(f"server {stage:>17}: p50 {_ms(values[0])}, p90 {_ms(values[1])}, p99 {_ms(values[2])}")
+    lag = [histogram_percentile(before, after, "fullduplex_event_loop_lag_seconds", "", p) for p in (50, 99)]
+    print(f"server event loop lag: p50 {_ms(lag[0])}, p99 {_ms(lag[1])}")
+
+    def counter(name: str) -> float:
+        return after.get((name, ""), 0) - before.get((name, ""), 0)
+
+    print(f"server pacer underruns: {counter('fullduplex_audio_underruns_total'):.0f}, "
+          f"overruns: {counter('fullduplex_audio_overruns_total'):.0f}")
+    cpu_s = counter("fullduplex_process_cpu_seconds_total")
+    print(f"server CPU: {100 * cpu_s / elapsed:.1f} % of a core, {100 * cpu_s / elapsed / len(sessions):.2f} % per session")
+
+
+async def run(args):
+    utterances = [read_wav(path) for path in args.wav]
+    metrics_url = args.metrics_url or args.url.replace("ws://", "http://").replace("wss://", "https://").rstrip("/") + "/metrics"
+    try:
+        before = await asyncio.to_thread(scrape, metrics_url)
+    except Exception as e:
+        print(f"Server metrics are not available ({e}), reporting client side numbers only")
+        before = None
+    generator_lags = []
+    lag_task = asyncio.create_task(_monitor_loop_lag(generator_lags))
+    start = time.monotonic()
+    deadline = start + args.ramp_up + args.duration
+    sessions = [Session(args.url, utterances, args.pause, deadline) for _ in range(args.sessions)]
+    tasks = []
+    for i, session in enumerate(sessions):
+        tasks.append(asyncio.create_task(session.run(offset=i)))
+        await asyncio.sleep(args.ramp_up / args.sessions)
+    await asyncio.gather(*tasks)
+    elapsed = time.monotonic() - start
+    lag_task.cancel()
+    after = await asyncio.to_thread(scrape, metrics_url) if before is not None else None
+    report(sessions, elapsed, generator_lags, before or {}, after or {})
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load generator for the full duplex WebSocket server")
+    parser.add_argument("wav", nargs="+", help="16 kHz 16 bit mono WAV files, streamed in turn by every session")
+    parser.add_argument("--url", default="ws://localhost:5000")
+    parser.add_argument("--metrics-url", help="defaults to /metrics on the WebSocket host")
+    parser.add_argument("--sessions", type=int, default=10)
+    parser.add_argument("--duration", type=float, default=60, help="seconds to stream after the ramp up")
+    parser.add_argument("--ramp-up", type=float, default=10, help="seconds over which the sessions are opened")
+    parser.add_argument("--pause", type=float, default=6, help="seconds of silence after each utterance for the answer")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,39 @@
+"""
+Runs the WebSocket server with local stand-ins for fast transcription, Azure OpenAI and TTS.
+VAD, segmentation, pacing and queueing are the real code. Run from the fullduplex folder:
+
+    python -m loadtest.stub_server --port 5000 --asr-latency-ms 300 --llm-first-token-ms 400
+"""
+import argparse
+import asyncio
+import dataclasses
+import os
+
+# the server modules check these on import, the stubs never use them
+os.environ.setdefault("SPEECH_REGION", "loadtest")
+os.environ.setdefault("SPEECH_KEY", "loadtest")
+os.environ.setdefault("AZURE_OPENAI_ENDPOINT", "https://loadtest.invalid")
+
+from loadtest.stubs import StubConfig, install  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Full duplex WebSocket server with stubbed Azure services")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=5000)
+    for field in dataclasses.fields(StubConfig):
+        parser.add_argument(f"--{field.name.replace('_', '-')}", type=field.type, default=field.default)
+    args = parser.parse_args()
+    config = StubConfig(**{field.name: getattr(args, field.name) for field in dataclasses.fields(StubConfig)})
+
+    install(config, transcription_endpoint=f"https://{os.environ['SPEECH_REGION']}.api.cognitive.microsoft.com")
+
+    from ws_server import WebSocketServer
+    server = WebSocketServer(args.host, args.port)
+    # the stub recognizer is the fast transcription one, so the real VAD runs
+    server.speech_recognizer_provider = "azure-fast-transcription"
+    asyncio.run(server.start())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,226 @@
+"""
+Local stand-ins for the Azure services used by the WebSocket server, so it can be load tested offline.
+
+The stubs replace the service calls only: VAD, segmentation, pacing and queueing run the real code.
+"""
+import asyncio
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+from types import SimpleNamespace
+from typing import AsyncIterable, AsyncIterator, Optional
+
+import numpy as np
+
+
+@dataclass
+class StubConfig:
+    # fast transcription request latency, and the text every utterance is recognized as
+    asr_latency_ms: int = 300
+    asr_text: str = "Tell me something interesting about the ocean."
+    # time to the first LLM token, then the interval between tokens
+    llm_first_token_ms: int = 400
+    llm_token_interval_ms: int = 20
+    llm_text: str = ("The ocean covers more than seventy percent of the planet. Most of it is still unexplored, "
+                     "and new species are found on almost every deep sea expedition. What would you like to know?")
+    # time to the first audio byte, and how much faster than real time audio is synthesized
+    tts_first_byte_ms: int = 150
+    tts_realtime_factor: float = 5.0
+    # spoken duration per character of text
+    tts_ms_per_char: float = 60.0
+    tts_pool_size: int = 4
+
+
+class StubTranscriptionDispatcher:
+    """Same interface as TranscriptionDispatcher, answers every request with the canned text."""
+
+    def __init__(self, config: StubConfig, max_in_flight: int = 8):
+        self.config = config
+        self.max_in_flight = max_in_flight
+        self.reserved_final = max(1, max_in_flight // 4)
+        self.skipped_speculative = 0
+        self._executor = ThreadPoolExecutor(max_workers=max_in_flight, thread_name_prefix="stub-transcription")
+        self._lock = threading.Lock()
+        self._queued = 0
+        self._in_flight = 0
+
+    @property
+    def queue_depth(self) -> int:
+        return self._queued
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    def stats(self) -> dict:
+        return {"queue_depth": self.queue_depth, "in_flight": self.in_flight,
+                "skipped_speculative": self.skipped_speculative}
+
+    def submit(self, audio: np.ndarray, definition: str, speculative: bool = False) -> Optional[Future]:
+        with self._lock:
+            if speculative and self._queued + self._in_flight >= self.max_in_flight - self.reserved_final:
+                self.skipped_speculative += 1
+                return None
+            self._queued += 1
+        return self._executor.submit(self._transcribe, len(audio))
+
+    def _transcribe(self, samples: int) -> dict:
+        with self._lock:
+            self._queued -= 1
+            self._in_flight += 1
+        try:
+            time.sleep(self.config.asr_latency_ms / 1000)
+            duration_ms = samples * 1000 // 16000
+            return {
+                "durationMilliseconds": duration_ms,
+                "combinedPhrases": [{"text": self.config.asr_text}],
+                "phrases": [{"text": self.config.asr_text, "offsetMilliseconds": 0, "durationMilliseconds": duration_ms}],
+            }
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+def _tokens(text: str) -> list:
+    # roughly what a tokenizer does with English: words with their leading space
+    words = text.split(" ")
+    return [words[0]] + [" " + word for word in words[1:]]
+
+
+class _StubStream:
+    def __init__(self, config: StubConfig):
+        self.config = config
+        self._closed = False
+
+    async def __aiter__(self):
+        for token in _tokens(self.config.llm_text):
+            if self._closed:
+                return
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=token))])
+            await asyncio.sleep(self.config.llm_token_interval_ms / 1000)
+
+    async def close(self):
+        self._closed = True
+
+
+class _StubCompletions:
+    def __init__(self, config: StubConfig):
+        self.config = config
+
+    async def create(self, stream: bool = False, **kwargs):
+        await asyncio.sleep(self.config.llm_first_token_ms / 1000)
+        if stream:
+            return _StubStream(self.config)
+        await asyncio.sleep(len(_tokens(self.config.llm_text)) * self.config.llm_token_interval_ms / 1000)
+        return _completion(self.config.llm_text)
+
+
+class _StubSyncCompletions:
+    def __init__(self, config: StubConfig):
+        self.config = config
+
+    def create(self, **kwargs):
+        time.sleep((self.config.llm_first_token_ms
+                    + len(_tokens(self.config.llm_text)) * self.config.llm_token_interval_ms) / 1000)
+        return _completion(self.config.llm_text)
+
+
+def _completion(text: str):
+    message = SimpleNamespace(role="assistant", content=text)
+    return SimpleNamespace(choices=[SimpleNamespace(message=message)])
+
+
+def stub_openai_clients(config: StubConfig):
+    """Sync and async objects with the `chat.completions.create` surface of the OpenAI clients."""
+    client = SimpleNamespace(chat=SimpleNamespace(completions=_StubSyncCompletions(config)))
+    async_client = SimpleNamespace(chat=SimpleNamespace(completions=_StubCompletions(config)))
+    return client, async_client
+
+
+class StubSynthesizerPool:
+    """Bounds concurrent stub syntheses like SynthesizerPool bounds real ones."""
+
+    def __init__(self, config: StubConfig):
+        self.config = config
+        self.size = config.tts_pool_size
+        self._semaphore = asyncio.Semaphore(self.size)
+        self._leased = 0
+
+    @property
+    def idle(self) -> int:
+        return self.size - self._leased
+
+    async def acquire(self):
+        await self._semaphore.acquire()
+        self._leased += 1
+
+    def release(self):
+        self._leased -= 1
+        self._semaphore.release()
+
+
+class StubAudioStream:
+    """Async iterator of 200 ms PCM chunks (24 kHz, 16 bit), with the close() of AsyncAudioIterator."""
+
+    chunk_bytes = 9600
+
+    def __init__(self, pool: StubSynthesizerPool, text_segments: AsyncIterable[str]):
+        self.pool = pool
+        self.config = pool.config
+        self._chunks = self._synthesize(text_segments)
+
+    def __aiter__(self) -> AsyncIterator[bytes]:
+        return self._chunks
+
+    def close(self):
+        asyncio.ensure_future(self._chunks.aclose())
+
+    async def _synthesize(self, text_segments: AsyncIterable[str]) -> AsyncIterator[bytes]:
+        await self.pool.acquire()
+        try:
+            await asyncio.sleep(self.config.tts_first_byte_ms / 1000)
+            rng = np.random.default_rng()
+            async for segment in text_segments:
+                audio_bytes = int(len(segment) * self.config.tts_ms_per_char * 48)
+                for _ in range(0, audio_bytes, self.chunk_bytes):
+                    # low level noise, so leading silence trimming does not drop it
+                    chunk = rng.integers(-2000, 2000, self.chunk_bytes // 2, dtype=np.int16).tobytes()
+                    yield chunk
+                    await asyncio.sleep(0.2 / self.config.tts_realtime_factor)
+        finally:
+            self.pool.release()
+
+
+class StubTTSClient:
+    """Same interface as azuretts.Client for the calls made by BotResponse."""
+
+    pool: StubSynthesizerPool = None
+
+    def text_to_speech_async(self, text: str, voice: str, speed: str = "medium") -> StubAudioStream:
+        return StubAudioStream(self.pool, _once(text))
+
+    async def text_stream_to_speech(self, text_segments: AsyncIterable[str], voice: str) -> StubAudioStream:
+        return StubAudioStream(self.pool, text_segments)
+
+
+async def _once(text: str) -> AsyncIterator[str]:
+    yield text
+
+
+def install(config: StubConfig, transcription_endpoint: str):
+    """Replace the process-wide clients of the server with stubs. Call before the server starts."""
+    from azuretts import set_synthesizer_pool
+    from bot_response import BotResponse
+    from fast_transcription_dispatcher import set_dispatcher
+    from oai import set_openai_clients
+
+    pool = StubSynthesizerPool(config)
+    StubTTSClient.pool = pool
+    set_synthesizer_pool(pool)
+    BotResponse.tts_client_factory = StubTTSClient
+    set_openai_clients(*stub_openai_clients(config))
+    set_dispatcher(transcription_endpoint, StubTranscriptionDispatcher(config))
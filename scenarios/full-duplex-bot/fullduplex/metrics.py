@@ -0,0 +1,179 @@
+import bisect
+import threading
+import time
+from typing import Dict, Iterator, Optional, Tuple
+
+# seconds, covers everything from ASR finals to complete LLM answers
+DEFAULT_BUCKETS = (0.05, 0.1, 0.2, 0.3, 0.5, 0.75, 1.0, 1.5, 2.0, 3.0, 5.0, 10.0, 30.0)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels: Tuple[Tuple[str, str], ...], extra: str = "") -> str:
+    parts = [f'{key}="{_escape(value)}"' for key, value in labels]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class _Metric:
+    type = ""
+
+    def __init__(self, name: str, help: str):
+        self.name = name
+        self.help = help
+        self._lock = threading.Lock()
+
+    def render(self) -> Iterator[str]:
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} {self.type}"
+        yield from self._samples()
+
+    def _samples(self) -> Iterator[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    type = "counter"
+
+    def __init__(self, name: str, help: str):
+        super().__init__(name, help)
+        self._values: Dict[tuple, float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def _samples(self):
+        with self._lock:
+            values = list(self._values.items())
+        for key, value in values:
+            yield f"{self.name}{_format_labels(key)} {value}"
+
+
+class Gauge(_Metric):
+    type = "gauge"
+
+    def __init__(self, name: str, help: str):
+        super().__init__(name, help)
+        self._values: Dict[tuple, float] = {}
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[tuple(sorted(labels.items()))] = value
+
+    def remove(self, **labels):
+        with self._lock:
+            self._values.pop(tuple(sorted(labels.items())), None)
+
+    def _samples(self):
+        with self._lock:
+            values = list(self._values.items())
+        for key, value in values:
+            yield f"{self.name}{_format_labels(key)} {value}"
+
+
+class Histogram(_Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, help: str, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        super().__init__(name, help)
+        self.buckets = tuple(sorted(buckets))
+        # per label set: count per bucket (the last one is +Inf), sum
+        self._values: Dict[tuple, list] = {}
+
+    def observe(self, value: float, **labels):
+        key = tuple(sorted(labels.items()))
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            entry[0][index] += 1
+            entry[1] += value
+
+    def _samples(self):
+        with self._lock:
+            values = [(key, list(counts), total) for key, (counts, total) in self._values.items()]
+        for key, counts, total in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = 'le="+Inf"' if bound == float("inf") else f'le="{bound}"'
+                yield f"{self.name}_bucket{_format_labels(key, le)} {cumulative}"
+            yield f"{self.name}_sum{_format_labels(key)} {total}"
+            yield f"{self.name}_count{_format_labels(key)} {cumulative}"
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text exposition format."""
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+TURN_STAGE_SECONDS = REGISTRY.register(Histogram(
+    "fullduplex_turn_stage_seconds",
+    "Time from the end of user speech (or the final recognition when unknown) until a stage of the turn is reached"))
+TURNS = REGISTRY.register(Counter("fullduplex_turns_total", "Turns started"))
+BARGE_INS = REGISTRY.register(Counter("fullduplex_barge_ins_total", "Turns interrupted by the user"))
+AUDIO_UNDERRUNS = REGISTRY.register(Counter(
+    "fullduplex_audio_underruns_total", "Times the client ran out of bot audio during a turn"))
+AUDIO_OVERRUNS = REGISTRY.register(Counter(
+    "fullduplex_audio_overruns_total", "Audio frames due while the outbound queue held more than the lead"))
+EVENT_LOOP_LAG_SECONDS = REGISTRY.register(Histogram(
+    "fullduplex_event_loop_lag_seconds", "How late a periodic timer callback ran on the event loop",
+    (0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1.0)))
+PROCESS_CPU_SECONDS = REGISTRY.register(Counter("fullduplex_process_cpu_seconds_total", "CPU time used by the process"))
+CONNECTIONS = REGISTRY.register(Gauge("fullduplex_connections", "Open WebSocket connections"))
+QUEUE_DEPTH = REGISTRY.register(Gauge("fullduplex_queue_depth", "Messages waiting in a connection queue"))
+QUEUE_DROPPED_AUDIO = REGISTRY.register(Gauge(
+    "fullduplex_queue_dropped_audio_frames", "Outbound audio frames dropped because the client read too slowly"))
+TTS_IDLE_SYNTHESIZERS = REGISTRY.register(Gauge("fullduplex_tts_idle_synthesizers", "Synthesizers not leased by a turn"))
+FAST_TRANSCRIPTION_QUEUE_DEPTH = REGISTRY.register(Gauge(
+    "fullduplex_fast_transcription_queue_depth", "Fast transcription requests submitted but not yet sent"))
+FAST_TRANSCRIPTION_IN_FLIGHT = REGISTRY.register(Gauge(
+    "fullduplex_fast_transcription_in_flight", "Fast transcription requests in flight"))
+
+
+class TurnSpan:
+    """
+    Timeline of one turn. Each stage is recorded once, the first time it is reached, and observed in
+    TURN_STAGE_SECONDS relative to the end of user speech, or to the final recognition if that is unknown.
+    Stages: speech_end, asr_final, llm_first_token, llm_done, tts_first_byte, first_audio_sent, barge_in.
+    Timestamps are time.monotonic() values.
+    """
+
+    def __init__(self, speech_end: Optional[float] = None, asr_final: Optional[float] = None):
+        asr_final = time.monotonic() if asr_final is None else asr_final
+        self.start = asr_final if speech_end is None else speech_end
+        self.marks: Dict[str, float] = {}
+        if speech_end is not None:
+            self.marks["speech_end"] = speech_end
+            self.mark("asr_final", asr_final)
+        else:
+            self.marks["asr_final"] = asr_final
+        TURNS.inc()
+
+    def mark(self, stage: str, at: Optional[float] = None):
+        if stage in self.marks:
+            return
+        at = time.monotonic() if at is None else at
+        self.marks[stage] = at
+        TURN_STAGE_SECONDS.observe(max(0.0, at - self.start), stage=stage)
+        if stage == "barge_in":
+            BARGE_INS.inc()
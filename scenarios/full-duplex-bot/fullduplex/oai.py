@@ -1,12 +1,17 @@
 import json
 import os
 import logging
+import threading
+from typing import AsyncIterator, Optional, Tuple
 
+import httpx
 from azure.identity import DefaultAzureCredential, get_bearer_token_provider
-from openai import AzureOpenAI
+from openai import AsyncAzureOpenAI, AzureOpenAI, DefaultAsyncHttpxClient, DefaultHttpxClient
 from openai.types.chat import ChatCompletionUserMessageParam
 from pydantic import BaseModel
 
+from chat_context import CHAT_SUMMARY_TOKENS, ChatContext, summary_request
+
 logger = logging.getLogger(__name__)
 token_provider = get_bearer_token_provider(DefaultAzureCredential(), "https://cognitiveservices.azure.com/.default")
 
@@ -15,37 +20,71 @@ AZURE_OPENAI_ENDPOINT = os.getenv("AZURE_OPENAI_ENDPOINT")
 if not AZURE_OPENAI_ENDPOINT:
     raise ValueError("AZURE_OPENAI_ENDPOINT must be set")
 
+PERSONALITY_PROMPT = "You are a speech chat assistant. Your personality is: The AI is engaging, informative, and empathetic. The AI is curious and is always interested in learning more about the human. The AI is calm and polite. You are great at asking questions and is a sensitive listener. You are relentlessly curious, but always polite and never probes too much. You are pretty smart but humble, and tries to keep things informal. Overall, You are pretty Zen. Though Pi might be opinionated and disagree with you, it almost never gets riled up. You are also: Relaxed, informal, chatty. Fun, and sometimes funny. Occasionally cheeky, and light-hearted. Do not use markdown format, plain text is preferred."
+
+
 class ResponseWithSpeed(BaseModel):
     read_speed: str
     content: str
 
+
+# upper bound of concurrent HTTP connections to Azure OpenAI per process, shared by all sessions
+CHAT_MAX_CONNECTIONS = int(os.getenv("CHAT_MAX_CONNECTIONS", "32"))
+
+_openai_clients: Optional[Tuple[AzureOpenAI, AsyncAzureOpenAI]] = None
+_openai_clients_lock = threading.Lock()
+
+
+def _create_openai_clients() -> Tuple[AzureOpenAI, AsyncAzureOpenAI]:
+    limits = httpx.Limits(max_connections=CHAT_MAX_CONNECTIONS, max_keepalive_connections=CHAT_MAX_CONNECTIONS)
+    if AZURE_OPENAI_KEY:
+        auth = {"api_key": AZURE_OPENAI_KEY}
+    else:
+        auth = {"azure_ad_token_provider": token_provider}
+    client = AzureOpenAI(
+        azure_endpoint=AZURE_OPENAI_ENDPOINT,
+        api_version="2024-06-01",
+        http_client=DefaultHttpxClient(limits=limits),
+        **auth,
+    )
+    async_client = AsyncAzureOpenAI(
+        azure_endpoint=AZURE_OPENAI_ENDPOINT,
+        api_version="2024-06-01",
+        http_client=DefaultAsyncHttpxClient(limits=limits),
+        **auth,
+    )
+    return client, async_client
+
+
+def get_openai_clients() -> Tuple[AzureOpenAI, AsyncAzureOpenAI]:
+    """
+    The process-wide sync and async Azure OpenAI clients, created on first use.
+    All sessions share their connection pools, so no connection is set up per turn.
+    """
+    global _openai_clients
+    with _openai_clients_lock:
+        if _openai_clients is None:
+            _openai_clients = _create_openai_clients()
+        return _openai_clients
+
+
+def set_openai_clients(client, async_client):
+    """Replace the process-wide clients, e.g. with stubs for load tests."""
+    global _openai_clients
+    with _openai_clients_lock:
+        _openai_clients = (client, async_client)
+
+
 class ChatClient:
+    """Chat history of one session, the HTTP clients are shared by the process."""
+
     def __init__(self):
-        if AZURE_OPENAI_KEY:
-            self.client = AzureOpenAI(
-                azure_endpoint=AZURE_OPENAI_ENDPOINT,
-                api_key=AZURE_OPENAI_KEY,
-                api_version="2024-06-01",
-            )
-        else:
-            self.client = AzureOpenAI(
-                azure_endpoint=AZURE_OPENAI_ENDPOINT,
-                azure_ad_token_provider=token_provider,
-                api_version="2024-06-01",
-            )
-        self.historical_messages = []
+        self.client, self.async_client = get_openai_clients()
+        self.context = ChatContext(self._summarize)
         self.model = os.getenv("AZURE_OPENAI_DEPLOYMENT", os.getenv("AZURE_OPENAI_MODEL", "gpt-4o-mini"))
 
     def chat(self, human_input: str) -> str:
-        system_prompt = [
-            "You are a speech chat assistant. Your personality is: The AI is engaging, informative, and empathetic. The AI is curious and is always interested in learning more about the human. The AI is calm and polite. You are great at asking questions and is a sensitive listener. You are relentlessly curious, but always polite and never probes too much. You are pretty smart but humble, and tries to keep things informal. Overall, You are pretty Zen. Though Pi might be opinionated and disagree with you, it almost never gets riled up. You are also: Relaxed, informal, chatty. Fun, and sometimes funny. Occasionally cheeky, and light-hearted. Do not use markdown format, plain text is preferred.",
-        ]
-
-        human_message = ChatCompletionUserMessageParam(content=human_input, role="user", name="Rob")
-        message_text = [{"role": "system", "content": "\n".join(system_prompt)}]
-        self.historical_messages.append(human_message)
-        self.historical_messages = self.historical_messages[-16:]
-        message_text += self.historical_messages
+        message_text = self._messages(human_input, PERSONALITY_PROMPT)
 
         completion = self.client.chat.completions.create(
             model=self.model,  # model = "deployment_name"
@@ -58,21 +97,82 @@ class ChatClient:
             stop=None,
         )
 
-        self.historical_messages.append(completion.choices[0].message)
+        self.context.append(completion.choices[0].message)
 
         return completion.choices[0].message.content
 
+    async def achat(self, human_input: str) -> str:
+        """Same as chat, without blocking the event loop."""
+        message_text = self._messages(human_input, PERSONALITY_PROMPT)
+
+        completion = await self.async_client.chat.completions.create(
+            model=self.model,  # model = "deployment_name"
+            messages=message_text,
+            temperature=1,
+            max_tokens=400,
+            top_p=0.95,
+            frequency_penalty=0,
+            presence_penalty=0,
+            stop=None,
+        )
+
+        self.context.append(completion.choices[0].message)
+
+        return completion.choices[0].message.content
+
+    async def achat_stream(self, human_input: str) -> AsyncIterator[str]:
+        """
+        Same as achat, but yields the completion tokens as they arrive.
+        The reply is added to the history once the stream is exhausted or closed, unless it is empty.
+        """
+        message_text = self._messages(human_input, PERSONALITY_PROMPT)
+
+        completion = await self.async_client.chat.completions.create(
+            model=self.model,  # model = "deployment_name"
+            messages=message_text,
+            temperature=1,
+            max_tokens=400,
+            top_p=0.95,
+            frequency_penalty=0,
+            presence_penalty=0,
+            stop=None,
+            stream=True,
+        )
+
+        content = []
+        try:
+            async for chunk in completion:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    content.append(chunk.choices[0].delta.content)
+                    yield chunk.choices[0].delta.content
+        finally:
+            # keep what was generated before an interruption closed the stream, nothing if it was cancelled before
+            # the first token
+            await completion.close()
+            if content:
+                self.context.append({"role": "assistant", "content": "".join(content)})
+
+    def _messages(self, human_input: str, system_prompt: str) -> list:
+        human_message = ChatCompletionUserMessageParam(content=human_input, role="user", name="Rob")
+        self.context.append(human_message)
+        return self.context.messages(system_prompt)
+
+    def _summarize(self, summary: str, evicted: list) -> str:
+        # runs on a summary thread, so the sync client is used
+        completion = self.client.chat.completions.create(
+            model=self.model,
+            messages=summary_request(summary, evicted),
+            temperature=0,
+            max_tokens=CHAT_SUMMARY_TOKENS,
+        )
+        return completion.choices[0].message.content or summary
+
     def chat_with_speed(self, human_input: str) -> ResponseWithSpeed:
         system_prompt = [
-            "You are a speech chat assistant. Your personality is: The AI is engaging, informative, and empathetic. The AI is curious and is always interested in learning more about the human. The AI is calm and polite. You are great at asking questions and is a sensitive listener. You are relentlessly curious, but always polite and never probes too much. You are pretty smart but humble, and tries to keep things informal. Overall, You are pretty Zen. Though Pi might be opinionated and disagree with you, it almost never gets riled up. You are also: Relaxed, informal, chatty. Fun, and sometimes funny. Occasionally cheeky, and light-hearted. Do not use markdown format, plain text is preferred.",
+            PERSONALITY_PROMPT,
             "You need to output the reading speed based on the user request and history, in JSON format. The read speed can be: x-slow, slow, medium, fast or x-fast. Example: {\"read_speed\": \"medium\", content: \"The capital of France is Paris.\"}",
         ]
-
-        human_message = ChatCompletionUserMessageParam(content=human_input, role="user", name="Rob")
-        message_text = [{"role": "system", "content": "\n".join(system_prompt)}]
-        self.historical_messages.append(human_message)
-        self.historical_messages = self.historical_messages[-16:]
-        message_text += self.historical_messages
+        message_text = self._messages(human_input, "\n".join(system_prompt))
 
         completion = self.client.chat.completions.create(
             model=self.model,  # model = "deployment_name"
@@ -86,7 +186,7 @@ class ChatClient:
             response_format={ "type": "json_object" },
         )
 
-        self.historical_messages.append(completion.choices[0].message)
+        self.context.append(completion.choices[0].message)
 
         content = completion.choices[0].message.content
         if not content:
@@ -0,0 +1,58 @@
+import re
+from typing import AsyncIterable, AsyncIterator, List
+
+# sentence ends, and clause ends which are only used once the segment is long enough.
+# Latin punctuation must be followed by whitespace so that e.g. "3.5" or "e.g." inside a word is not split.
+SENTENCE_END = re.compile(r"[.!?](?=\s)|[。！？\n]")
+CLAUSE_END = re.compile(r"[,;:](?=\s)|[，；：、]")
+
+
+class SentenceSegmenter:
+    """
+    Incrementally cuts a stream of LLM tokens into sentences, or clauses for long sentences,
+    so each segment can be synthesized as soon as it is complete.
+    Whitespace between segments is kept, so they can be written to a text stream as they are.
+    """
+
+    def __init__(self, min_clause_chars: int = 40):
+        self.min_clause_chars = min_clause_chars
+        self._buffer = ""
+
+    def feed(self, token: str) -> List[str]:
+        """Add a token and return the segments completed by it."""
+        self._buffer += token
+        segments = []
+        while True:
+            end = self._find_end()
+            if end is None:
+                break
+            segment = self._buffer[:end]
+            self._buffer = self._buffer[end:]
+            if segment.strip():
+                segments.append(segment)
+        return segments
+
+    def flush(self) -> List[str]:
+        """Return the remaining text once the token stream has ended."""
+        segment = self._buffer
+        self._buffer = ""
+        return [segment] if segment.strip() else []
+
+    def _find_end(self):
+        match = SENTENCE_END.search(self._buffer)
+        if match:
+            return match.end()
+        if len(self._buffer) >= self.min_clause_chars:
+            match = CLAUSE_END.search(self._buffer, self.min_clause_chars // 2)
+            if match:
+                return match.end()
+        return None
+
+
+async def segment_stream(tokens: AsyncIterable[str], min_clause_chars: int = 40) -> AsyncIterator[str]:
+    segmenter = SentenceSegmenter(min_clause_chars)
+    async for token in tokens:
+        for segment in segmenter.feed(token):
+            yield segment
+    for segment in segmenter.flush():
+        yield segment
@@ -1,10 +1,18 @@
 import asyncio
+import collections
 import logging
 import os
+import time
+from http import HTTPStatus
 
 import websockets
 
+from azuretts import get_synthesizer_pool
 from chat_server_azure import AzureChatServer
+from fast_transcription_dispatcher import dispatchers
+from metrics import (CONNECTIONS, EVENT_LOOP_LAG_SECONDS, FAST_TRANSCRIPTION_IN_FLIGHT, FAST_TRANSCRIPTION_QUEUE_DEPTH,
+                     PROCESS_CPU_SECONDS, QUEUE_DEPTH, QUEUE_DROPPED_AUDIO, REGISTRY, TTS_IDLE_SYNTHESIZERS)
+from oai import get_openai_clients
 
 logging.basicConfig(
     level=logging.INFO,
@@ -14,17 +22,106 @@ logging.basicConfig(
 
 
 class AsyncMsgQueue:
-    def __init__(self):
-        self.queue = asyncio.Queue()
-
-    async def put(self, frame):
-        await self.queue.put(frame)
+    """
+    Message queue with two bounded lanes: control messages (str) are always delivered before audio (bytes).
+    When the audio lane is full the oldest frame is dropped ("drop_oldest"), so a slow client gets fresh audio,
+    or the producer waits ("block"), e.g. for inbound audio which must not lose frames.
+    Queued audio of an interrupted turn can be discarded at once with flush(). The consumer calls task_done() once
+    the frame of the last get() is sent, which calls the `on_sent` callback the frame was put with.
+    """
+
+    def __init__(self, max_control: int = 256, max_audio: int = 200, audio_overflow: str = "drop_oldest"):
+        if audio_overflow not in ("drop_oldest", "block"):
+            raise ValueError(f"Unknown audio overflow policy: {audio_overflow}")
+        self.max_control = max_control
+        self.max_audio = max_audio
+        self.audio_overflow = audio_overflow
+        self.dropped_audio = 0
+        self._control = collections.deque()
+        # (turn_id, frame, on_sent)
+        self._audio = collections.deque()
+        self._on_sent = None
+        self._not_empty = asyncio.Event()
+        self._not_full = asyncio.Event()
+
+    async def put(self, frame, turn_id=None, audio: bool = None, on_sent=None):
+        """
+        `audio` defaults to whether the frame is binary, `turn_id` tags audio for flush(), `on_sent` is called
+        once an audio frame is sent.
+        """
+        if audio is None:
+            audio = isinstance(frame, (bytes, bytearray, memoryview))
+        if audio:
+            if len(self._audio) >= self.max_audio and self.audio_overflow == "drop_oldest":
+                dropped_turn_id, _, dropped_on_sent = self._audio.popleft()
+                self.dropped_audio += 1
+                if dropped_on_sent is not None:
+                    on_sent = self._hand_over(dropped_turn_id, dropped_on_sent, turn_id, on_sent)
+            while len(self._audio) >= self.max_audio:
+                await self._wait_not_full()
+            self._audio.append((turn_id, frame, on_sent))
+        else:
+            while len(self._control) >= self.max_control:
+                await self._wait_not_full()
+            self._control.append(frame)
+        self._not_empty.set()
+
+    def _hand_over(self, turn_id, on_sent, new_turn_id, new_on_sent):
+        """
+        Move the `on_sent` callback of a dropped frame to the next frame of its turn, the queued one or the one
+        being put, or call it now if the turn has no other frame. Returns the callback of the frame being put.
+        """
+        for index, (queued_turn_id, frame, queued_on_sent) in enumerate(self._audio):
+            if queued_turn_id == turn_id:
+                if queued_on_sent is None:
+                    self._audio[index] = (queued_turn_id, frame, on_sent)
+                    return new_on_sent
+                break
+        else:
+            if new_turn_id == turn_id and new_on_sent is None:
+                return on_sent
+        on_sent()
+        return new_on_sent
+
+    def put_nowait(self, message):
+        """Put a control message without waiting, raises asyncio.QueueFull if the control lane is full."""
+        if len(self._control) >= self.max_control:
+            raise asyncio.QueueFull
+        self._control.append(message)
+        self._not_empty.set()
 
     async def get(self):
-        return await self.queue.get()
+        while not self._control and not self._audio:
+            self._not_empty.clear()
+            await self._not_empty.wait()
+        if self._control:
+            frame = self._control.popleft()
+        else:
+            _, frame, self._on_sent = self._audio.popleft()
+        self._not_full.set()
+        return frame
+
+    def task_done(self):
+        """The frame of the last get() is sent."""
+        if self._on_sent is not None:
+            on_sent, self._on_sent = self._on_sent, None
+            on_sent()
+
+    def flush(self, turn_id=None) -> int:
+        """Discard the queued audio of `turn_id`, or all queued audio if None. Returns the number of frames dropped."""
+        size = len(self._audio)
+        if turn_id is None:
+            self._audio.clear()
+        else:
+            self._audio = collections.deque(item for item in self._audio if item[0] != turn_id)
+        return size - len(self._audio)
 
     def size(self):
-        return self.queue.qsize()
+        return len(self._control) + len(self._audio)
+
+    async def _wait_not_full(self):
+        self._not_full.clear()
+        await self._not_full.wait()
 
 
 class WebSocketServer:
@@ -35,14 +132,48 @@ class WebSocketServer:
         self.in_queue = AsyncMsgQueue()
         self.out_queue = AsyncMsgQueue()
         self.speech_recognizer_provider = os.getenv("SPEECH_RECOGNIZER_PROVIDER", "azure")
+        # connection id -> (in_queue, out_queue), for the queue depth gauges
+        self.connections = {}
+        # process CPU time already counted in PROCESS_CPU_SECONDS
+        self._cpu_seconds = 0.0
 
     async def _stats(self):
         while True:
             logging.info(
                 f"In Queue: {self.in_queue.size()}. Out Queue: {self.out_queue.size()}"
             )
+            logging.info(f"Idle synthesizers: {get_synthesizer_pool().idle}")
+            for endpoint, dispatcher in dispatchers().items():
+                logging.info(f"Fast transcription {endpoint}: {dispatcher.stats()}")
             await asyncio.sleep(5)
 
+    async def _monitor_loop_lag(self, interval: float = 0.1):
+        while True:
+            start = time.monotonic()
+            await asyncio.sleep(interval)
+            EVENT_LOOP_LAG_SECONDS.observe(max(0.0, time.monotonic() - start - interval))
+
+    def _update_gauges(self):
+        cpu_seconds = time.process_time()
+        PROCESS_CPU_SECONDS.inc(cpu_seconds - self._cpu_seconds)
+        self._cpu_seconds = cpu_seconds
+        CONNECTIONS.set(len(self.connections))
+        for connection_id, (in_queue, out_queue) in self.connections.items():
+            QUEUE_DEPTH.set(in_queue.size(), connection=connection_id, queue="in")
+            QUEUE_DEPTH.set(out_queue.size(), connection=connection_id, queue="out")
+            QUEUE_DROPPED_AUDIO.set(out_queue.dropped_audio, connection=connection_id)
+        TTS_IDLE_SYNTHESIZERS.set(get_synthesizer_pool().idle)
+        for endpoint, dispatcher in dispatchers().items():
+            FAST_TRANSCRIPTION_QUEUE_DEPTH.set(dispatcher.queue_depth, endpoint=endpoint)
+            FAST_TRANSCRIPTION_IN_FLIGHT.set(dispatcher.in_flight, endpoint=endpoint)
+
+    def _process_request(self, connection, request):
+        # plain HTTP requests for /metrics are answered before the WebSocket handshake
+        if request.path == "/metrics":
+            self._update_gauges()
+            return connection.respond(HTTPStatus.OK, REGISTRY.render())
+        return None
+
     async def _worker(self):
         while True:
             msg = await self.in_queue.get()
@@ -57,6 +188,7 @@ class WebSocketServer:
         while True:
             msg = await out_queue.get()
             await websocket.send(msg)
+            out_queue.task_done()
             await asyncio.sleep(0)
 
     async def _handler(self, websocket):
@@ -68,24 +200,37 @@ class WebSocketServer:
         )
         logging.info(f"Query Params: {query_params}")
         language = query_params.get("lang", "en-US")
-        in_queue = AsyncMsgQueue()
+        # inbound audio feeds recognition and must not be dropped, the reader waits instead
+        in_queue = AsyncMsgQueue(audio_overflow="block")
         out_queue = AsyncMsgQueue()
         read_task = asyncio.create_task(self._reader_handler(in_queue, websocket))
         write_task = asyncio.create_task(self._writer_handler(out_queue, websocket))
         server = AzureChatServer(in_queue, out_queue, language, provider=self.speech_recognizer_provider)
         server_task = asyncio.create_task(server.worker())
-        done, pending = await asyncio.wait(
-            [read_task, write_task, server_task],
-            return_when=asyncio.FIRST_COMPLETED,
-        )
-        for task in pending:
-            task.cancel()
+        connection_id = str(websocket.id)
+        self.connections[connection_id] = (in_queue, out_queue)
+        try:
+            done, pending = await asyncio.wait(
+                [read_task, write_task, server_task],
+                return_when=asyncio.FIRST_COMPLETED,
+            )
+            for task in pending:
+                task.cancel()
+        finally:
+            del self.connections[connection_id]
+            QUEUE_DEPTH.remove(connection=connection_id, queue="in")
+            QUEUE_DEPTH.remove(connection=connection_id, queue="out")
+            QUEUE_DROPPED_AUDIO.remove(connection=connection_id)
         logging.info("WebSocket connection closed")
 
     async def start(self):
+        # connect the shared clients before the first session, instead of in its first turn
+        await asyncio.to_thread(get_openai_clients)
+        await asyncio.to_thread(get_synthesizer_pool)
         asyncio.create_task(self._stats())
+        asyncio.create_task(self._monitor_loop_lag())
         # asyncio.create_task(self._worker())
-        async with websockets.serve(self._handler, self.host, self.port):
+        async with websockets.serve(self._handler, self.host, self.port, process_request=self._process_request):
             print(f"WebSocket Server started at ws://{self.host}:{self.port}")
             await asyncio.Future()  # run forever
 